@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from sys import version
+from sys import version_info
 
 from mitorrent import mitorrent as program
 
-if version < '3.2':
-    print('Requires Python 3.2 or newer.')
+if version_info < (3, 8):
+    print('Requires Python 3.8 or newer.')
     exit(1)
 
 if __name__ == '__main__':
@@ -1 +1,6 @@
 # -*- coding: utf-8 -*-
+
+from mitorrent.aio import AsyncCreator  # noqa: F401
+from mitorrent.api import (create_torrent,  # noqa: F401
+                           create_torrent_from_stream)
+from mitorrent.metainfo import EmptyPayload, PayloadError  # noqa: F401
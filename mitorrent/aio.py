@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool, cpu_count
+import asyncio
+import threading
+
+from mitorrent import api
+from mitorrent import progress
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancellableProgress(progress.Progress):
+    # stops the creating thread once cancelled is set: at the next entry
+    # while scanning, the next file while looking up the caches and the
+    # next piece while hashing
+    def __init__(self, cancelled, **kwargs):
+        super().__init__(**kwargs)
+        self.cancelled = cancelled
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise Cancelled
+
+    def start(self, stats, piece_length, piece_total, total):
+        self.check()
+        super().start(stats, piece_length, piece_total, total)
+
+    def update(self, pieces):
+        self.check()
+        super().update(pieces)
+
+
+class AsyncCreator:
+    # creates torrents from a running event loop: scanning and feeding the
+    # pieces happens on executor threads, hashing on one shared process
+    # pool, and at most jobs torrents are created at the same time
+    def __init__(self, jobs=2, workers=None, pool=None, executor=None,
+                 interval=progress.PROGRESS_INTERVAL):
+        self.jobs = jobs
+        self.workers = workers or cpu_count()
+        self.interval = interval
+        self._pool = pool
+        self._own_pool = pool is None
+        self._executor = executor
+        self._own_executor = executor is None
+        # made on first use so it belongs to the running loop
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        # joining the pool waits for its workers, not on the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        if self._own_pool and self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def create(self, path, on_progress=None, **options):
+        # MetaDictionary of path, see api.create_torrent for the options;
+        # on_progress is called in the loop with every progress report.
+        # Cancelling the task stops the hashing and waits for the thread.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.jobs)
+        async with self._semaphore:
+            if self._pool is None:
+                self._pool = Pool(self.workers)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.jobs)
+            callback = None
+            if on_progress:
+                callback = partial(loop.call_soon_threadsafe, on_progress)
+            cancelled = threading.Event()
+            build = loop.run_in_executor(
+                self._executor,
+                lambda: api.create_torrent(
+                    path, pool=self._pool, workers=self.workers,
+                    progress=CancellableProgress(
+                        cancelled, name=path, callback=callback,
+                        interval=self.interval),
+                    **options))
+            try:
+                return await asyncio.shield(build)
+            except asyncio.CancelledError:
+                cancelled.set()
+                # the slot is only given back once the thread is done
+                await asyncio.wait([build])
+                if not build.cancelled():
+                    build.exception()
+                raise
+
+    async def events(self, path, **options):
+        # ('progress', report) while hashing, then ('done', MetaDictionary)
+        queue = asyncio.Queue()
+        build = asyncio.ensure_future(
+            self.create(path, on_progress=queue.put_nowait, **options))
+        # reports are queued before the build finishes, None marks its end
+        build.add_done_callback(lambda build: queue.put_nowait(None))
+        try:
+            report = await queue.get()
+            while report is not None:
+                yield 'progress', report
+                report = await queue.get()
+            yield 'done', build.result()
+        finally:
+            if not build.done():
+                build.cancel()
+                await asyncio.wait([build])
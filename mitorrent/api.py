@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from mitorrent import files
+from mitorrent import metainfo
+from mitorrent import pieces
+
+
+def new_meta_dictionary(announces=None, comment=None, created_by=None,
+                        creation_date=None, nodes=None, website=None):
+    meta_dict = metainfo.MetaDictionary()
+    for announce in announces or ():
+        meta_dict.add_announce(str(announce))
+    if comment:
+        meta_dict.comment = str(comment)
+    if created_by:
+        meta_dict.created_by = str(created_by)
+    if creation_date:
+        meta_dict.creation_date = int(creation_date)
+    for node in nodes or ():
+        meta_dict.add_node(str(node))
+    if website:
+        meta_dict.website = str(website)
+    return meta_dict
+
+
+def create_torrent(path,
+                   announces=None,
+                   comment=None,
+                   created_by=None,
+                   creation_date=None,
+                   nodes=None,
+                   website=None,
+                   private=None,
+                   name=None,
+                   max_piece_length=None,
+                   include_dotfiles=False,
+                   versions=(1,),
+                   workers=None,
+                   pool=None,
+                   use_mmap=False,
+                   queue_depth=pieces.QUEUE_DEPTH,
+                   cache_dir=None,
+                   scan_threads=1,
+                   checkpoint_path=None,
+                   resume=False,
+                   progress=None,
+                   on_skip=None,
+                   target_size=None,
+                   probe=False,
+                   pad=False,
+                   dedup_dir=None):
+    # MetaDictionary of the payload at path, without printing or exiting:
+    # unusable payloads raise metainfo.PayloadError and entries left out
+    # of a directory go to on_skip(relpath, reason), if given. With a pool
+    # every piece is hashed on it, no reader process is started per
+    # torrent.
+    # With a target_size in bytes the piece length is planned to keep the
+    # torrent file about that small, see planner.plan_piece_length.
+    meta_dict = new_meta_dictionary(announces, comment, created_by,
+                                    creation_date, nodes, website)
+    meta_dict.info = metainfo.InfoDictionary(
+        path,
+        max_piece_length=max_piece_length,
+        include_dotfiles=include_dotfiles,
+        workers=workers,
+        use_mmap=use_mmap,
+        queue_depth=queue_depth,
+        cache_dir=cache_dir,
+        versions=versions,
+        pool=pool,
+        scan_threads=scan_threads,
+        checkpoint_path=checkpoint_path,
+        resume=resume,
+        progress=progress,
+        on_skip=on_skip,
+        target_size=target_size,
+        probe=probe,
+        pad=pad,
+        dedup_dir=dedup_dir)
+    meta_dict.info.name = name or files.file_name_from_path(
+        files.check_basename_path(path))
+    meta_dict.info.private = private
+    return meta_dict
+
+
+def create_torrent_from_stream(stream,
+                               name,
+                               announces=None,
+                               comment=None,
+                               created_by=None,
+                               creation_date=None,
+                               nodes=None,
+                               website=None,
+                               private=None,
+                               size_hint=None,
+                               tee=None,
+                               max_piece_length=None,
+                               versions=(1,),
+                               queue_depth=pieces.QUEUE_DEPTH,
+                               progress=None):
+    # single file torrent named name of everything read from a binary
+    # stream, hashed while it arrives; tee is a binary file getting a copy
+    # of the data. size_hint is the expected length, for the piece length.
+    meta_dict = new_meta_dictionary(announces, comment, created_by,
+                                    creation_date, nodes, website)
+    meta_dict.info = metainfo.InfoDictionary(
+        name,
+        max_piece_length=max_piece_length,
+        queue_depth=queue_depth,
+        versions=versions,
+        progress=progress,
+        stream=stream,
+        size_hint=size_hint,
+        tee=tee)
+    meta_dict.info.name = name
+    meta_dict.info.private = private
+    return meta_dict
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import Pool, cpu_count, freeze_support
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from mitorrent import files
+from mitorrent import metainfo
+from mitorrent import mitorrent
+from mitorrent import pieces
+
+PAYLOAD_SHAPES = ('huge', 'tiny', 'deep', 'mixed')
+STAGES = ('scan', 'read', 'hash', 'encode')
+# size of the random block the payload files are cut from
+BLOCK_LENGTH = 1024 * 1024
+
+
+def payload_sizes(shape, total):
+    # (directory components, length) of the files of a synthetic payload
+    # holding about total bytes
+    if shape == 'huge':
+        return [([], total)]
+    if shape == 'tiny':
+        length = 4096
+        return [([str(num // 1000)], length)
+                for num in range(max(1, total // length))]
+    if shape == 'deep':
+        length = 64 * 1024
+        return [(['d{0}'.format(level) for level in range(num % 32)],
+                 length)
+                for num in range(max(1, total // length))]
+    if shape == 'mixed':
+        # one file per power of two from 1 KiB, repeated to fill total
+        sizes = []
+        length = 1024
+        while sum(sizes) < total:
+            sizes.append(length)
+            length = length * 2
+            if sum(sizes) + length > total:
+                length = 1024
+        return [([str(num % 10)], length) for num, length in enumerate(sizes)]
+    raise ValueError('Unknown payload shape: {0}'.format(shape))
+
+
+def make_payload(shape, total, base_dir):
+    payload = os.path.join(base_dir, shape)
+    block = os.urandom(BLOCK_LENGTH)
+    for num, (components, length) in enumerate(payload_sizes(shape, total)):
+        directory = os.path.join(payload, *components)
+        os.makedirs(directory, exist_ok=True)
+        # every file starts elsewhere in the block so they all differ
+        start = (num * 4099) % BLOCK_LENGTH
+        with open(os.path.join(directory, 'f{0}'.format(num)),
+                  'wb') as payload_file:
+            remaining = length
+            while remaining > 0:
+                chunk = block[start:start + remaining]
+                payload_file.write(chunk)
+                remaining = remaining - len(chunk)
+                start = 0
+    return payload
+
+
+def traced_peak(function):
+    # bytes allocated by Python at the peak of one run, counted from the
+    # start of the run; memory of worker processes is not seen
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def timed(function, repeat):
+    # best wall-clock time of repeat runs, the peak memory of one more
+    # run, traced apart as tracing slows it down, and the last result
+    best = None
+    for run in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - started
+        if best is None or seconds < best:
+            best = seconds
+    return best, traced_peak(function), result
+
+
+def read_payload(file_table, piece_length):
+    reader = pieces.PiecesReader(file_table, piece_length)
+    buffer = bytearray(piece_length)
+    total = 0
+    bytes_read = reader.readinto(buffer)
+    while bytes_read:
+        total = total + bytes_read
+        bytes_read = reader.readinto(buffer)
+    return total
+
+
+def hash_payload(file_table, piece_length, workers, pool):
+    hasher = pieces.PiecesHasher(file_table, piece_length, workers=workers,
+                                 pool=pool)
+    return sum(1 for digest in hasher)
+
+
+def encode_payload(payload, workers):
+    meta_dict = metainfo.MetaDictionary()
+    meta_dict.info = metainfo.InfoDictionary(payload, workers=workers)
+    meta_dict.info.name = os.path.basename(payload)
+
+    def encode():
+        # the encoded info dictionary is kept, every run starts over
+        meta_dict.info.invalidate()
+        return meta_dict.dump(io.BytesIO())
+    return encode
+
+
+def run_benchmarks(shapes=PAYLOAD_SHAPES, total=64 * 1024 * 1024,
+                   piece_lengths=(256 * 1024,), worker_counts=(1,),
+                   stages=STAGES, repeat=1, base_dir=None):
+    # list of result dictionaries, one per payload, stage and setting;
+    # files are read from the page cache after the first stage
+    results = []
+    temp_dir = tempfile.mkdtemp(prefix='mitorrent-bench-', dir=base_dir)
+    try:
+        for shape in shapes:
+            payload = make_payload(shape, total, temp_dir)
+            scanner = files.DirectoryScanner(payload)
+            file_table = scanner.scan()
+            length = file_table.total_length()
+
+            def add_result(stage, seconds, peak, processed, unit,
+                           **settings):
+                # processed is the number of units (bytes or files) the
+                # stage went through
+                result = {'payload': shape,
+                          'stage': stage,
+                          'files': len(file_table),
+                          'bytes': length,
+                          'seconds': seconds,
+                          unit + ' per second': (processed / seconds
+                                                 if seconds else None),
+                          'peak memory': peak}
+                result.update(settings)
+                results.append(result)
+
+            if 'scan' in stages:
+                seconds, peak, file_table = timed(scanner.scan, repeat)
+                add_result('scan', seconds, peak, len(file_table), 'files')
+            for piece_length in piece_lengths:
+                if 'read' in stages:
+                    seconds, peak, bytes_read = timed(
+                        lambda: read_payload(file_table, piece_length),
+                        repeat)
+                    add_result('read', seconds, peak, bytes_read, 'bytes',
+                               **{'piece length': piece_length})
+                if 'hash' not in stages:
+                    continue
+                for workers in worker_counts:
+                    # a pool per setting, created outside the timing
+                    pool = None
+                    if workers > 1:
+                        pool = Pool(workers)
+                    try:
+                        seconds, peak, piece_total = timed(
+                            lambda: hash_payload(file_table, piece_length,
+                                                 workers, pool),
+                            repeat)
+                    finally:
+                        if pool is not None:
+                            pool.terminate()
+                            pool.join()
+                    add_result('hash', seconds, peak, length, 'bytes', **{
+                        'piece length': piece_length,
+                        'workers': workers,
+                        'pieces': piece_total})
+            if 'encode' in stages:
+                seconds, peak, encoded = timed(
+                    encode_payload(payload, max(worker_counts)), repeat)
+                add_result('encode', seconds, peak, encoded,
+                           'metainfo bytes', **{'metainfo bytes': encoded})
+            shutil.rmtree(payload)
+    finally:
+        shutil.rmtree(temp_dir)
+    return results
+
+
+def parse_user_arguments():
+    user_arguments = argparse.ArgumentParser(
+        prog='python -m mitorrent.bench',
+        description='Time the directory scan, raw read, hashing and \
+            bencoding stages on synthetic payloads and print the results \
+            as JSON. Files are written to and read back from a temporary \
+            directory, so the reads mostly come from the page cache. The \
+            peak memory of a stage is taken from one more run under \
+            tracemalloc and leaves out the hashing workers.')
+    user_arguments.add_argument('--payload',
+                                action='append',
+                                dest='shapes',
+                                choices=PAYLOAD_SHAPES,
+                                help='Payload shape to benchmark: one huge \
+                                    file, many tiny files, a deep tree or \
+                                    mixed sizes. Can be used multiple \
+                                    times. Default is all of them.')
+    user_arguments.add_argument('--size',
+                                metavar='MIB',
+                                type=mitorrent.test_workers,
+                                default=64,
+                                help='Approximate size of each payload in \
+                                    MiB. Default is 64.')
+    user_arguments.add_argument('-l', '--piece-length',
+                                action='append',
+                                dest='piece_lengths',
+                                metavar='INT',
+                                type=mitorrent.test_max_piece_length,
+                                help='Piece length to benchmark. Can be \
+                                    used multiple times. Default is 256 KiB.')
+    user_arguments.add_argument('-j', '--workers',
+                                action='append',
+                                dest='worker_counts',
+                                metavar='INT',
+                                type=mitorrent.test_workers,
+                                help='Number of hashing workers to \
+                                    benchmark. Can be used multiple times. \
+                                    Default is 1 and the number of CPUs.')
+    user_arguments.add_argument('--stage',
+                                action='append',
+                                dest='stages',
+                                choices=STAGES,
+                                help='Stage to benchmark. Can be used \
+                                    multiple times. Default is all of them.')
+    user_arguments.add_argument('--repeat',
+                                metavar='INT',
+                                type=mitorrent.test_workers,
+                                default=1,
+                                help='Report the best of this many runs.')
+    user_arguments.add_argument('--dir',
+                                metavar='DIR',
+                                dest='base_dir',
+                                help='Create the payloads in this \
+                                    directory, to benchmark its storage.')
+    return user_arguments.parse_args()
+
+
+def main():
+    user_arguments = parse_user_arguments()
+    worker_counts = user_arguments.worker_counts or sorted({1, cpu_count()})
+    results = run_benchmarks(
+        shapes=user_arguments.shapes or PAYLOAD_SHAPES,
+        total=user_arguments.size * 1024 * 1024,
+        piece_lengths=user_arguments.piece_lengths or (256 * 1024,),
+        worker_counts=worker_counts,
+        stages=user_arguments.stages or STAGES,
+        repeat=user_arguments.repeat,
+        base_dir=user_arguments.base_dir)
+    print(json.dumps({
+        'version': mitorrent.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': cpu_count(),
+        'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    freeze_support()
+    main()
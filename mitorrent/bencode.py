@@ -1,8 +1,163 @@
 # -*- coding: utf-8 -*-
 
+from functools import partial
+from itertools import chain
+from types import GeneratorType
+import io
+import mmap
+import re
+
+# bytes collected before dump() writes them out
+DUMP_CHUNK_LENGTH = 64 * 1024
+# decoded byte strings this long are views into the input, not copies
+LAZY_BYTES_LENGTH = 1024
+
+INTEGER = re.compile(b'0|-?[1-9][0-9]*')
+LENGTH = re.compile(b'0|[1-9][0-9]*')
+
+
+class BencodeError(ValueError):
+    pass
+
+
+class Bencoded:
+    # an item encoded already, written out as it is; holds the bytes
+    # instead of being a copy of them
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
 
 def bencode(item):
-    return methods[type(item)](item)
+    # written out chunk by chunk, the tokens are never all alive at once
+    output = io.BytesIO()
+    dump(item, output)
+    return output.getvalue()
+
+
+def iterbencode(item):
+    # walks nested containers with an explicit stack and yields each token
+    # as soon as it is encoded, so no subtree is ever copied
+    stack = [iter((item,))]
+    while stack:
+        for item in stack[-1]:
+            kind = type(item)
+            if kind in containers:
+                prefix, items = containers[kind]
+                yield prefix
+                stack.append(items(item))
+                break
+            yield methods[kind](item)
+        else:
+            stack.pop()
+            if stack:
+                yield b'e'
+
+
+def dump(item, fileobj):
+    written = 0
+    chunk = bytearray()
+    for token in iterbencode(item):
+        if len(token) >= DUMP_CHUNK_LENGTH:
+            # large byte strings and Bencoded items are not copied
+            fileobj.write(chunk)
+            fileobj.write(token)
+            written = written + len(chunk) + len(token)
+            chunk.clear()
+            continue
+        chunk.extend(token)
+        if len(chunk) >= DUMP_CHUNK_LENGTH:
+            fileobj.write(chunk)
+            written = written + len(chunk)
+            chunk.clear()
+    fileobj.write(chunk)
+    return written + len(chunk)
+
+
+def decode(data, lazy_length=LAZY_BYTES_LENGTH):
+    # iterative so that nesting depth is not bound by the recursion limit;
+    # dictionary keys are returned as str and byte strings as bytes, or as
+    # memoryview slices of data when they are at least lazy_length long
+    view = memoryview(data).cast('B')
+    if isinstance(data, (bytes, bytearray, mmap.mmap)):
+        find = data.find
+    else:
+        find = partial(__find, view)
+    end = len(view)
+    stack = []
+    keys = []
+    pos = 0
+    while True:
+        if pos >= end:
+            raise BencodeError('Unexpected end of data')
+        token = view[pos]
+        if token == 0x64 or token == 0x6c:  # d, l
+            stack.append({} if token == 0x64 else [])
+            keys.append(None)
+            pos = pos + 1
+            continue
+        elif token == 0x65:  # e
+            if not stack or keys[-1] is not None:
+                raise BencodeError('Unexpected end at {0}'.format(pos))
+            item = stack.pop()
+            keys.pop()
+            pos = pos + 1
+        elif token == 0x69:  # i
+            stop = find(b'e', pos + 1)
+            if stop < 0 or not INTEGER.fullmatch(view[pos + 1:stop]):
+                raise BencodeError('Invalid integer at {0}'.format(pos))
+            item = int(bytes(view[pos + 1:stop]))
+            pos = stop + 1
+        elif 0x30 <= token <= 0x39:  # 0-9
+            colon = find(b':', pos)
+            if colon < 0 or not LENGTH.fullmatch(view[pos:colon]):
+                raise BencodeError('Invalid length at {0}'.format(pos))
+            start = colon + 1
+            pos = start + int(bytes(view[pos:colon]))
+            if pos > end:
+                raise BencodeError('Unexpected end of data')
+            item = view[start:pos]
+            if len(item) < lazy_length:
+                item = bytes(item)
+        else:
+            raise BencodeError('Invalid token at {0}'.format(pos))
+
+        if not stack:
+            if pos != end:
+                raise BencodeError('Trailing data at {0}'.format(pos))
+            return item
+        parent = stack[-1]
+        if isinstance(parent, list):
+            parent.append(item)
+        elif keys[-1] is None:
+            if not isinstance(item, (bytes, memoryview)):
+                raise BencodeError('Invalid key at {0}'.format(pos))
+            item = bytes(item)
+            try:
+                keys[-1] = item.decode('UTF-8')
+            except UnicodeDecodeError:
+                keys[-1] = item
+        else:
+            parent[keys[-1]] = item
+            keys[-1] = None
+
+
+def __find(view, sub, pos):
+    # memoryview has no find(), but only short prefixes are searched
+    for stop in range(pos, len(view)):
+        if view[stop] == sub[0]:
+            return stop
+    return -1
+
+
+def load(fileobj, lazy_length=LAZY_BYTES_LENGTH):
+    # maps the file when possible so large strings are never read in
+    try:
+        data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (io.UnsupportedOperation, OSError, ValueError):
+        data = fileobj.read()
+    return decode(data, lazy_length=lazy_length)
 
 
 def bencode_bytes(bytes):
@@ -11,15 +166,7 @@ def bencode_bytes(bytes):
 
 
 def bencode_dict(dictionary):
-    data = bytearray()
-    for key in sorted(dictionary.keys()):
-        value = dictionary[key]
-        if value is None:
-            continue
-        data.extend(bencode(key))
-        data.extend(bencode(dictionary[key]))
-    data = b'd' + data + b'e'
-    return data
+    return bencode(dictionary)
 
 
 def bencode_int(integer):
@@ -28,11 +175,7 @@ def bencode_int(integer):
 
 
 def bencode_list(list):
-    data = bytearray()
-    for item in list:
-        data.extend(bencode(item))
-    data = b'l' + data + b'e'
-    return data
+    return bencode(list)
 
 
 def bencode_str(string):
@@ -41,17 +184,38 @@ def bencode_str(string):
     return data
 
 
+def __bencoded(item):
+    return item.data
+
+
 def __bencode_bool(boolean):
     return bencode_int(int(boolean))
 
 
+def __dict_items(dictionary):
+    return chain.from_iterable(
+        (key, dictionary[key]) for key in sorted(dictionary.keys())
+        if dictionary[key] is not None)
+
+
+containers = {
+    dict: (b'd', __dict_items),
+    # generators are consumed once, as the list is written
+    GeneratorType: (b'l', iter),
+    list: (b'l', iter),
+    tuple: (b'l', iter)
+}
+
 methods = {
+    Bencoded: __bencoded,
     bool: __bencode_bool,
     bytes: bencode_bytes,
     bytearray: bencode_bytes,
     dict: bencode_dict,
+    GeneratorType: bencode_list,
     int: bencode_int,
     list: bencode_list,
+    memoryview: bencode_bytes,
     tuple: bencode_list,
     str: bencode_str
 }
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+
+from mitorrent import pieces
+from mitorrent import storage
+
+CACHE_NAME = 'mitorrent-cache.sqlite3'
+
+
+def file_pieces(offset, length, piece_length, padded=False):
+    # [first, stop) range of the full pieces lying inside one file; their
+    # digests only depend on its contents and its offset alignment. A
+    # padded file's last piece is its tail and zeros, so it counts too.
+    first = pieces.piece_count(offset, piece_length)
+    if padded:
+        stop = pieces.piece_count(offset + length, piece_length)
+    else:
+        stop = (offset + length) // piece_length
+    return first, max(first, stop)
+
+
+class PieceCache:
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, CACHE_NAME))
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS pieces ('
+            'path TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, '
+            'inode INTEGER NOT NULL, '
+            'piece_length INTEGER NOT NULL, '
+            'alignment INTEGER NOT NULL, '
+            'digests BLOB NOT NULL, '
+            'PRIMARY KEY (path, piece_length, alignment))')
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def file_key(self, path, length, offset, piece_length, stat=None):
+        # stat is the (size, mtime_ns, inode) of the file when the scan
+        # already collected them
+        if stat is None:
+            try:
+                info = storage.stat_path(path)
+            except OSError:
+                return None
+            stat = (info.st_size, info.st_mtime_ns, info.st_ino)
+        if stat[0] != length:
+            return None
+        return (storage.absolute(path),) + tuple(stat) + (
+            piece_length, offset % piece_length)
+
+    def lookup(self, key):
+        row = self.db.execute(
+            'SELECT digests FROM pieces WHERE path = ? AND size = ? AND '
+            'mtime_ns = ? AND inode = ? AND piece_length = ? AND '
+            'alignment = ?', key).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def fill(self, files_list, piece_length, pieces_hash, stats=None,
+             check=None):
+        # copies cached digests into pieces_hash; returns the piece ranges
+        # still to be hashed and the files to store once they are. check
+        # is called for every file and raises to stop.
+        missing = []
+        stale = []
+        next_piece = 0
+        offset = 0
+        for num, (path, length) in enumerate(files_list):
+            if path is None:
+                # BEP-47 padding, zeros that are never read
+                offset = offset + length
+                continue
+            if check:
+                check()
+            padded = (num + 1 < len(files_list) and
+                      files_list[num + 1][0] is None)
+            first, stop = file_pieces(offset, length, piece_length,
+                                      padded=padded)
+            offset = offset + length
+            if stop == first:
+                continue
+            key = self.file_key(path, length, offset - length, piece_length,
+                                stat=(stats or {}).get(path))
+            if key is None:
+                continue
+            digests = self.lookup(key)
+            if digests is None or len(digests) != 20 * (stop - first):
+                stale.append((key, first, stop))
+                continue
+            pieces_hash[20 * first:20 * stop] = digests
+            if first > next_piece:
+                missing.append((next_piece, first))
+            next_piece = stop
+        piece_total = pieces.piece_count(offset, piece_length)
+        if next_piece < piece_total:
+            missing.append((next_piece, piece_total))
+        return missing, stale
+
+    def store(self, stale, pieces_hash):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO pieces (path, size, mtime_ns, inode, '
+            'piece_length, alignment, digests) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [key + (bytes(pieces_hash[20 * first:20 * stop]),)
+             for key, first, stop in stale])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import time
+
+from mitorrent import bencode
+
+# seconds between two writes of the checkpoint while hashing
+CHECKPOINT_INTERVAL = 30
+
+
+def fingerprint(file_stats, piece_length, versions, padded=False):
+    # (path, length, mtime_ns, inode) of every file; changes whenever a
+    # file is added, removed, resized or touched
+    digest = hashlib.sha256()
+    digest.update(bencode.bencode([piece_length, list(versions),
+                                   int(padded)]))
+    for entry in file_stats:
+        digest.update(bencode.bencode(list(entry)))
+    return digest.digest()
+
+
+class Checkpoint:
+    # digests of the first completed pieces of a payload, in a bencoded
+    # file that is replaced atomically on every save
+    def __init__(self, path, fingerprint, piece_length):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.piece_length = piece_length
+        self.saved_at = time.monotonic()
+
+    def load(self):
+        # (completed pieces, SHA-1 digests, v2 piece roots) or None when
+        # there is no checkpoint for this payload
+        try:
+            with open(self.path, 'rb') as checkpoint_file:
+                state = bencode.decode(checkpoint_file.read())
+            if (bytes(state['fingerprint']) != self.fingerprint or
+                    state['piece length'] != self.piece_length):
+                return None
+            completed = state['completed']
+            digests = bytes(state['pieces'])
+            roots = bytes(state['roots'])
+        except (OSError, KeyError, TypeError, bencode.BencodeError):
+            return None
+        if not isinstance(completed, int) or completed < 0:
+            return None
+        if len(digests) not in (0, 20 * completed):
+            return None
+        if len(roots) not in (0, 32 * completed):
+            return None
+        return completed, digests, roots
+
+    def save(self, completed, pieces_hash=None, piece_roots=None):
+        digests = b''
+        if pieces_hash is not None:
+            digests = bytes(pieces_hash[:20 * completed])
+        roots = b''
+        if piece_roots is not None:
+            roots = b''.join(piece_roots[:completed])
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as checkpoint_file:
+            bencode.dump({
+                'completed': completed,
+                'fingerprint': self.fingerprint,
+                'piece length': self.piece_length,
+                'pieces': digests,
+                'roots': roots}, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.path)
+        self.saved_at = time.monotonic()
+
+    def due(self):
+        return time.monotonic() - self.saved_at >= CHECKPOINT_INTERVAL
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
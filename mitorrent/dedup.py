@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import sqlite3
+
+from mitorrent import cache
+from mitorrent import pieces
+from mitorrent import storage
+
+STORE_NAME = 'mitorrent-content.sqlite3'
+# smaller files are cheaper to hash than to look up
+MIN_FILE_LENGTH = 4 * 1024 * 1024
+# blocks read from a file to recognise it before reading all of it
+SAMPLE_COUNT = 8
+SAMPLE_LENGTH = 64 * 1024
+
+
+def sample_digest(path, length):
+    # BLAKE2b of the length and SAMPLE_COUNT blocks spread evenly over
+    # the file, the first and last ones included
+    digest = hashlib.blake2b(str(length).encode('ascii'), digest_size=16)
+    last = max(0, length - SAMPLE_LENGTH)
+    for num in range(SAMPLE_COUNT):
+        start = last * num // (SAMPLE_COUNT - 1)
+        with storage.open_file(path, start,
+                               start + SAMPLE_LENGTH) as payload_file:
+            digest.update(payload_file.read(SAMPLE_LENGTH))
+    return digest.digest()
+
+
+def join_digests(length, contents):
+    # BLAKE2b of the file length and the pieces.hash_content_piece digests
+    # of its pieces, which the hashing pass collects without another read
+    digest = hashlib.blake2b(str(length).encode('ascii'))
+    digest.update(contents)
+    return digest.digest()
+
+
+def content_digest(path, length, piece_length, piece_total, check=None):
+    # join_digests of the first piece_total pieces of a file read from
+    # disk, confirming a sample match; a short last piece is padded with
+    # zeros like in the payload. check is called for every piece.
+    contents = bytearray()
+    view = memoryview(bytearray(piece_length))
+    with storage.open_file(path) as payload_file:
+        for num in range(piece_total):
+            if check:
+                check()
+            read = pieces.read_full(payload_file, view)
+            view[read:] = bytes(piece_length - read)
+            contents.extend(pieces.hash_content_piece(view))
+    return join_digests(length, contents)
+
+
+def remove_ranges(ranges, done):
+    # piece ranges left of the sorted [first, stop) ranges once the sorted
+    # done ranges are taken out
+    left = []
+    done = iter(done)
+    skip = next(done, None)
+    for first, stop in ranges:
+        while skip is not None and first < stop:
+            if skip[1] <= first:
+                skip = next(done, None)
+                continue
+            if skip[0] >= stop:
+                break
+            if skip[0] > first:
+                left.append((first, skip[0]))
+            first = max(first, skip[1])
+        if first < stop:
+            left.append((first, stop))
+    return left
+
+
+class ContentStore:
+    # piece digests of files by content instead of by path, so a file
+    # copied into another payload is not hashed again. Only files starting
+    # on a piece boundary qualify: their pieces do not depend on the rest
+    # of the payload.
+    def __init__(self, store_dir, min_length=MIN_FILE_LENGTH):
+        self.min_length = min_length
+        os.makedirs(store_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(store_dir, STORE_NAME))
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS contents ('
+            'size INTEGER NOT NULL, '
+            'digest BLOB NOT NULL, '
+            'sample BLOB NOT NULL, '
+            'piece_length INTEGER NOT NULL, '
+            'digests BLOB, '
+            'roots BLOB, '
+            'PRIMARY KEY (size, digest, piece_length))')
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS contents_sample '
+            'ON contents (size, sample, piece_length)')
+        # content digests of files already read or hashed, until they change
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS confirmed ('
+            'path TEXT NOT NULL, '
+            'piece_length INTEGER NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, '
+            'inode INTEGER NOT NULL, '
+            'digest BLOB NOT NULL, '
+            'sample BLOB NOT NULL, '
+            'PRIMARY KEY (path, piece_length))')
+        self.reused = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def confirmed(self, path, stat, piece_length):
+        # (digest, sample) of a file that did not change since it was read
+        row = self.db.execute(
+            'SELECT digest, sample FROM confirmed WHERE path = ? AND '
+            'piece_length = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+            (storage.absolute(path), piece_length) + tuple(stat)).fetchone()
+        return row and (row[0], row[1])
+
+    def confirm(self, path, stat, piece_length, digest, sample):
+        self.db.execute(
+            'INSERT OR REPLACE INTO confirmed (path, piece_length, size, '
+            'mtime_ns, inode, digest, sample) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (storage.absolute(path), piece_length) + tuple(stat) +
+            (digest, sample))
+
+    def lookup(self, path, stat, piece_length, piece_total, check=None):
+        # (digest, sample, digests, roots) of the content of path; digest
+        # is None while the file was only sampled. The file is only read
+        # in full when its sample matches a stored one.
+        length = stat[0]
+        known = self.confirmed(path, stat, piece_length)
+        if known:
+            digest, sample = known
+        else:
+            sample = sample_digest(path, length)
+            candidates = self.db.execute(
+                'SELECT 1 FROM contents WHERE size = ? AND sample = ? AND '
+                'piece_length = ?', (length, sample, piece_length)).fetchone()
+            if candidates is None:
+                return None, sample, None, None
+            digest = content_digest(path, length, piece_length, piece_total,
+                                    check=check)
+            self.confirm(path, stat, piece_length, digest, sample)
+        row = self.db.execute(
+            'SELECT digests, roots FROM contents WHERE size = ? AND '
+            'digest = ? AND piece_length = ?',
+            (length, digest, piece_length)).fetchone()
+        if row is None:
+            return digest, sample, None, None
+        return (digest, sample) + tuple(row)
+
+    def fill(self, files_list, piece_length, missing, pieces_hash,
+             piece_roots=None, stats=None, check=None):
+        # copies the digests of files seen before into pieces_hash and
+        # piece_roots; returns the piece ranges still missing and the files
+        # to store once they are hashed. check is called for every file
+        # and every piece read, and raises to stop.
+        done = []
+        pending = []
+        offset = 0
+        for num, (path, length) in enumerate(files_list):
+            file_offset = offset
+            offset = offset + length
+            if (path is None or length < self.min_length or
+                    file_offset % piece_length):
+                continue
+            padded = (num + 1 < len(files_list) and
+                      files_list[num + 1][0] is None)
+            first, stop = cache.file_pieces(file_offset, length,
+                                            piece_length, padded=padded)
+            if stop == first:
+                continue
+            if not any(first < missing_stop and missing_first < stop
+                       for missing_first, missing_stop in missing):
+                # cached by path already
+                continue
+            stat = (stats or {}).get(path)
+            if stat is None or stat[0] != length:
+                continue
+            if check:
+                check()
+            try:
+                digest, sample, digests, roots = self.lookup(
+                    path, stat, piece_length, stop - first, check=check)
+            except OSError:
+                continue
+            found = True
+            if pieces_hash is not None:
+                found = (digests is not None and
+                         len(digests) >= 20 * (stop - first))
+            if piece_roots is not None:
+                found = (found and roots is not None and
+                         len(roots) == 32 * (stop - first))
+            if not found:
+                pending.append((path, stat, sample, first, stop))
+                continue
+            if pieces_hash is not None:
+                pieces_hash[20 * first:20 * stop] = digests[
+                    :20 * (stop - first)]
+            if piece_roots is not None:
+                piece_roots[first:stop] = [
+                    roots[pos:pos + 32] for pos in range(0, len(roots), 32)]
+            done.append((first, stop))
+            self.reused = self.reused + 1
+        return remove_ranges(missing, done), pending
+
+    def store(self, pending, piece_length, pieces_hash, piece_roots,
+              piece_contents):
+        # piece_contents holds the hash_content_piece digest of every piece
+        # hashed in this run, None for the others
+        for path, stat, sample, first, stop in pending:
+            contents = piece_contents[first:stop]
+            if None in contents:
+                # partly resumed from a checkpoint
+                continue
+            try:
+                info = storage.stat_path(path)
+            except OSError:
+                continue
+            # the digests are of the file as it was scanned
+            if tuple(stat) != (info.st_size, info.st_mtime_ns, info.st_ino):
+                continue
+            digest = join_digests(stat[0], b''.join(contents))
+            self.confirm(path, stat, piece_length, digest, sample)
+            digests = roots = None
+            if pieces_hash is not None:
+                digests = bytes(pieces_hash[20 * first:20 * stop])
+            if piece_roots is not None:
+                roots = b''.join(piece_roots[first:stop])
+            # keeps what other runs stored for the other torrent versions
+            self.db.execute(
+                'INSERT INTO contents (size, digest, sample, piece_length, '
+                'digests, roots) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (size, digest, piece_length) DO UPDATE SET '
+                'digests = coalesce(excluded.digests, digests), '
+                'roots = coalesce(excluded.roots, roots)',
+                (stat[0], digest, sample, piece_length, digests, roots))
@@ -1,19 +1,20 @@
 # -*- coding: utf-8 -*-
 
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import accumulate
 import os
-import sys
+
+from mitorrent import storage
 
 
 def check_basename_path(in_path):
-    # in particular, this expands current dir when given as a dot
-    in_path = os.path.abspath(in_path)
-    if os.access(in_path, os.F_OK | os.R_OK):
-        if os.path.isdir(in_path) and in_path.endswith(os.sep):
-            # Strip path separator for folders
-            # Behavior used in os.path.basename() and the output name
-            return in_path[:-1]
-        return in_path
-    return False
+    # the path in the form the scan uses, or False when it cannot be read;
+    # remote paths are checked by their storage backend
+    try:
+        return storage.get_storage(in_path).check_path(in_path)
+    except OSError:
+        return False
 
 
 def file_length(path):
@@ -32,74 +33,279 @@ def file_length_hfmt(byte_length):
 
 
 def file_name_from_path(path):
-    name = os.path.basename(path)
+    name = storage.get_storage(path).name(path)
     if name and name != '':
         return name
     return False
 
 
+def path_sort_key(path):
+    # case-insensitive, with the exact path breaking ties
+    return (path.lower(), path)
+
+
+class FileTable:
+    # the files of a payload without an object per file: path components
+    # are kept once in a string pool, directories as (parent, name) index
+    # pairs and the sizes, offsets and stats in arrays of integers
+    def __init__(self, base_dir, join=os.path.join):
+        self.base_dir = base_dir
+        # joins base_dir and path components for the storage holding them
+        self.join = join
+        self.strings = []
+        self.string_ids = {}
+        # directory 0 is base_dir itself
+        self.dir_parents = array('q', [-1])
+        self.dir_names = array('q', [-1])
+        self.file_dirs = array('q')
+        self.file_names = array('q')
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.inodes = array('Q')
+        # offsets[num] is where file num starts in the joined payload, the
+        # extra last entry is the total length
+        self.offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __iter__(self):
+        for num in range(len(self.sizes)):
+            yield self.path(num), self.sizes[num]
+
+    def __getitem__(self, index):
+        # (path, length) pairs, the same as the lists the readers take; a
+        # slice is a table sharing the string pool, no path is joined
+        if isinstance(index, slice):
+            return self.reorder(range(*index.indices(len(self))))
+        return self.path(index), self.sizes[index]
+
+    def __getstate__(self):
+        # only the names and directories of these files go to another
+        # process, a slice does not carry the whole pool along
+        strings = []
+        string_ids = {}
+        dir_ids = {0: 0}
+        dir_parents = array('q', [-1])
+        dir_names = array('q', [-1])
+
+        def copy_string(string_id):
+            string = self.strings[string_id]
+            if string not in string_ids:
+                string_ids[string] = len(strings)
+                strings.append(string)
+            return string_ids[string]
+
+        def copy_dir(dir_num):
+            missing = []
+            parent = dir_num
+            while parent not in dir_ids:
+                missing.append(parent)
+                parent = self.dir_parents[parent]
+            for num in reversed(missing):
+                dir_parents.append(dir_ids[self.dir_parents[num]])
+                dir_names.append(copy_string(self.dir_names[num]))
+                dir_ids[num] = len(dir_parents) - 1
+            return dir_ids[dir_num]
+
+        state = dict(self.__dict__)
+        # the storage join may hold connections, it is looked up again;
+        # the offsets are summed again from the sizes
+        del state['join'], state['string_ids'], state['offsets']
+        state['file_dirs'] = array('q', map(copy_dir, self.file_dirs))
+        state['file_names'] = array('q', map(copy_string, self.file_names))
+        state['strings'] = strings
+        state['dir_parents'] = dir_parents
+        state['dir_names'] = dir_names
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.offsets = array('q', [0])
+        self.offsets.extend(accumulate(self.sizes))
+        self.string_ids = {string: string_id
+                           for string_id, string in enumerate(self.strings)}
+        self.join = storage.get_storage(self.base_dir).join
+
+    def intern(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.string_ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def add_dir(self, parent, name):
+        self.dir_parents.append(parent)
+        self.dir_names.append(self.intern(name))
+        return len(self.dir_parents) - 1
+
+    def add_file(self, parent, name, length, mtime_ns=0, inode=0):
+        self.append(parent, self.intern(name), length, mtime_ns, inode)
+
+    def append(self, parent, name_id, length, mtime_ns, inode):
+        self.file_dirs.append(parent)
+        self.file_names.append(name_id)
+        self.sizes.append(length)
+        self.mtimes.append(mtime_ns)
+        self.inodes.append(inode)
+        self.offsets.append(self.offsets[-1] + length)
+
+    def components(self, num):
+        components = [self.strings[self.file_names[num]]]
+        dir_num = self.file_dirs[num]
+        while dir_num > 0:
+            components.append(self.strings[self.dir_names[dir_num]])
+            dir_num = self.dir_parents[dir_num]
+        components.reverse()
+        return components
+
+    def path(self, num):
+        return self.join(self.base_dir, *self.components(num))
+
+    def stat(self, num):
+        return self.sizes[num], self.mtimes[num], self.inodes[num]
+
+    def total_length(self):
+        return self.offsets[-1]
+
+    def info_files(self):
+        # the files list of a v1 info dictionary, built while it is encoded
+        for num in range(len(self.sizes)):
+            yield {'length': self.sizes[num], 'path': self.components(num)}
+
+    def reorder(self, order):
+        # a table of the files at the given indexes, in that order; the
+        # string pool and the directories are shared
+        table = FileTable(self.base_dir, self.join)
+        table.strings = self.strings
+        table.string_ids = self.string_ids
+        table.dir_parents = self.dir_parents
+        table.dir_names = self.dir_names
+        for num in order:
+            table.append(self.file_dirs[num], self.file_names[num],
+                         self.sizes[num], self.mtimes[num], self.inodes[num])
+        return table
+
+    def sorted(self, key=path_sort_key):
+        return self.reorder(sorted(range(len(self.sizes)),
+                                   key=lambda num: key(self.path(num))))
+
+    def nonempty(self):
+        if all(self.sizes):
+            return self
+        return self.reorder(num for num in range(len(self.sizes))
+                            if self.sizes[num])
+
+
 class DirectoryScanner:
 
-    def __init__(self, directory, include_dotfiles=False):
+    def __init__(self, directory, include_dotfiles=False, threads=1,
+                 on_skip=None, check=None):
         self._dir = directory
+        # lists directories and stats files, locally or remotely
+        self._storage = storage.get_storage(directory)
         self._include_dotfiles = include_dotfiles
+        # called with the relative path and the reason of every left out
+        # entry, instead of printing it
+        self._on_skip = on_skip
+        # called before every entry is looked at, raises to stop the scan
+        self._check = check
+        # directories listed at the same time; helps on network mounts
+        # where every readdir and stat waits on a round trip
+        self._threads = threads
+        # FileTable of the last scan, with the size, mtime and inode of
+        # every kept file
+        self.file_table = FileTable(directory, self._storage.join)
 
     def get_files(self):
-        base_dir = self._dir
-        infodir = []
-        allfiles = []
-        total_length = 0
-        infodir_dict = dict()
-
-        for subdir, subdirlist, pathlist in os.walk(base_dir,
-                                                    followlinks=True):
-            if not self._include_dotfiles:
-                dotdirs = [
-                    subdir for subdir in subdirlist if subdir.startswith('.')]
-                for dotdir in dotdirs:
-                    print('Skipping: {0} (hidden/dotfile)'.format(
-                        os.path.relpath(os.path.join(subdir, dotdir),
-                                        base_dir) + os.sep),
-                          file=sys.stderr)
-                    subdirlist.remove(dotdir)
-            for path in pathlist:
-                fullpath = os.path.join(subdir, path)
-                relpath = os.path.relpath(fullpath, base_dir)
-                path_components = self.path2list(
-                    os.path.relpath(fullpath, base_dir))
-                if not self._include_dotfiles:
-                    if path.startswith('.'):
-                        print('Skipping: {0} (hidden/dotfile)'.format(relpath),
-                              file=sys.stderr)
-                        continue
+        file_table = self.scan()
+        allfiles = [path for path, length in file_table]
+        infodir = list(file_table.info_files())
+        return (allfiles, infodir, file_table.total_length())
+
+    def scan(self):
+        # one scandir per directory and one stat per file; the table is
+        # only written from this thread, the listers return plain rows
+        file_table = FileTable(self._dir, self._storage.join)
+        pending = [(self._dir, '', 0)]
+
+        def add_listing(listing, dir_num):
+            rows, subdirs, skipped = listing
+            for relpath, reason in skipped:
+                self.skip(relpath, reason)
+            for name, length, mtime_ns, inode in rows:
+                file_table.add_file(dir_num, name, length, mtime_ns, inode)
+            return [(path, relpath, file_table.add_dir(dir_num, name))
+                    for path, relpath, name in subdirs]
+
+        if self._threads > 1:
+            with ThreadPoolExecutor(self._threads) as executor:
+                running = {executor.submit(self.scan_dir, path, relpath):
+                           dir_num for path, relpath, dir_num in pending}
+                while running:
+                    done = wait(running, return_when=FIRST_COMPLETED).done
+                    for listing in done:
+                        for path, relpath, dir_num in add_listing(
+                                listing.result(), running.pop(listing)):
+                            running[executor.submit(
+                                self.scan_dir, path, relpath)] = dir_num
+        else:
+            while pending:
+                path, relpath, dir_num = pending.pop()
+                pending.extend(add_listing(self.scan_dir(path, relpath),
+                                           dir_num))
+        # the order listings finish in does not matter after sorting
+        self.file_table = file_table.sorted()
+        return self.file_table
+
+    def skip(self, relpath, reason):
+        # dropped without a callback, the command line prints them
+        if self._on_skip:
+            self._on_skip(relpath, reason)
+
+    def scan_dir(self, subdir, reldir):
+        # (name, length, mtime_ns, inode) of the files, (path, relpath,
+        # name) of the subdirectories to descend into and (relpath, reason)
+        # of the left out entries for one directory
+        rows = []
+        subdirs = []
+        skipped = []
+        try:
+            entries = self._storage.list_dir(subdir)
+        except OSError:
+            skipped.append((reldir + os.sep, 'unreadable'))
+            return rows, subdirs, skipped
+        for entry in entries:
+            if self._check:
+                self._check()
+            relpath = os.path.join(reldir, entry.name)
+            hidden = (not self._include_dotfiles and
+                      entry.name.startswith('.'))
+            try:
+                is_dir = entry.is_dir()
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                is_dir = is_file = False
+            if is_dir:
+                if hidden:
+                    skipped.append((relpath + os.sep, 'hidden/dotfile'))
+                else:
+                    subdirs.append((entry.path, relpath, entry.name))
+                continue
+            if hidden:
+                skipped.append((relpath, 'hidden/dotfile'))
+                continue
+            # broken symlinks are neither files nor directories
+            info = None
+            if is_file and self._storage.readable(entry.path):
                 try:
-                    open(fullpath, 'rb').close()
-                except:
-                    print(
-                        'Skipping: {0} (unreadable)'.format(
-                            relpath),
-                        file=sys.stderr)
-                    continue
-                #infodir.append(self.file2infodict(fullpath, path_components))
-                infodir_dict[fullpath] = self.file2infodict(fullpath, path_components)
-                allfiles.append(fullpath)
-                total_length += file_length(fullpath)
-        allfiles = sorted(allfiles, key=str.lower)
-        infodir = [infodir_dict[af] for af in allfiles]
-        return (allfiles, infodir, total_length)
-
-    def file2infodict(self, fullpath, path_components):
-        return {
-            'length': file_length(fullpath),
-            'path': path_components,
-        }
-
-    def path2list(self, path):
-        res = []
-        head, tail = os.path.split(path)
-        res.append(tail)
-        while not head == '':
-            head, tail = os.path.split(head)
-            res.append(tail)
-        res.reverse()
-        return res
+                    info = entry.stat()
+                except OSError:
+                    pass
+            if info is None:
+                skipped.append((relpath, 'unreadable'))
+                continue
+            rows.append((entry.name, info.st_size, info.st_mtime_ns,
+                         info.st_ino))
+        return rows, subdirs, skipped
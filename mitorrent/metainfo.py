@@ -1,15 +1,35 @@
 # -*- coding: utf-8 -*-
 
-import os
-import sys
+from itertools import chain
+import hashlib
+import io
+import stat
 
 from mitorrent import bencode as bencoder
+from mitorrent import cache
+from mitorrent import checkpoint
+from mitorrent import dedup
 from mitorrent import files
 from mitorrent import pieces
+from mitorrent import planner
+from mitorrent import storage
 
 bencode = bencoder.bencode
 
 
+class PayloadError(ValueError):
+    pass
+
+
+class EmptyPayload(PayloadError):
+    pass
+
+
+def pad_entry(length):
+    # BEP-47 padding file
+    return {'attr': 'p', 'length': length, 'path': ['.pad', str(length)]}
+
+
 class MetaDictionary():
 
     def __init__(self):
@@ -28,7 +48,21 @@ class MetaDictionary():
     def add_announce(self, address):
         self.announces.append(str(address))
 
+    def dump(self, fileobj):
+        meta_dictionary = self.get(bencoded_info=True)
+        if not meta_dictionary:
+            return False
+        return bencoder.dump(meta_dictionary, fileobj)
+
     def get_bencoded(self):
+        meta_dictionary = self.get(bencoded_info=True)
+        if not meta_dictionary:
+            return False
+        return bencode(meta_dictionary)
+
+    def get(self, bencoded_info=False):
+        # with bencoded_info the info dictionary is spliced in as the
+        # bytes InfoDictionary encoded once, instead of being encoded again
         meta_dictionary = {
             'comment': self.comment,
             'created by': self.created_by,
@@ -38,7 +72,8 @@ class MetaDictionary():
         if not self.info:
             return False
         meta_dictionary.update({
-            'info': self.info.get()
+            'info': (bencoder.Bencoded(self.info.get_bencoded())
+                     if bencoded_info else self.info.get())
         })
         if len(self.announces) == 1:
             meta_dictionary.update({
@@ -51,62 +86,447 @@ class MetaDictionary():
             })
         if self.nodes:
             meta_dictionary['nodes'] = self.nodes
-        return bencode(meta_dictionary)
+        if self.info.piece_layers:
+            meta_dictionary['piece layers'] = self.info.piece_layers
+        return meta_dictionary
 
 
 class InfoDictionary():
 
-    def __init__(self, path, max_piece_length=None, include_dotfiles=False):
+    def __setattr__(self, name, value):
+        # the encoded dictionary and its hashes are stale after any change;
+        # attributes are replaced, never changed in place
+        self.invalidate()
+        super().__setattr__(name, value)
+
+    def invalidate(self):
+        # bencoded info dictionary and info hashes, made when first asked
+        super().__setattr__('_encoded', {})
+
+    def __init__(self, path, max_piece_length=None, include_dotfiles=False,
+                 workers=None, use_mmap=False,
+                 queue_depth=pieces.QUEUE_DEPTH, cache_dir=None,
+                 versions=(1,), pool=None, scan_threads=1,
+                 checkpoint_path=None, resume=False, progress=None,
+                 on_skip=None, stream=None, size_hint=None, tee=None,
+                 target_size=None, probe=False, pad=False, dedup_dir=None):
+        # with a binary stream, path only names the single file read from it
         self.path = path
+        # set by the scan, the path is not looked at again
+        self.is_dir = False
+        # v1 files list when it has to be kept as dictionaries (padded)
         self.files = []
+        # files.FileTable of a directory payload, None for a single file
+        self.file_table = None
+        # v2 pieces roots of the files in order, None for empty files
+        self.file_roots = []
         # self.length should always hold total length even for multifile
         self.length = None
         self.name = None
         self.piece_length = None
+        # planner.PiecePlan when the piece length was planned for a size
+        self.piece_plan = None
+        self.piece_layers = {}
         self.pieces = None
         self.private = None
+        # files start on piece boundaries, always for v2
+        self.padded = pad or 2 in versions
+        # leading pieces taken from a checkpoint instead of being hashed
+        self.resumed_pieces = 0
+        # files whose digests came from the content store
+        self.deduplicated_files = 0
+        self.versions = versions
+        if stream is not None:
+            self.scan_stream(stream,
+                             max_piece_length=max_piece_length,
+                             size_hint=size_hint,
+                             tee=tee,
+                             queue_depth=queue_depth,
+                             versions=versions,
+                             progress=progress)
+            return
         self.scan_payload(path,
                           max_piece_length=max_piece_length,
-                          include_dotfiles=include_dotfiles)
+                          include_dotfiles=include_dotfiles,
+                          workers=workers,
+                          use_mmap=use_mmap,
+                          queue_depth=queue_depth,
+                          cache_dir=cache_dir,
+                          versions=versions,
+                          pool=pool,
+                          scan_threads=scan_threads,
+                          checkpoint_path=checkpoint_path,
+                          resume=resume,
+                          progress=progress,
+                          on_skip=on_skip,
+                          target_size=target_size,
+                          probe=probe,
+                          pad=pad,
+                          dedup_dir=dedup_dir)
 
     def scan_payload(self,
                      path,
                      max_piece_length=None,
-                     include_dotfiles=False):
-        path = files.check_basename_path(path)
-        if path:
-            if os.path.isfile(path):
-                file_list = [path]
-                self.length = files.file_length(path)
-            elif os.path.isdir(path):
-                dir_contents = files.DirectoryScanner(
-                    path,
-                    include_dotfiles=include_dotfiles)
-                file_list, files_dict_list, length = dir_contents.get_files()
-                self.files = files_dict_list
-                self.length = length
-            else:
-                raise IOError
+                     include_dotfiles=False,
+                     workers=None,
+                     use_mmap=False,
+                     queue_depth=pieces.QUEUE_DEPTH,
+                     cache_dir=None,
+                     versions=(1,),
+                     pool=None,
+                     scan_threads=1,
+                     checkpoint_path=None,
+                     resume=False,
+                     progress=None,
+                     on_skip=None,
+                     target_size=None,
+                     probe=False,
+                     pad=False,
+                     dedup_dir=None):
+        checked_path = files.check_basename_path(path)
+        if not checked_path:
+            raise PayloadError(
+                'There was a problem accessing the file path: {0}'.format(
+                    path))
+        path = checked_path
+        # raises to stop between the steps before hashing, like a cancel
+        check = progress.check if progress else None
+        path_info = storage.stat_path(path)
+        # only local files can be mapped
+        use_mmap = use_mmap and not storage.is_remote(path)
+        # sizes and stats come from the scan, nothing is stat'ed again
+        if stat.S_ISREG(path_info.st_mode):
+            file_list = [(path, path_info.st_size)]
+            file_stats = {path: (path_info.st_size,
+                                 path_info.st_mtime_ns,
+                                 path_info.st_ino)}
+            self.length = path_info.st_size
+        elif stat.S_ISDIR(path_info.st_mode):
+            self.is_dir = True
+            dir_contents = files.DirectoryScanner(
+                path,
+                include_dotfiles=include_dotfiles,
+                threads=scan_threads,
+                on_skip=on_skip,
+                check=check)
+            self.file_table = dir_contents.scan()
+            file_list = self.file_table
+            file_stats = None
+            self.length = self.file_table.total_length()
+        else:
+            raise PayloadError(
+                'Not a regular file or directory: {0}'.format(path))
 
-            if self.length < 1:
-                print('Transfer payload consists entirely of empty files or \
-                      nothing. Pointless to continue.',
-                      file=sys.stderr)
-                sys.exit(1)
+        if self.length < 1:
+            raise EmptyPayload(
+                'Transfer payload consists entirely of empty files or '
+                'nothing: {0}'.format(path))
+        if target_size:
+            if self.file_table is None:
+                entries = [([files.file_name_from_path(path)], self.length)]
+            else:
+                entries = ((self.file_table.components(num), length)
+                           for num, (fname, length) in enumerate(
+                               self.file_table))
+            self.piece_plan = planner.plan_piece_length(
+                entries, file_list, target_size,
+                versions=versions,
+                max_piece_length=max_piece_length,
+                probe=probe,
+                padded=pad or 2 in versions)
+            piece_length = self.piece_plan.piece_length
+        else:
             piece_length = pieces.find_piece_size(
                 self.length,
                 max_piece_length=max_piece_length)
-            self.piece_length = piece_length
-            pieces_hash = b''
-            binary_pieces = pieces.Pieces(
+        self.piece_length = piece_length
+        if pad or 2 in versions:
+            file_list = self.align_files(file_list, piece_length)
+        payload_length = pieces.total_length(file_list)
+        piece_total = pieces.piece_count(payload_length, piece_length)
+        # digests are written in place, the buffer never grows
+        pieces_hash = bytearray(20 * piece_total)
+        piece_roots = None
+        if 2 in versions:
+            piece_roots = [None] * piece_total
+        missing = [(0, piece_total)]
+        if (cache_dir or dedup_dir) and file_stats is None:
+            file_stats = {
+                fname: self.file_table.stat(num)
+                for num, (fname, length) in enumerate(self.file_table)}
+        piece_cache = None
+        content_store = None
+        try:
+            if cache_dir and versions == (1,):
+                piece_cache = cache.PieceCache(cache_dir)
+                missing, stale = piece_cache.fill(
+                    pieces.file_sizes(file_list), piece_length, pieces_hash,
+                    stats=file_stats, check=check)
+            pending = []
+            if dedup_dir:
+                content_store = dedup.ContentStore(dedup_dir)
+                missing, pending = content_store.fill(
+                    pieces.file_sizes(file_list), piece_length, missing,
+                    pieces_hash if 1 in versions else None, piece_roots,
+                    stats=file_stats, check=check)
+                self.deduplicated_files = content_store.reused
+            saved_progress = None
+            completed = 0
+            if checkpoint_path:
+                if self.file_table is None:
+                    payload_stats = [(path,) + file_stats[path]]
+                else:
+                    payload_stats = (
+                        (fname,) + self.file_table.stat(num)
+                        for num, (fname, length) in enumerate(
+                            self.file_table))
+                saved_progress = checkpoint.Checkpoint(
+                    checkpoint_path,
+                    checkpoint.fingerprint(payload_stats, piece_length,
+                                           versions, padded=pad),
+                    piece_length)
+                if resume:
+                    completed = self.resume_checkpoint(
+                        saved_progress, pieces_hash, piece_roots)
+                    self.resumed_pieces = completed
+                # the first pieces are done, whatever the cache found
+                missing = [(max(first, completed), stop)
+                           for first, stop in missing if stop > completed]
+            hash_stats = pieces.HashStats()
+            pieces_hasher = pieces.PiecesHasher(
                 file_list,
-                piece_length=piece_length)
-            for piece in binary_pieces:
-                pieces_hash += pieces.hash_binary_piece(piece)
+                piece_length=piece_length,
+                workers=workers,
+                pool=pool,
+                use_mmap=use_mmap,
+                queue_depth=queue_depth,
+                ranges=missing,
+                versions=versions,
+                stats=hash_stats,
+                # the content store keys the files it keeps by these, only
+                # the pieces of those files are hashed twice
+                content=[(first, stop) for path, stat, sample, first, stop
+                         in pending])
+            if progress:
+                progress.start(
+                    hash_stats, piece_length,
+                    sum(stop - first for first, stop in missing),
+                    sum(min(stop * piece_length, payload_length) -
+                        first * piece_length for first, stop in missing))
+            missing_pieces = chain.from_iterable(
+                range(first, stop) for first, stop in missing)
+            missing_count = sum(stop - first for first, stop in missing)
+            hashed = 0
+            try:
+                for piece, piece_hash in zip(missing_pieces, pieces_hasher):
+                    if piece_roots is not None:
+                        piece_hash, piece_roots[piece] = piece_hash
+                    if piece_hash:
+                        pieces_hash[20 * piece:20 * piece + 20] = piece_hash
+                    hashed = hashed + 1
+                    # pieces before this one were hashed or cached already
+                    completed = piece + 1
+                    if progress:
+                        progress.update(hashed)
+                    if saved_progress and saved_progress.due():
+                        self.save_checkpoint(saved_progress, completed,
+                                             pieces_hash, piece_roots)
+                # the buffer must be full, a file shrunk while being read
+                if hashed != missing_count:
+                    raise PayloadError(
+                        'Read {0} of {1} pieces, the payload changed while '
+                        'being hashed: {2}'.format(hashed, missing_count,
+                                                   path))
+            except BaseException:
+                # keep what is done when interrupted, then give up
+                if saved_progress:
+                    self.save_checkpoint(saved_progress, completed,
+                                         pieces_hash, piece_roots)
+                raise
+            if progress:
+                progress.finish()
+            if saved_progress:
+                saved_progress.remove()
+            if piece_cache:
+                piece_cache.store(stale, pieces_hash)
+            if pending:
+                piece_contents = [None] * piece_total
+                for piece, digest in pieces_hasher.contents.items():
+                    piece_contents[piece] = digest
+                content_store.store(pending, piece_length,
+                                    pieces_hash if 1 in versions else None,
+                                    piece_roots, piece_contents)
+        finally:
+            # committed even when hashing fails, the connections never leak
+            if piece_cache:
+                piece_cache.close()
+            if content_store:
+                content_store.close()
+        if 1 in versions:
+            self.pieces = pieces_hash
+        if 2 in versions:
+            self.hash_v2_files(file_list, piece_roots)
+
+    def scan_stream(self,
+                    stream,
+                    max_piece_length=None,
+                    size_hint=None,
+                    tee=None,
+                    queue_depth=pieces.QUEUE_DEPTH,
+                    versions=(1,),
+                    progress=None):
+        # the length is only known at the end, so the piece length comes
+        # from the expected size_hint or is a fixed guess
+        if size_hint:
+            piece_length = pieces.find_piece_size(
+                size_hint,
+                max_piece_length=max_piece_length)
+        else:
+            piece_length = min(max_piece_length or pieces.STREAM_PIECE_LENGTH,
+                               pieces.STREAM_PIECE_LENGTH)
+        self.piece_length = piece_length
+        hash_stats = pieces.HashStats()
+        pieces_hasher = pieces.StreamHasher(
+            stream,
+            piece_length,
+            tee=tee,
+            queue_depth=queue_depth,
+            versions=versions,
+            stats=hash_stats)
+        if progress:
+            progress.start(hash_stats, piece_length,
+                           size_hint and pieces.piece_count(size_hint,
+                                                            piece_length),
+                           size_hint)
+        pieces_hash = bytearray()
+        piece_roots = []
+        for hashed, piece_hash in enumerate(pieces_hasher, 1):
+            if versions != (1,):
+                piece_hash, piece_root = piece_hash
+                piece_roots.append(piece_root)
+            if piece_hash:
+                pieces_hash.extend(piece_hash)
+            if progress:
+                progress.update(hashed)
+        self.length = pieces_hasher.length
+        if progress:
+            progress.finish(total=self.length)
+        if self.length < 1:
+            raise EmptyPayload('The stream ended before any data was read.')
+        if 1 in versions:
             self.pieces = pieces_hash
+        if 2 in versions:
+            self.hash_v2_files([(self.path, self.length)], piece_roots)
+
+    def resume_checkpoint(self, saved_progress, pieces_hash, piece_roots):
+        # copies the digests of a matching checkpoint in place and returns
+        # the number of pieces they cover
+        state = saved_progress.load()
+        piece_total = len(pieces_hash) // 20
+        if state is not None:
+            completed, digests, roots = state
+            if (completed > piece_total or
+                    (1 in self.versions and len(digests) != 20 * completed) or
+                    (2 in self.versions and len(roots) != 32 * completed)):
+                state = None
+        if state is None:
+            return 0
+        if 1 in self.versions:
+            pieces_hash[:20 * completed] = digests
+        if 2 in self.versions:
+            piece_roots[:completed] = [roots[pos:pos + 32]
+                                       for pos in range(0, len(roots), 32)]
+        return completed
+
+    def save_checkpoint(self, saved_progress, completed, pieces_hash,
+                        piece_roots):
+        if 1 not in self.versions:
+            pieces_hash = None
+        saved_progress.save(completed, pieces_hash, piece_roots)
+
+    def align_files(self, file_list, piece_length):
+        # files padded so each fills whole pieces (BEP-47); v2 trees are
+        # sorted bytewise and hybrid torrents must list their files in the
+        # same order
+        if not self.file_table:
+            return file_list
+        file_table = self.file_table
+        if 2 in self.versions:
+            file_table = file_table.reorder(sorted(
+                range(len(file_table)),
+                key=lambda num: [component.encode('UTF-8')
+                                 for component in file_table.components(
+                                     num)]))
+        layout = []
+        infodir = []
+        for num, (fname, length) in enumerate(file_table):
+            layout.append((fname, length))
+            infodir.append({'length': length,
+                            'path': file_table.components(num)})
+            # the last file is padded too, so every piece is full length
+            if length % piece_length:
+                pad = piece_length - length % piece_length
+                layout.append((None, pad))
+                infodir.append(pad_entry(pad))
+        self.files = infodir
+        return layout
+
+    def hash_v2_files(self, file_list, piece_roots):
+        piece_length = self.piece_length
+        self.file_roots = []
+        self.piece_layers = {}
+        offset = 0
+        for fname, length in file_list:
+            if fname is not None and length == 0:
+                self.file_roots.append(None)
+            elif fname is not None:
+                roots = piece_roots[
+                    offset // piece_length:
+                    pieces.piece_count(offset + length, piece_length)]
+                file_root = pieces.hash_v2_file(roots, piece_length)
+                self.file_roots.append(file_root)
+                if length > piece_length:
+                    self.piece_layers[file_root] = b''.join(roots)
+            offset = offset + length
+
+    def file_tree(self):
+        tree = {}
+        if self.files:
+            entries = [(file_dict['path'], file_dict['length'])
+                       for file_dict in self.files
+                       if file_dict.get('attr') != 'p']
+        else:
+            entries = [([self.name or files.file_name_from_path(self.path)],
+                        self.length)]
+        for (components, length), file_root in zip(entries,
+                                                   self.file_roots):
+            node = tree
+            for component in components:
+                node = node.setdefault(component, {})
+            node[''] = {'length': length, 'pieces root': file_root}
+        return tree
 
     def get_bencoded(self):
-        return bencode(self.get())
+        if 'info' not in self._encoded:
+            # written straight into one buffer, the bytes are not copied
+            output = io.BytesIO()
+            bencoder.dump(self.get(), output)
+            self._encoded['info'] = output.getvalue()
+        return self._encoded['info']
+
+    def info_hash(self):
+        # SHA-1 info hash (BTIH) of v1 and hybrid torrents
+        if 'btih' not in self._encoded:
+            self._encoded['btih'] = hashlib.sha1(
+                self.get_bencoded()).digest()
+        return self._encoded['btih']
+
+    def info_hash_v2(self):
+        # SHA-256 info hash (BTMH) of v2 and hybrid torrents
+        if 'btmh' not in self._encoded:
+            self._encoded['btmh'] = hashlib.sha256(
+                self.get_bencoded()).digest()
+        return self._encoded['btmh']
 
     def get(self):
         # multifile does not set length but does set files
@@ -116,13 +536,19 @@ class InfoDictionary():
             'pieces': self.pieces,
             'private': self.private
         }
-        if os.path.isdir(self.path) and len(self.files) > 0:
-            info_dict['files'] = self.files
-        elif os.path.isfile(self.path) and self.length:
-            info_dict['length'] = self.length
+        if 2 in self.versions:
+            info_dict['meta version'] = 2
+            info_dict['file tree'] = self.file_tree()
+        if self.is_dir and (self.files or self.file_table):
+            if 1 in self.versions:
+                # unpadded lists are only built while being encoded
+                info_dict['files'] = (self.files or
+                                      self.file_table.info_files())
+        elif not self.is_dir and self.length:
+            if 1 in self.versions:
+                info_dict['length'] = self.length
         else:
-            print('Invalid torrent: Either a direcory with one or more files\
-                   or a single file must be set.',
-                  file=sys.stderr)
-            sys.exit(1)
+            raise PayloadError(
+                'Invalid torrent: Either a direcory with one or more files '
+                'or a single file must be set.')
         return info_dict
@@ -2,16 +2,32 @@
 
 import argparse
 import hashlib
+import json
 import os
 import sys
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Pool, cpu_count
 
+from mitorrent import api
+from mitorrent import bencode
+from mitorrent import checkpoint
 from mitorrent import files
 from mitorrent import metainfo
+from mitorrent import pieces
+from mitorrent import planner
+from mitorrent import progress
+from mitorrent import verify
 
 __cmdname__ = 'mitorrent'
 __version__ = '0.9.6'
 
+META_VERSIONS = {
+    '1': (1,),
+    '2': (2,),
+    'hybrid': (1, 2)
+}
+
 
 def bittorrent_info_hash(info_dict):
     piece_hash = hashlib.sha1()
@@ -19,9 +35,15 @@ def bittorrent_info_hash(info_dict):
     return piece_hash.hexdigest()
 
 
-def magnet_uri(btih, length, name):
-    magnet_template = 'magnet:?xt=urn:btih:{0}&xl={1}&dn={2}'
-    return magnet_template.format(btih, length, urllib.parse.quote(name))
+def magnet_uri(btih, length, name, btmh=None):
+    magnet_template = 'magnet:?{0}xl={1}&dn={2}'
+    topics = ''
+    if btih:
+        topics = topics + 'xt=urn:btih:{0}&'.format(btih)
+    if btmh:
+        # multihash prefix for a 32 byte SHA-256 digest
+        topics = topics + 'xt=urn:btmh:1220{0}&'.format(btmh)
+    return magnet_template.format(topics, length, urllib.parse.quote(name))
 
 
 def parse_user_arguments():
@@ -41,6 +63,100 @@ def parse_user_arguments():
                                 help='Include hidden files and folders \
                                     (.hidden dotfiles). These are not \
                                     included by default.')
+    user_arguments.add_argument('-j', '--workers',
+                                metavar='INT',
+                                type=test_workers,
+                                help='Number of processes used for hashing \
+                                    pieces. Defaults to the number of CPUs. \
+                                    A single worker reads ahead in a \
+                                    separate process and hashes in the main \
+                                    process.')
+    user_arguments.add_argument('--mmap',
+                                action='store_true',
+                                dest='use_mmap',
+                                help='Memory-map the files and hash pieces \
+                                    straight from the page cache instead of \
+                                    copying them into buffers. Only use on \
+                                    local files that will not change while \
+                                    hashing.')
+    user_arguments.add_argument('--queue-depth',
+                                metavar='INT',
+                                type=test_queue_depth,
+                                default=pieces.QUEUE_DEPTH,
+                                help='Number of pieces a single worker may \
+                                    read ahead of hashing. Raise it for \
+                                    storage with uneven read latency. \
+                                    Default is {0}.'.format(
+                                        pieces.QUEUE_DEPTH))
+    user_arguments.add_argument('--cache-dir',
+                                metavar='DIR',
+                                dest='cache_dir',
+                                type=str,
+                                help='Keep the piece hashes of every file \
+                                    in a cache in this directory and reuse \
+                                    them for files that have not changed \
+                                    since the last run. Only v1 torrents \
+                                    use it.')
+    user_arguments.add_argument('--dedup-dir',
+                                metavar='DIR',
+                                dest='dedup_dir',
+                                type=str,
+                                help='Keep the piece hashes of large files \
+                                    starting on a piece boundary in a store \
+                                    in this directory, by content, and \
+                                    reuse them for the same content in any \
+                                    other payload. Works best with --pad.')
+    user_arguments.add_argument('--checkpoint',
+                                metavar='FILE',
+                                type=str,
+                                help='Save the piece hashes done so far to \
+                                    this file every {0} seconds and when \
+                                    interrupted. It is removed once the \
+                                    torrent is complete.'.format(
+                                        checkpoint.CHECKPOINT_INTERVAL))
+    user_arguments.add_argument('--resume',
+                                action='store_true',
+                                help='Continue from the --checkpoint file of \
+                                    an interrupted run if none of the files \
+                                    changed since.')
+    user_arguments.add_argument('--scan-threads',
+                                metavar='INT',
+                                type=test_workers,
+                                default=1,
+                                dest='scan_threads',
+                                help='Number of directories listed at the \
+                                    same time while scanning. Raise it for \
+                                    large trees on network file systems. \
+                                    Default is 1.')
+    user_arguments.add_argument('--no-progress',
+                                action='store_false',
+                                dest='show_progress',
+                                help='Do not show the hashing progress when \
+                                    stderr is a terminal.')
+    user_arguments.add_argument('--progress-fd',
+                                metavar='FD',
+                                type=test_progress_fd,
+                                dest='progress_file',
+                                help='Write the hashing progress, rates, \
+                                    ETA and the time spent reading, waiting \
+                                    and hashing to this open file \
+                                    descriptor as one JSON object per line \
+                                    every {0} seconds.'.format(
+                                        progress.PROGRESS_INTERVAL))
+    user_arguments.add_argument('--manifest',
+                                metavar='FILE',
+                                type=str,
+                                help='Also create torrents for the paths \
+                                    listed in this file, one per line. Use \
+                                    - to read the list from stdin.')
+    user_arguments.add_argument('--jobs',
+                                metavar='INT',
+                                type=test_workers,
+                                help='Number of torrents created at the same \
+                                    time when given more than one path. All \
+                                    of them share the hashing workers. \
+                                    Defaults to twice the number of \
+                                    workers.')
     user_arguments.add_argument('-v', '--version',
                                 action='version',
                                 version='{0} {1}'.format(__cmdname__,
@@ -104,6 +220,46 @@ def parse_user_arguments():
                                   based on the file size up to this limit. \
                                   Only change if you have very specific \
                                   requirements. Default is 16 MiB.')
+    nitpick_args.add_argument('--pad',
+                              action='store_true',
+                              help='Start every file on a piece boundary by \
+                                  adding padding files (BEP-47), so the \
+                                  pieces of a file do not depend on the \
+                                  other files. Always done for version 2 \
+                                  and hybrid torrents.')
+    nitpick_args.add_argument('--target-size',
+                              metavar='BYTES',
+                              dest='target_size',
+                              type=test_byte_count,
+                              help='Pick the shortest piece length that \
+                                  keeps the torrent file about this small, \
+                                  taking the number and names of the files \
+                                  into account. Pieces are {0} or longer.'
+                              .format(files.file_length_hfmt(
+                                  planner.DEFAULT_FLOOR)))
+    nitpick_args.add_argument('--probe',
+                              action='store_true',
+                              help='With --target-size, time the hashing of \
+                                  the first {0} at every piece length and \
+                                  leave out lengths too short to hash at \
+                                  full speed.'.format(
+                                      files.file_length_hfmt(
+                                          planner.PROBE_LENGTH)))
+    nitpick_args.add_argument('--verbose',
+                              action='store_true',
+                              help='Explain how the piece length was \
+                                  chosen and how many files were found in \
+                                  the content store.')
+    nitpick_args.add_argument('--meta-version',
+                              choices=sorted(META_VERSIONS),
+                              default='1',
+                              dest='meta_version',
+                              help='BitTorrent metainfo version. Version 2 \
+                                  (BEP-52) hashes every file in its own \
+                                  SHA-256 merkle tree. A hybrid torrent also \
+                                  carries version 1 piece hashes, with files \
+                                  padded to piece boundaries (BEP-47), for \
+                                  older clients. Default is 1.')
     nitpick_args.add_argument('-w', '--website',
                               metavar='URL',
                               type=str,
@@ -118,14 +274,71 @@ def parse_user_arguments():
                               help='Magnet URI for the torrent')
     extra_output.add_argument('-b', '--btih',
                               action='store_true',
-                              help='BitTorrent Info Hash (BTIH)')
+                              help='BitTorrent Info Hash (BTIH), and the \
+                                  SHA-256 info hash for version 2 torrents')
+    stream_args = user_arguments.add_argument_group(
+        title='optional stream arguments',
+        description='Create a single file torrent from data piped to stdin, \
+            hashed as it arrives, instead of from paths.')
+    stream_args.add_argument('--stdin',
+                             metavar='NAME',
+                             dest='stdin_name',
+                             type=str,
+                             help='Read the payload from stdin and name the \
+                                 file NAME in the torrent.')
+    stream_args.add_argument('--tee',
+                             metavar='FILE',
+                             type=str,
+                             help='Also write the data read from stdin to \
+                                 this file.')
+    stream_args.add_argument('--size-hint',
+                             metavar='BYTES',
+                             dest='size_hint',
+                             type=test_byte_count,
+                             help='Expected length of the data on stdin, \
+                                 used to pick the piece length. Without it \
+                                 the piece length is {0} or the \
+                                 --max-piece-length if smaller.'.format(
+                                     files.file_length_hfmt(
+                                         pieces.STREAM_PIECE_LENGTH)))
+    verify_args = user_arguments.add_argument_group(
+        title='optional verification arguments',
+        description='Check files on disk against an existing torrent instead \
+            of creating one. Each problem is printed to stdout as a line of \
+            JSON followed by a summary line. Exits with status 1 if the \
+            payload does not match.')
+    verify_args.add_argument('--verify',
+                             metavar='TORRENT',
+                             type=str,
+                             help='Verify the single PATH against this \
+                                 torrent file.')
+    verify_args.add_argument('--fail-fast',
+                             action='store_true',
+                             dest='fail_fast',
+                             help='Stop verifying at the first problem.')
     user_arguments.add_argument('paths',
-                                nargs='+',
+                                nargs='*',
                                 type=str,
                                 help='Paths to the files or directories to be \
-                                    distributed.')
-    user_arguments = user_arguments.parse_args()
-    return user_arguments
+                                    distributed. Also http:// and https:// \
+                                    URLs, a directory URL ending in /, and \
+                                    tar:ARCHIVE!MEMBER or zip:ARCHIVE!MEMBER \
+                                    for what is inside an archive.')
+    parsed_arguments = user_arguments.parse_args()
+    if parsed_arguments.probe and not parsed_arguments.target_size:
+        user_arguments.error('--probe requires --target-size')
+    if parsed_arguments.stdin_name:
+        if parsed_arguments.paths or parsed_arguments.manifest:
+            user_arguments.error('--stdin does not take any paths')
+        if parsed_arguments.target_size:
+            user_arguments.error('--target-size does not apply to --stdin')
+    elif parsed_arguments.tee or parsed_arguments.size_hint:
+        user_arguments.error('--tee and --size-hint require --stdin')
+    elif not parsed_arguments.paths and not parsed_arguments.manifest:
+        user_arguments.error('the following arguments are required: paths')
+    if parsed_arguments.resume and not parsed_arguments.checkpoint:
+        user_arguments.error('--resume requires --checkpoint')
+    return parsed_arguments
 
 
 def test_max_piece_length(value):
@@ -136,6 +349,38 @@ def test_max_piece_length(value):
     return value
 
 
+def test_workers(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            '{0} is not a positive number of workers'.format(value))
+    return value
+
+
+def test_queue_depth(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            '{0} is not a positive queue depth'.format(value))
+    return value
+
+
+def test_progress_fd(value):
+    try:
+        return os.fdopen(int(value), 'w', closefd=False)
+    except (OSError, ValueError):
+        raise argparse.ArgumentTypeError(
+            '{0} is not a file descriptor open for writing'.format(value))
+
+
+def test_byte_count(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            '{0} is not a positive number of bytes'.format(value))
+    return value
+
+
 def test_node(value):
     value = str(value)
     # TODO: IPv6?
@@ -146,70 +391,289 @@ def test_node(value):
     return value
 
 
+def verify_main(user_arguments):
+    if len(user_arguments.paths) != 1:
+        print('Verification takes exactly one path.', file=sys.stderr)
+        return 2
+    in_path = files.check_basename_path(user_arguments.paths[0])
+    if not in_path:
+        print('There was a problem accessing the file path: {0}'.format(
+            user_arguments.paths[0]),
+            file=sys.stderr)
+        return 2
+    try:
+        with open(user_arguments.verify, 'rb') as torrent_file:
+            meta_dict = bencode.load(torrent_file)
+        reports = verify.check_payload(
+            meta_dict,
+            in_path,
+            workers=user_arguments.workers,
+            use_mmap=user_arguments.use_mmap,
+            fail_fast=user_arguments.fail_fast)
+        problems = 0
+        for report in reports:
+            problems = problems + 1
+            print(json.dumps(report), flush=True)
+    except (OSError, bencode.BencodeError, verify.InvalidMetainfo) as error:
+        print('Could not verify against "{0}": {1}'.format(
+            user_arguments.verify, error),
+            file=sys.stderr)
+        return 2
+    print(json.dumps({
+        'status': 'failed' if problems else 'ok',
+        'pieces': verify.count_pieces(meta_dict),
+        'problems': problems}))
+    return 1 if problems else 0
+
+
+def read_manifest(manifest_path):
+    # one path per line, - reads the list from stdin
+    if manifest_path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(manifest_path, encoding='utf-8') as manifest:
+            lines = manifest.read().splitlines()
+    return [line for line in lines if line.strip()]
+
+
+def print_skip(relpath, reason):
+    with progress.output_lock:
+        print('Skipping: {0} ({1})'.format(relpath, reason), file=sys.stderr)
+
+
+def create_meta_dictionary(in_path, user_arguments, pool=None,
+                           terminal=True):
+    meta_dict = api.create_torrent(
+        in_path,
+        announces=user_arguments.announces,
+        comment=user_arguments.comment,
+        created_by=user_arguments.creator,
+        creation_date=user_arguments.date,
+        nodes=user_arguments.nodes,
+        website=user_arguments.website,
+        private=user_arguments.private,
+        max_piece_length=user_arguments.max_piece_length,
+        include_dotfiles=user_arguments.include_dotfiles,
+        workers=user_arguments.workers,
+        use_mmap=user_arguments.use_mmap,
+        queue_depth=user_arguments.queue_depth,
+        cache_dir=user_arguments.cache_dir,
+        versions=META_VERSIONS[user_arguments.meta_version],
+        pool=pool,
+        scan_threads=user_arguments.scan_threads,
+        checkpoint_path=user_arguments.checkpoint,
+        resume=user_arguments.resume,
+        progress=make_progress(in_path, user_arguments, terminal),
+        on_skip=print_skip,
+        target_size=user_arguments.target_size,
+        probe=user_arguments.probe,
+        pad=user_arguments.pad,
+        dedup_dir=user_arguments.dedup_dir)
+    if user_arguments.verbose:
+        print_piece_plan(meta_dict.info)
+        if user_arguments.dedup_dir:
+            with progress.output_lock:
+                print('Reused the piece hashes of {0} files from the content '
+                      'store.'.format(meta_dict.info.deduplicated_files),
+                      file=sys.stderr)
+    if user_arguments.resume:
+        if meta_dict.info.resumed_pieces:
+            print('Resumed from piece {0}.'.format(
+                meta_dict.info.resumed_pieces),
+                  file=sys.stderr)
+        else:
+            print('No checkpoint for this payload in "{0}", hashed from '
+                  'the first piece.'.format(user_arguments.checkpoint),
+                  file=sys.stderr)
+    return meta_dict
+
+
+def stream_main(user_arguments):
+    name = user_arguments.stdin_name
+    tee = None
+    try:
+        if user_arguments.tee:
+            tee = open(user_arguments.tee, 'wb')
+        meta_dict = api.create_torrent_from_stream(
+            sys.stdin.buffer,
+            name,
+            announces=user_arguments.announces,
+            comment=user_arguments.comment,
+            created_by=user_arguments.creator,
+            creation_date=user_arguments.date,
+            nodes=user_arguments.nodes,
+            website=user_arguments.website,
+            private=user_arguments.private,
+            size_hint=user_arguments.size_hint,
+            tee=tee,
+            max_piece_length=user_arguments.max_piece_length,
+            versions=META_VERSIONS[user_arguments.meta_version],
+            queue_depth=user_arguments.queue_depth,
+            progress=make_progress(name, user_arguments))
+    except (OSError, metainfo.PayloadError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        if tee:
+            tee.close()
+    print_extra_output(meta_dict, user_arguments)
+    if sys.stdout.isatty():
+        write_torrent_file(meta_dict, name + '.torrent')
+    else:
+        meta_dict.dump(sys.stdout.buffer)
+    return 0
+
+
+def print_piece_plan(info):
+    if info.piece_plan:
+        lines = info.piece_plan.explain()
+    else:
+        lines = ['Piece length {0} for {1}, from the payload size.'.format(
+            files.file_length_hfmt(info.piece_length),
+            files.file_length_hfmt(info.length))]
+    with progress.output_lock:
+        for line in lines:
+            print(line, file=sys.stderr)
+
+
+def make_progress(in_path, user_arguments, terminal=True):
+    # terminal is False when other torrents are being created alongside
+    stream = None
+    if terminal and user_arguments.show_progress and sys.stderr.isatty():
+        stream = sys.stderr
+    if stream is None and user_arguments.progress_file is None:
+        return None
+    return progress.Progress(name=files.file_name_from_path(in_path),
+                             stream=stream,
+                             json_file=user_arguments.progress_file)
+
+
+def print_extra_output(meta_dict, user_arguments):
+    if sys.stdout.isatty():
+        extra_print_destination = sys.stdout
+    else:
+        extra_print_destination = sys.stderr
+    if not user_arguments.btih and not user_arguments.magnet:
+        return
+    versions = meta_dict.info.versions
+    # the info dictionary is encoded and hashed once for all the outputs
+    magnet_btih = None
+    magnet_btmh = None
+    if 1 in versions:
+        magnet_btih = meta_dict.info.info_hash().hex()
+    if 2 in versions:
+        magnet_btmh = meta_dict.info.info_hash_v2().hex()
+    if user_arguments.btih:
+        for info_hash in (magnet_btih, magnet_btmh):
+            if info_hash:
+                print(info_hash, file=extra_print_destination)
+    if user_arguments.magnet:
+        magnet_size = int(meta_dict.info.length)
+        magnet_name = meta_dict.info.name
+        print(magnet_uri(
+            magnet_btih,
+            magnet_size,
+            magnet_name,
+            btmh=magnet_btmh),
+            file=extra_print_destination)
+
+
+def write_torrent_file(meta_dict, torrent_name):
+    torrent_path = os.getcwd() + os.sep + torrent_name
+    with open(torrent_path, 'wb') as torrent_file:
+        meta_length = meta_dict.dump(torrent_file)
+    print(
+        'Wrote torrent file "{0}" ({1} torrent file for \
+         {2} files).'.format(
+            torrent_name,
+            files.file_length_hfmt(meta_length),
+            files.file_length_hfmt(meta_dict.info.length)),
+        file=sys.stderr)
+
+
+def batch_main(paths, user_arguments):
+    # every torrent hashes on the same pool; the threads only scan the
+    # payloads and feed piece ranges to it, so small payloads overlap
+    # while large ones are still split across all the workers
+    workers = user_arguments.workers or cpu_count()
+    jobs = user_arguments.jobs or 2 * workers
+    failures = 0
+    with Pool(workers) as pool, ThreadPoolExecutor(jobs) as executor:
+        builds = {}
+        for path in paths:
+            in_path = files.check_basename_path(path)
+            if not in_path:
+                print(
+                    'There was a problem accessing the file path: {0}'.format(
+                        path),
+                    file=sys.stderr)
+                failures = failures + 1
+                continue
+            build = executor.submit(
+                create_meta_dictionary, in_path, user_arguments, pool, False)
+            builds[build] = in_path
+        # written in the order they finish, not the order given
+        for build in as_completed(builds):
+            try:
+                meta_dict = build.result()
+                print_extra_output(meta_dict, user_arguments)
+                write_torrent_file(meta_dict, meta_dict.info.name + '.torrent')
+            except (OSError, metainfo.PayloadError) as error:
+                print(error, file=sys.stderr)
+                print(
+                    'Could not create a torrent for: {0}'.format(
+                        builds[build]),
+                    file=sys.stderr)
+                failures = failures + 1
+    return 1 if failures else 0
+
+
 def main():
     user_arguments = parse_user_arguments()
+    if user_arguments.manifest:
+        try:
+            user_arguments.paths.extend(
+                read_manifest(user_arguments.manifest))
+        except OSError as error:
+            print('Could not read the manifest "{0}": {1}'.format(
+                user_arguments.manifest, error),
+                file=sys.stderr)
+            sys.exit(2)
+    if user_arguments.verify:
+        sys.exit(verify_main(user_arguments))
+    if (user_arguments.cache_dir and
+            META_VERSIONS[user_arguments.meta_version] != (1,)):
+        # the v2 piece layers are not cached, every piece is hashed again
+        print('The piece cache only applies to v1 torrents, ignoring: '
+              '{0}'.format(user_arguments.cache_dir), file=sys.stderr)
+    if user_arguments.stdin_name:
+        sys.exit(stream_main(user_arguments))
+    if len(user_arguments.paths) > 1:
+        if user_arguments.checkpoint:
+            print('A checkpoint can only be kept for a single path.',
+                  file=sys.stderr)
+            sys.exit(2)
+        sys.exit(batch_main(user_arguments.paths, user_arguments))
     if user_arguments and user_arguments.paths:
         for in_path in user_arguments.paths:
             in_path = files.check_basename_path(in_path)
             if in_path:
-                in_path = files.check_basename_path(in_path)
                 basename = files.file_name_from_path(in_path)
-                meta_dict = metainfo.MetaDictionary()
-                if user_arguments.announces:
-                    for announce in user_arguments.announces:
-                        meta_dict.add_announce(str(announce))
-                if user_arguments.comment:
-                    meta_dict.comment = str(user_arguments.comment)
-                if user_arguments.creator:
-                    meta_dict.created_by = str(user_arguments.creator)
-                if user_arguments.date:
-                    meta_dict.creation_date = int(user_arguments.date)
-                if user_arguments.nodes:
-                    for node in user_arguments.nodes:
-                        meta_dict.add_node(str(node))
-                if user_arguments.website:
-                    meta_dict.website = str(user_arguments.website)
-                meta_dict.info = metainfo.InfoDictionary(
-                    in_path,
-                    max_piece_length=user_arguments.max_piece_length,
-                    include_dotfiles=user_arguments.include_dotfiles)
-                meta_dict.info.name = basename
-                meta_dict.info.private = user_arguments.private
-                if sys.stdout.isatty():
-                    extra_print_destination = sys.stdout
-                else:
-                    extra_print_destination = sys.stderr
-                if user_arguments.btih:
-                    magnet_btih = bittorrent_info_hash(
-                        meta_dict.info.get_bencoded())
-                    print(magnet_btih, file=extra_print_destination)
-                if user_arguments.magnet:
-                    magnet_btih = bittorrent_info_hash(
-                        meta_dict.info.get_bencoded())
-                    magnet_size = int(meta_dict.info.length)
-                    magnet_name = basename
-                    print(magnet_uri(
-                        magnet_btih,
-                        magnet_size,
-                        magnet_name),
-                        file=extra_print_destination)
-                meta_file = meta_dict.get_bencoded()
+                try:
+                    meta_dict = create_meta_dictionary(in_path,
+                                                       user_arguments)
+                except (OSError, metainfo.PayloadError) as error:
+                    print(error, file=sys.stderr)
+                    sys.exit(1)
+                print_extra_output(meta_dict, user_arguments)
                 torrent_name = basename + '.torrent'
-                if meta_file:
+                if meta_dict.info:
                     # Save to file or stdout if redirected and single
                     if not sys.stdout.isatty():
                         if len(user_arguments.paths) == 1:
-                            sys.stdout.buffer.write(meta_file)
+                            meta_dict.dump(sys.stdout.buffer)
                             sys.exit(0)
-                    torrent_path = os.getcwd() + os.sep + torrent_name
-                    open(torrent_path, 'wb').write(meta_file)
-                    print(
-                        'Wrote torrent file "{0}" ({1} torrent file for \
-                         {2} files).'.format(
-                            torrent_name,
-                            files.file_length_hfmt(len(meta_file)),
-                            files.file_length_hfmt(meta_dict.info.length)),
-                        file=sys.stderr)
+                    write_torrent_file(meta_dict, torrent_name)
                 else:
                     print(
                         'Torrent file "{0}" could not be bencoded because \
@@ -221,7 +685,7 @@ def main():
                         in_path),
                     file=sys.stderr)
     else:
-        user_arguments.print_usage()
+        print('No paths given.', file=sys.stderr)
         sys.exit(1)
     sys.exit(0)
 
@@ -1,11 +1,36 @@
 # -*- coding: utf-8 -*-
 
+from array import array
+from bisect import bisect_right
+from collections import deque
+from itertools import chain, islice
 from math import ceil, log
-from multiprocessing import Array, Pipe, Process, freeze_support
-import ctypes
+from multiprocessing import (Pipe, Pool, Process, SimpleQueue, Value,
+                             cpu_count, freeze_support, shared_memory)
+from multiprocessing.connection import wait
+from time import perf_counter
 import hashlib
+import mmap
+import os
+import queue
+import threading
 
 from mitorrent import files
+from mitorrent import storage
+
+# upper bound on the bytes handed to a hashing worker in one task
+MAX_RANGE_LENGTH = 64 * 1024 * 1024
+# tasks queued on the pool per worker; a consumer that stops early, a
+# cancelled job for instance, leaves no more than these behind
+RANGES_PER_WORKER = 2
+# number of pieces the reader process may run ahead of the hasher
+QUEUE_DEPTH = 4
+# leaf size of the BitTorrent v2 (BEP-52) merkle trees
+BLOCK_LENGTH = 16 * 1024
+# piece length of a stream of unknown length without a size hint
+STREAM_PIECE_LENGTH = 4 * 1024 * 1024
+# bytes of the BLAKE2b digest of a piece's content
+CONTENT_DIGEST_SIZE = 16
 
 
 def hash_binary_piece(piece):
@@ -14,6 +39,156 @@ def hash_binary_piece(piece):
     return piece_hash.digest()
 
 
+def hash_content_piece(piece):
+    # identifies the content of a piece, see dedup.ContentStore
+    return hashlib.blake2b(piece, digest_size=CONTENT_DIGEST_SIZE).digest()
+
+
+def merkle_root(hashes, leaf_count, pad=bytes(32)):
+    # missing leaves up to leaf_count, a power of two, are set to pad
+    layer = list(hashes) + [pad] * (leaf_count - len(hashes))
+    while len(layer) > 1:
+        layer = [hashlib.sha256(layer[pos] + layer[pos + 1]).digest()
+                 for pos in range(0, len(layer), 2)]
+    return layer[0]
+
+
+def hash_v2_piece(piece, data_length, file_length, piece_length):
+    # root of the merkle subtree over the 16 KiB blocks of one piece; a
+    # file no longer than a piece gets a tree sized to its own blocks
+    view = memoryview(piece)[:data_length]
+    blocks = [hashlib.sha256(view[pos:pos + BLOCK_LENGTH]).digest()
+              for pos in range(0, data_length, BLOCK_LENGTH)]
+    if file_length <= piece_length:
+        return merkle_root(blocks, 1 << (len(blocks) - 1).bit_length())
+    return merkle_root(blocks, piece_length // BLOCK_LENGTH)
+
+
+def hash_v2_file(piece_roots, piece_length):
+    if len(piece_roots) == 1:
+        return piece_roots[0]
+    pad = merkle_root([], piece_length // BLOCK_LENGTH)
+    return merkle_root(piece_roots,
+                       1 << (len(piece_roots) - 1).bit_length(), pad)
+
+
+def piece_layout(files_list, piece_length, offset, length):
+    # (data length, file length) of each piece; in a piece-aligned layout
+    # every piece holds data from one file, followed by padding
+    filenum = 0
+    file_start = 0
+    for start in range(offset, offset + length, piece_length):
+        while file_start + files_list[filenum][1] <= start:
+            file_start += files_list[filenum][1]
+            filenum += 1
+        file_length = files_list[filenum][1]
+        yield (min(piece_length, file_start + file_length - start),
+               file_length)
+
+
+def hash_piece(piece, layout, piece_length, versions):
+    digest = b''
+    root = b''
+    if 1 in versions:
+        digest = hash_binary_piece(piece)
+    if 2 in versions:
+        data_length, file_length = next(layout)
+        root = hash_v2_piece(piece, data_length, file_length, piece_length)
+    return digest, root
+
+
+def read_pieces(files_list, piece_length, offset, length, use_mmap):
+    if use_mmap:
+        yield from MappedPiecesReader(files_list, piece_length,
+                                      offset, length)
+        return
+    reader = PiecesReader(files_list, piece_length, offset, length)
+    buffer = memoryview(bytearray(piece_length))
+    bytes_read = reader.readinto(buffer)
+    while bytes_read:
+        yield buffer[:bytes_read]
+        bytes_read = reader.readinto(buffer)
+
+
+def hash_piece_range(task, content=()):
+    # content holds the [first, stop) ranges of the pieces, counted from
+    # the first of the task, whose hash_content_piece digests are wanted
+    files_list, piece_length, offset, length, use_mmap, versions = task
+    layout = None
+    if 2 in versions:
+        layout = piece_layout(file_sizes(files_list), piece_length,
+                              offset, length)
+    digests = bytearray()
+    roots = bytearray()
+    contents = bytearray()
+    read_time = 0.0
+    hash_time = 0.0
+    started = perf_counter()
+    for num, piece in enumerate(read_pieces(files_list, piece_length, offset,
+                                            length, use_mmap)):
+        hashing = perf_counter()
+        read_time = read_time + hashing - started
+        digest, root = hash_piece(piece, layout, piece_length, versions)
+        digests.extend(digest)
+        roots.extend(root)
+        if any(first <= num < stop for first, stop in content):
+            contents.extend(hash_content_piece(piece))
+        started = perf_counter()
+        hash_time = hash_time + started - hashing
+    read_time = read_time + perf_counter() - started
+    return (bytes(digests), bytes(roots), bytes(contents), read_time,
+            hash_time)
+
+
+def file_sizes(files_list):
+    # accepts a FileTable, plain paths or (path, length) pairs, where a
+    # path of None stands for zeros; empty files are dropped
+    if isinstance(files_list, files.FileTable):
+        return files_list.nonempty()
+    res = []
+    for entry in files_list:
+        if isinstance(entry, str):
+            entry = (entry, files.file_length(entry))
+        if entry[1] > 0:
+            res.append(entry)
+    return res
+
+
+def total_length(files_list):
+    if isinstance(files_list, files.FileTable):
+        return files_list.total_length()
+    return sum(size for fname, size in files_list)
+
+
+def piece_ranges(files_list, piece_length, pieces_per_range,
+                 use_mmap=False, ranges=None, versions=(1,)):
+    # split the concatenated payload, or only the given [first, stop)
+    # piece ranges of it, into (files, offset, length) tasks
+    index = OffsetIndex(files_list)
+    total = index.total_length()
+    if ranges is None:
+        ranges = [(0, piece_count(total, piece_length))]
+    for range_first, range_stop in ranges:
+        for task_first in range(range_first, range_stop, pieces_per_range):
+            start = task_first * piece_length
+            end = min(min(task_first + pieces_per_range, range_stop) *
+                      piece_length, total)
+            task_files, task_offset = index.files_slice(start, end - start)
+            yield (task_files, piece_length, task_offset, end - start,
+                   use_mmap, versions)
+
+
+def task_pieces(ranges, pieces_per_range):
+    # the [first, stop) pieces of every task piece_ranges makes of ranges
+    for range_first, range_stop in ranges:
+        for first in range(range_first, range_stop, pieces_per_range):
+            yield first, min(first + pieces_per_range, range_stop)
+
+
+def piece_count(byte_size, piece_length):
+    return -(-byte_size // piece_length)
+
+
 def round_up_2(value):
     return 2**ceil(log(value, 2))
 
@@ -35,101 +210,611 @@ def find_piece_size(byte_size, max_piece_length=None):
         return min(maxsize, autosize)
 
 
-def PieceReaderWorkerProcess(files_list, piece_length, arrays, pipe):
-    reader = PiecesReader(files_list, piece_length)
-    chunk = None
-    bytes_read = 0
+def PieceReaderWorkerProcess(tasks, piece_length, shm_name,
+                             free_slots, ready_slots, queued):
+    ring = shared_memory.SharedMemory(name=shm_name)
+    buffer = ring.buf
+    readers = (PiecesReader(files_list, piece_length, offset, length)
+               for files_list, piece_length, offset, length, use_mmap,
+               versions in tasks)
+    error = None
     try:
-        chunk = reader.__next__()
-        bytes_read = len(chunk)
-        arrays[0].value = bytes(chunk)
-    except:
-        pipe.send(None)
-    ready_array = 0
-    while True:
-        pipe.recv()
-        pipe.send((ready_array, bytes_read))
-        next_array = (ready_array + 1) % 2
-        try:
-            chunk = reader.__next__()
-            bytes_read = len(chunk)
-            arrays[next_array].value = bytes(chunk)
-            ready_array = next_array
-        except StopIteration:
-            break
-
-    pipe.send((None, None))
+        reader = next(readers, None)
+        slot = free_slots.get()
+        read_time = 0.0
+        while slot is not None and reader is not None:
+            start = slot * piece_length
+            started = perf_counter()
+            bytes_read = reader.readinto(
+                buffer[start:start + piece_length])
+            read_time = read_time + perf_counter() - started
+            if not bytes_read:
+                reader = next(readers, None)
+                continue
+            with queued.get_lock():
+                queued.value = queued.value + 1
+            ready_slots.send((slot, bytes_read, read_time))
+            read_time = 0.0
+            slot = free_slots.get()
+    except Exception as read_error:
+        # raised in the hashing process instead of ending the pieces early;
+        # the traceback would keep views of the ring alive
+        error = read_error.with_traceback(None)
+    finally:
+        ready_slots.send((None, error, 0.0))
+        del buffer
+        ring.close()
 
 
 class Pieces:
-    def __init__(self, files_list, piece_length):
-        self.mypipe, self.subpipe = Pipe()
-        self.arrays = (
-            Array(ctypes.c_char, piece_length, lock=False),
-            Array(ctypes.c_char, piece_length, lock=False))
+    # ring of shared memory slots filled ahead by a reader process
+    def __init__(self, files_list, piece_length, depth=QUEUE_DEPTH,
+                 ranges=None):
+        self.piece_length = piece_length
+        files_list = file_sizes(files_list)
+        tasks = list(piece_ranges(
+            files_list, piece_length,
+            max(1, piece_count(total_length(files_list),
+                               piece_length)),
+            ranges=ranges))
+        self.ring = shared_memory.SharedMemory(
+            create=True, size=piece_length * depth)
+        self.free_slots = SimpleQueue()
+        # only the reader writes to it; read along with the process sentinel
+        self.ready_slots, ready_writer = Pipe(duplex=False)
+        for slot in range(depth):
+            self.free_slots.put(slot)
+        self.last_slot = None
+        # pieces read ahead and not handed out yet
+        self.queued = Value('i', 0)
+        # seconds the reader spent reading and this process waiting for it
+        self.read_time = 0.0
+        self.wait_time = 0.0
         self.subproc = Process(
             target=PieceReaderWorkerProcess,
-            args=(files_list,
+            args=(tasks,
                   piece_length,
-                  self.arrays,
-                  self.subpipe))
+                  self.ring.name,
+                  self.free_slots,
+                  ready_writer,
+                  self.queued),
+            daemon=True)
         self.subproc.start()
+        ready_writer.close()
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        self.mypipe.send(True)
-        array, bytes_read = self.mypipe.recv()
-        if array is None:
+        # hand the previous slot back without waiting for the reader
+        if self.last_slot is not None:
+            self.free_slots.put(self.last_slot)
+            self.last_slot = None
+        started = perf_counter()
+        slot, bytes_read, read_time = self.next_ready()
+        self.wait_time = self.wait_time + perf_counter() - started
+        if slot is None:
+            # the last message carries the error that stopped the reader
+            if bytes_read is not None:
+                raise bytes_read
             raise StopIteration
-        res = self.arrays[array].raw[:bytes_read]
-        return res
+        with self.queued.get_lock():
+            self.queued.value = self.queued.value - 1
+        self.read_time = self.read_time + read_time
+        self.last_slot = slot
+        start = slot * self.piece_length
+        # only valid until the next piece is requested
+        return self.ring.buf[start:start + bytes_read]
+
+    def next_ready(self):
+        # a reader killed before sending its last message, by the OOM
+        # killer for instance, ends the pieces with an error; other
+        # processes forked meanwhile may hold the write end open
+        if not self.ready_slots.poll():
+            wait([self.ready_slots, self.subproc.sentinel])
+        try:
+            if self.ready_slots.poll():
+                return self.ready_slots.recv()
+        except EOFError:
+            pass
+        self.subproc.join()
+        return (None, OSError(
+            'The piece reader process exited with code {0}'.format(
+                self.subproc.exitcode)), 0.0)
+
+    def close(self):
+        # all pieces handed out must have been released by now
+        if self.subproc.is_alive():
+            self.free_slots.put(None)
+            self.subproc.join(1)
+            if self.subproc.is_alive():
+                self.subproc.terminate()
+        self.subproc.join()
+        self.ready_slots.close()
+        self.ring.close()
+        self.ring.unlink()
+
+
+def read_full(stream, view):
+    # fills view unless the stream ends first; pipes return short reads
+    filled = 0
+    readinto = getattr(stream, 'readinto', None)
+    while filled < len(view):
+        if readinto:
+            count = readinto(view[filled:])
+        else:
+            data = stream.read(len(view) - filled)
+            count = len(data)
+            view[filled:filled + count] = data
+        if not count:
+            break
+        filled = filled + count
+    return filled
+
+
+class StreamPieces:
+    # ring of buffers filled ahead from a stream by a thread, which also
+    # copies every piece to tee; a short piece is the last one
+    def __init__(self, stream, piece_length, depth=QUEUE_DEPTH, tee=None):
+        self.stream = stream
+        self.piece_length = piece_length
+        self.tee = tee
+        self.ring = [memoryview(bytearray(piece_length))
+                     for slot in range(depth)]
+        self.free_slots = queue.Queue()
+        self.ready_slots = queue.Queue()
+        for slot in range(depth):
+            self.free_slots.put(slot)
+        self.last_slot = None
+        self.error = None
+        self.read_time = 0.0
+        self.wait_time = 0.0
+        self.thread = threading.Thread(target=self.read_stream, daemon=True)
+        self.thread.start()
+
+    def read_stream(self):
+        try:
+            slot = self.free_slots.get()
+            while slot is not None:
+                started = perf_counter()
+                bytes_read = read_full(self.stream, self.ring[slot])
+                if bytes_read and self.tee:
+                    self.tee.write(self.ring[slot][:bytes_read])
+                read_time = perf_counter() - started
+                if not bytes_read:
+                    break
+                self.ready_slots.put((slot, bytes_read, read_time))
+                if bytes_read < self.piece_length:
+                    break
+                slot = self.free_slots.get()
+        except BaseException as error:
+            # raised in the hashing thread instead
+            self.error = error
+        finally:
+            self.ready_slots.put((None, None, 0.0))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.last_slot is not None:
+            self.free_slots.put(self.last_slot)
+            self.last_slot = None
+        started = perf_counter()
+        slot, bytes_read, read_time = self.ready_slots.get()
+        self.wait_time = self.wait_time + perf_counter() - started
+        if slot is None:
+            self.ready_slots.put((None, None, 0.0))
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        self.read_time = self.read_time + read_time
+        self.last_slot = slot
+        # only valid until the next piece is requested
+        return self.ring[slot][:bytes_read]
+
+    def queued(self):
+        return self.ready_slots.qsize()
+
+    def close(self):
+        # a reader blocked on the stream is left behind, it is a daemon
+        self.free_slots.put(None)
+
+
+class HashStats:
+    # seconds spent reading and hashing, summed over all the workers, and
+    # waiting for the next result in the main process
+    def __init__(self):
+        self.read_time = 0.0
+        self.hash_time = 0.0
+        self.wait_time = 0.0
+        # pieces read ahead by a single worker and not hashed yet, None
+        # when a pool hashes them
+        self.queued = None
+
+
+class PiecesHasher:
+    # yields the digests of all pieces, or of only the given [first, stop)
+    # piece ranges, in order; when versions is not (1,) it yields pairs of
+    # SHA-1 digest and v2 piece root instead, None for a missing version.
+    # The hash_content_piece digests of the pieces in the sorted [first,
+    # stop) content ranges are collected in contents by piece as they
+    # are yielded.
+    def __init__(self, files_list, piece_length, workers=None, pool=None,
+                 use_mmap=False, queue_depth=QUEUE_DEPTH, ranges=None,
+                 versions=(1,), stats=None, content=()):
+        self.files_list = file_sizes(files_list)
+        self.piece_length = piece_length
+        self.pool = pool
+        self.queue_depth = queue_depth
+        self.ranges = ranges
+        self.stats = stats or HashStats()
+        self.use_mmap = use_mmap
+        self.versions = versions
+        self.workers = workers or cpu_count()
+        self.content = list(content)
+        self.content_stops = [stop for first, stop in self.content]
+        self.contents = {}
+
+    def __iter__(self):
+        for digests, roots in self.hash_ranges():
+            if self.versions == (1,):
+                for pos in range(0, len(digests), 20):
+                    yield digests[pos:pos + 20]
+                continue
+            for num in range(max(len(digests) // 20, len(roots) // 32)):
+                yield (digests[20 * num:20 * num + 20] or None,
+                       roots[32 * num:32 * num + 32] or None)
+
+    def task_content(self, first, stop):
+        # the content ranges inside pieces [first, stop), counted from first
+        clipped = []
+        for content_first, content_stop in islice(
+                self.content, bisect_right(self.content_stops, first), None):
+            if content_first >= stop:
+                break
+            clipped.append((max(content_first, first) - first,
+                            min(content_stop, stop) - first))
+        return clipped
+
+    def add_contents(self, first, content, contents):
+        pieces = chain.from_iterable(range(first + start, first + stop)
+                                     for start, stop in content)
+        for num, piece in enumerate(pieces):
+            self.contents[piece] = contents[CONTENT_DIGEST_SIZE * num:
+                                            CONTENT_DIGEST_SIZE * (num + 1)]
+
+    def hash_ranges(self):
+        stats = self.stats
+        total = total_length(self.files_list)
+        ranges = self.ranges
+        if ranges is None:
+            ranges = [(0, piece_count(total, self.piece_length))]
+        piece_total = sum(stop - first for first, stop in ranges)
+        if self.pool is None and self.workers == 1:
+            tasks = list(piece_ranges(self.files_list, self.piece_length,
+                                      max(1, piece_total),
+                                      use_mmap=self.use_mmap,
+                                      ranges=self.ranges,
+                                      versions=self.versions))
+            if self.use_mmap:
+                # the kernel reads ahead for mapped files, no reader process
+                for task, (first, stop) in zip(
+                        tasks, task_pieces(ranges, max(1, piece_total))):
+                    content = self.task_content(first, stop)
+                    (digests, roots, contents, read_time,
+                     hash_time) = hash_piece_range(task, content)
+                    stats.read_time = stats.read_time + read_time
+                    stats.hash_time = stats.hash_time + hash_time
+                    self.add_contents(first, content, contents)
+                    yield digests, roots
+                return
+            layout = (item for task in tasks
+                      for item in piece_layout(*task[:4]))
+            binary_pieces = Pieces(self.files_list, self.piece_length,
+                                   depth=self.queue_depth,
+                                   ranges=self.ranges)
+            piece = None
+            piece_nums = chain.from_iterable(
+                range(first, stop) for first, stop in ranges)
+            try:
+                for num, piece in zip(piece_nums, binary_pieces):
+                    stats.read_time = binary_pieces.read_time
+                    stats.wait_time = binary_pieces.wait_time
+                    stats.queued = binary_pieces.queued.value
+                    hashing = perf_counter()
+                    result = hash_piece(piece, layout, self.piece_length,
+                                        self.versions)
+                    if self.task_content(num, num + 1):
+                        self.contents[num] = hash_content_piece(piece)
+                    stats.hash_time = stats.hash_time + (perf_counter() -
+                                                         hashing)
+                    yield result
+            finally:
+                piece = None
+                binary_pieces.close()
+            return
+        pieces_per_range = max(1, min(
+            MAX_RANGE_LENGTH // self.piece_length,
+            ceil(piece_total / (self.workers * 4))))
+        tasks = list(piece_ranges(
+            self.files_list, self.piece_length, pieces_per_range,
+            use_mmap=self.use_mmap, ranges=self.ranges,
+            versions=self.versions))
+        if not tasks:
+            return
+        pool = self.pool
+        if pool is None:
+            pool = Pool(min(self.workers, len(tasks)))
+        tasks = zip(tasks, task_pieces(ranges, pieces_per_range))
+
+        def queue_task(task, task_range):
+            content = self.task_content(*task_range)
+            return task_range[0], content, pool.apply_async(
+                hash_piece_range, (task, content))
+        try:
+            results = deque(
+                queue_task(task, task_range) for task, task_range in islice(
+                    tasks, RANGES_PER_WORKER * self.workers))
+            while results:
+                started = perf_counter()
+                first, content, result = results.popleft()
+                (digests, roots, contents, read_time,
+                 hash_time) = result.get()
+                stats.wait_time = stats.wait_time + perf_counter() - started
+                stats.read_time = stats.read_time + read_time
+                stats.hash_time = stats.hash_time + hash_time
+                self.add_contents(first, content, contents)
+                # the next task is only queued as a result is taken
+                for task, task_range in islice(tasks, 1):
+                    results.append(queue_task(task, task_range))
+                yield digests, roots
+        finally:
+            if pool is not self.pool:
+                pool.terminate()
+                pool.join()
+
+
+class StreamHasher:
+    # yields the digests of a stream of unknown length like PiecesHasher;
+    # length is the number of bytes read so far
+    def __init__(self, stream, piece_length, tee=None,
+                 queue_depth=QUEUE_DEPTH, versions=(1,), stats=None):
+        self.stream = stream
+        self.piece_length = piece_length
+        self.tee = tee
+        self.queue_depth = queue_depth
+        self.versions = versions
+        self.stats = stats or HashStats()
+        self.length = 0
+
+    def __iter__(self):
+        stats = self.stats
+        stream_pieces = StreamPieces(self.stream, self.piece_length,
+                                     depth=self.queue_depth, tee=self.tee)
+        try:
+            for piece in stream_pieces:
+                stats.read_time = stream_pieces.read_time
+                stats.wait_time = stream_pieces.wait_time
+                stats.queued = stream_pieces.queued()
+                hashing = perf_counter()
+                digest = None
+                root = None
+                if 1 in self.versions:
+                    digest = hash_binary_piece(piece)
+                if 2 in self.versions:
+                    # only a stream ending within the first piece is
+                    # shorter than a piece
+                    root = hash_v2_piece(piece, len(piece),
+                                         self.length + len(piece),
+                                         self.piece_length)
+                self.length = self.length + len(piece)
+                stats.hash_time = stats.hash_time + (perf_counter() -
+                                                     hashing)
+                if self.versions == (1,):
+                    yield digest
+                else:
+                    yield digest, root
+        finally:
+            stream_pieces.close()
+
+
+class OffsetIndex:
+    # prefix sums of the file lengths; maps any byte range or piece of the
+    # joined payload to the files holding it with a binary search
+    def __init__(self, files_list):
+        self.files_list = file_sizes(files_list)
+        if isinstance(self.files_list, files.FileTable):
+            self.offsets = self.files_list.offsets
+        else:
+            self.offsets = array('q', [0])
+            for fname, size in self.files_list:
+                self.offsets.append(self.offsets[-1] + size)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def total_length(self):
+        return self.offsets[-1]
+
+    def file_at(self, offset):
+        # index of the file holding the byte at offset, or the number of
+        # files when offset is past the end
+        return min(bisect_right(self.offsets, offset) - 1, len(self))
+
+    def segments(self, offset, length):
+        # (file index, offset in the file, length) of each part of a range
+        end = min(offset + length, self.offsets[-1])
+        filenum = self.file_at(offset)
+        while offset < end:
+            count = min(end, self.offsets[filenum + 1]) - offset
+            yield filenum, offset - self.offsets[filenum], count
+            offset = offset + count
+            filenum = filenum + 1
+
+    def piece_segments(self, piece, piece_length):
+        return list(self.segments(piece * piece_length, piece_length))
+
+    def files_slice(self, offset, length):
+        # the files covering a range and where it starts in the first one
+        end = min(offset + length, self.offsets[-1])
+        first = self.file_at(offset)
+        last = self.file_at(max(offset, end - 1))
+        return (self.files_list[first:last + 1],
+                offset - self.offsets[first] if first < len(self) else 0)
+
+    def reader(self, piece_length, first, stop=None, use_mmap=False):
+        # reader of pieces [first, stop) that only opens their files
+        offset = first * piece_length
+        if stop is None:
+            length = self.offsets[-1] - offset
+        else:
+            length = (stop - first) * piece_length
+        files_list, file_offset = self.files_slice(offset, length)
+        if use_mmap:
+            return MappedPiecesReader(files_list, piece_length, file_offset,
+                                      length)
+        return PiecesReader(files_list, piece_length, file_offset, length)
+
+
+def short_file_error(file_entry, size):
+    return OSError('File ended after {0} of {1} bytes: {2}'.format(
+        size, file_entry[1], file_entry[0]))
 
 
 class PiecesReader:
-    def __init__(self, files_list, piece_length):
+    def __init__(self, files_list, piece_length, offset=0, length=None):
         # empty files do not contribute pieces
         if len(files_list) < 1:
             return None
-        self.files_list = [
-            (fname, files.file_length(fname)) for fname in files_list]
-        self.files_list = [
-            (fname, size) for fname, size in self.files_list if size > 0]
+        index = OffsetIndex(files_list)
+        self.files_list = index.files_list
 
         self.piece_length = piece_length
-        self.pos = 0
-        self.filenum = 0
-        self.current = open(self.files_list[0][0], 'rb')
-        self.total = sum([file[1] for file in self.files_list])
+        self.pos = offset
+        self.total = index.total_length()
+        if length is not None:
+            self.total = min(self.total, offset + length)
+        # start in the file holding the first byte of the range
+        self.filenum = index.file_at(offset)
+        self.file_pos = offset - index.offsets[self.filenum]
+        self.current = None
+        if self.filenum < len(self.files_list):
+            self.open_file()
 
     def __iter__(self):
         return self
 
     def __next__(self):
+        res = bytearray(self.piece_length)
+        bytes_read = self.readinto(res)
+        if bytes_read == 0:
+            raise StopIteration
+        del res[bytes_read:]
+        return res
+
+    def open_file(self):
+        # files without a path are virtual and read as zeros
+        fname, filesize = self.files_list[self.filenum]
+        if fname is not None:
+            # remote files are only fetched up to the end of the range
+            self.current = storage.open_file(
+                fname, self.file_pos,
+                min(filesize, self.file_pos + self.total - self.pos))
+
+    def next_file(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        self.filenum = self.filenum + 1
+        self.file_pos = 0
+        if self.filenum < len(self.files_list):
+            self.open_file()
+
+    def readinto(self, buffer):
         # check if we can actually get a full chunk
         piece_length = self.piece_length
         if (self.total - self.pos < piece_length):
             piece_length = self.total - self.pos
-        if piece_length == 0:
+        view = memoryview(buffer)
+        bytes_read = 0
+        while (bytes_read < piece_length and
+               self.filenum < len(self.files_list)):
+            filesize = self.files_list[self.filenum][1]
+            count = min(piece_length - bytes_read, filesize - self.file_pos)
+            if count > 0:
+                target = view[bytes_read:bytes_read + count]
+                if self.current is None:
+                    target[:] = bytes(count)
+                else:
+                    count = self.current.readinto(target)
+                    if not count:
+                        # the next file's data would fill this one's pieces
+                        raise short_file_error(self.files_list[self.filenum],
+                                               self.file_pos)
+            if count <= 0:
+                self.next_file()
+                continue
+            bytes_read = bytes_read + count
+            self.file_pos = self.file_pos + count
+            self.pos = self.pos + count
+        return bytes_read
+
+
+class MappedPiecesReader(PiecesReader):
+    # yields memoryview slices of mapped files; pieces that span a file
+    # boundary are the only ones assembled into a new buffer
+    def __init__(self, files_list, piece_length, offset=0, length=None):
+        self.view = None
+        super().__init__(files_list, piece_length, offset, length)
+
+    def open_file(self):
+        # views keep the map alive, it is unmapped once they are released
+        fname, filesize = self.files_list[self.filenum]
+        if fname is None:
+            # anonymous maps are zero-filled and free until touched
+            self.view = memoryview(mmap.mmap(-1, filesize))
+            return
+        with open(fname, 'rb') as current:
+            size = os.fstat(current.fileno()).st_size
+            if size < filesize:
+                raise short_file_error((fname, filesize), size)
+            self.view = memoryview(mmap.mmap(current.fileno(), 0,
+                                             access=mmap.ACCESS_READ))
+        self.view = self.view[:filesize]
+
+    def next_file(self):
+        self.view = None
+        self.filenum = self.filenum + 1
+        self.file_pos = 0
+        if self.filenum < len(self.files_list):
+            self.open_file()
+
+    def __next__(self):
+        piece_length = self.piece_length
+        if (self.total - self.pos < piece_length):
+            piece_length = self.total - self.pos
+        if self.view is not None and self.file_pos == len(self.view):
+            self.next_file()
+        if piece_length <= 0 or self.view is None:
             raise StopIteration
+        if self.file_pos + piece_length <= len(self.view):
+            res = self.view[self.file_pos:self.file_pos + piece_length]
+            self.file_pos = self.file_pos + piece_length
+            self.pos = self.pos + piece_length
+            return res
 
-        remainder = piece_length
         res = bytearray()
-        while (remainder > 0):
-            filesize = self.files_list[self.filenum][1]
-            file_remaining = filesize - self.current.tell()
-            if file_remaining == 0:
-                self.filenum = self.filenum + 1
-                self.current.close()
-                if self.filenum == len(self.files_list):
-                    break
-                self.current = open(self.files_list[self.filenum][0], 'rb')
-            data = self.current.read(remainder)
+        while len(res) < piece_length and self.view is not None:
+            data = self.view[
+                self.file_pos:self.file_pos + piece_length - len(res)]
             res.extend(data)
-            remainder = remainder - len(data)
-            self.pos = self.pos + len(data)
+            self.file_pos = self.file_pos + len(data)
+            if self.file_pos >= len(self.view):
+                self.next_file()
+        self.pos = self.pos + len(res)
         return res
 
+
 if __name__ == '__main__':
     freeze_support()
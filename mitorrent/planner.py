@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from time import perf_counter
+
+from mitorrent import files
+from mitorrent import pieces
+
+MIN_PIECE_LENGTH = 16 * 1024
+MAX_PIECE_LENGTH = 16 * 1024 * 1024
+# shortest piece considered when throughput is not measured
+DEFAULT_FLOOR = 32 * 1024
+# bytes from the start of the payload hashed at every piece length
+PROBE_LENGTH = 16 * 1024 * 1024
+# a piece length is fast enough within this share of the best throughput
+PROBE_TOLERANCE = 0.9
+# name, piece length, private flag and such
+FIXED_LENGTH = 128
+
+
+def string_length(length):
+    # encoded length of a byte string of length bytes
+    return len(str(length)) + 1 + length
+
+
+def integer_length(value):
+    return len(str(value)) + 2
+
+
+class PayloadShape:
+    # what the metainfo size depends on, gathered in one pass over the
+    # (path components, length) of every file
+    def __init__(self, entries):
+        self.sizes = array('q')
+        # encoded v1 files list and v2 file tree
+        self.files_length = 0
+        self.tree_length = 0
+        directories = set()
+        for components, length in entries:
+            self.sizes.append(length)
+            names = [string_length(len(component.encode('UTF-8')))
+                     for component in components]
+            # d6:lengthi..e4:pathl..ee
+            self.files_length = (self.files_length + 18 + sum(names) +
+                                 integer_length(length))
+            # every directory is a dictionary shared by its files
+            for depth in range(1, len(components)):
+                directory = tuple(components[:depth])
+                if directory not in directories:
+                    directories.add(directory)
+                    self.tree_length = self.tree_length + names[depth - 1] + 2
+            # name, d0:d6:lengthi..e11:pieces root32:...ee
+            self.tree_length = (self.tree_length + names[-1] + 63 +
+                                integer_length(length))
+        self.total = sum(self.sizes)
+        self.single = len(self.sizes) == 1
+
+
+def estimate_metainfo_length(shape, piece_length, versions=(1,),
+                             padded=False):
+    length = FIXED_LENGTH
+    if 1 in versions:
+        if (padded or 2 in versions) and not shape.single:
+            # files are padded to whole pieces (BEP-47)
+            piece_total = sum(pieces.piece_count(size, piece_length)
+                              for size in shape.sizes)
+            pads = sum(1 for size in shape.sizes if size % piece_length)
+            length = length + pads * (38 + 2 * len(str(piece_length)))
+        else:
+            piece_total = pieces.piece_count(shape.total, piece_length)
+        length = length + string_length(20 * piece_total)
+        if not shape.single:
+            length = length + shape.files_length
+    if 2 in versions:
+        length = length + shape.tree_length
+        # piece layers of the files longer than a piece
+        length = length + sum(
+            35 + string_length(32 * pieces.piece_count(size, piece_length))
+            for size in shape.sizes if size > piece_length)
+    return length
+
+
+def candidate_lengths(total, max_piece_length=None):
+    # powers of two up to the ceiling, and no longer than the payload
+    ceiling = max_piece_length or MAX_PIECE_LENGTH
+    ceiling = min(ceiling, max(MIN_PIECE_LENGTH,
+                               pieces.round_up_2(max(total, 1))))
+    piece_length = MIN_PIECE_LENGTH
+    lengths = []
+    while piece_length <= ceiling:
+        lengths.append(piece_length)
+        piece_length = piece_length * 2
+    return lengths
+
+
+def probe_throughput(files_list, lengths, probe_length=PROBE_LENGTH):
+    # bytes per second of a single worker, reader process included,
+    # hashing the start of the payload at each piece length
+    sample = min(probe_length, pieces.total_length(files_list))
+    throughputs = {}
+    # the first pass only fills the page cache
+    for piece_length in [lengths[-1]] + lengths:
+        hasher = pieces.PiecesHasher(
+            files_list, piece_length, workers=1,
+            ranges=[(0, pieces.piece_count(sample, piece_length))])
+        started = perf_counter()
+        for digest in hasher:
+            pass
+        seconds = perf_counter() - started
+        throughputs[piece_length] = sample / seconds if seconds else None
+    return throughputs
+
+
+class PiecePlan:
+    # piece length picked for a payload and why
+
+    def __init__(self, shape, target_length, versions=(1,),
+                 max_piece_length=None, throughputs=None, padded=False):
+        self.target_length = target_length
+        self.throughputs = throughputs
+        lengths = candidate_lengths(shape.total, max_piece_length)
+        self.estimates = [
+            (piece_length, estimate_metainfo_length(shape, piece_length,
+                                                    versions, padded))
+            for piece_length in lengths]
+        self.floor = min(DEFAULT_FLOOR, lengths[-1])
+        if throughputs:
+            best = max(rate or 0 for rate in throughputs.values())
+            self.floor = min(piece_length for piece_length in lengths
+                             if (throughputs.get(piece_length) or 0) >=
+                             PROBE_TOLERANCE * best)
+        fitting = [piece_length for piece_length, length in self.estimates
+                   if piece_length >= self.floor and length <= target_length]
+        self.fits = bool(fitting)
+        if fitting:
+            # the smallest pieces within the target, for finer transfers
+            self.piece_length = fitting[0]
+        else:
+            self.piece_length = min(
+                (length, piece_length)
+                for piece_length, length in self.estimates
+                if piece_length >= self.floor)[1]
+        self.file_count = len(shape.sizes)
+        self.total = shape.total
+
+    def explain(self):
+        lines = ['Piece length for {0} in {1} files, aiming for a torrent '
+                 'file of {2}:'.format(
+                     files.file_length_hfmt(self.total), self.file_count,
+                     files.file_length_hfmt(self.target_length))]
+        for piece_length, length in self.estimates:
+            line = '  {0:>10} pieces: about {1}'.format(
+                files.file_length_hfmt(piece_length),
+                files.file_length_hfmt(length))
+            if self.throughputs:
+                rate = self.throughputs.get(piece_length)
+                line = line + ', hashed at {0}/s'.format(
+                    files.file_length_hfmt(rate or 0))
+            if piece_length < self.floor:
+                line = line + ', too small'
+            if piece_length == self.piece_length:
+                line = line + ', chosen'
+            lines.append(line)
+        if self.throughputs:
+            lines.append('Pieces shorter than {0} are hashed below {1:.0%} of '
+                         'the best throughput.'.format(
+                             files.file_length_hfmt(self.floor),
+                             PROBE_TOLERANCE))
+        if not self.fits:
+            lines.append('No piece length fits the target, using the one '
+                         'giving the smallest torrent file.')
+        return lines
+
+
+def plan_piece_length(entries, files_list, target_length, versions=(1,),
+                      max_piece_length=None, probe=False, padded=False):
+    # entries are the (path components, length) of the files in files_list
+    shape = PayloadShape(entries)
+    throughputs = None
+    if probe:
+        throughputs = probe_throughput(
+            files_list, candidate_lengths(shape.total, max_piece_length))
+    return PiecePlan(shape, target_length, versions=versions,
+                     max_piece_length=max_piece_length,
+                     throughputs=throughputs, padded=padded)
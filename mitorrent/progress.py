@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+
+from mitorrent import files
+
+# seconds between two reports
+PROGRESS_INTERVAL = 1.0
+# torrents created side by side share the terminal and the JSON stream
+output_lock = threading.Lock()
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '-:--:--'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{0}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+
+
+class Progress:
+    # turns the statistics of a PiecesHasher into periodic reports, shown
+    # on a terminal, written as JSON lines and/or passed to a callback
+    def __init__(self, name=None, stream=None, json_file=None,
+                 callback=None, interval=PROGRESS_INTERVAL):
+        self.name = name
+        self.stream = stream
+        self.json_file = json_file
+        self.callback = callback
+        self.interval = interval
+        self.stats = None
+        self.piece_length = 0
+        self.piece_total = 0
+        self.total = 0
+        self.pieces = 0
+        self.started = None
+        self.reported = None
+
+    def start(self, stats, piece_length, piece_total, total):
+        # total is the number of bytes in the piece_total pieces to hash,
+        # both are None for a stream of unknown length
+        self.stats = stats
+        self.piece_length = piece_length
+        self.piece_total = piece_total
+        self.total = total
+        self.pieces = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def check(self):
+        # called for every entry scanned and every file looked up before
+        # the hashing starts; a subclass raises to stop the work
+        pass
+
+    def update(self, pieces):
+        self.pieces = pieces
+        if time.monotonic() - self.reported >= self.interval:
+            self.report()
+
+    def finish(self, total=None):
+        # a stream's length is only known once it has been read
+        if total is not None:
+            self.total = total
+        self.report(final=True)
+
+    def get(self):
+        elapsed = time.monotonic() - self.started
+        hashed = self.pieces * self.piece_length
+        if self.total is not None:
+            hashed = min(hashed, self.total)
+        rate = hashed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate > 0 and self.total is not None:
+            eta = max(0.0, self.total - hashed) / rate
+        stats = self.stats
+        return {
+            'name': self.name,
+            'bytes': hashed,
+            'total bytes': self.total,
+            'pieces': self.pieces,
+            'total pieces': self.piece_total,
+            'elapsed': elapsed,
+            'eta': eta,
+            'bytes per second': rate,
+            'pieces per second': self.pieces / elapsed if elapsed else 0.0,
+            # throughput of a single worker while reading or hashing
+            'read bytes per second': (hashed / stats.read_time
+                                      if stats.read_time else None),
+            'hash bytes per second': (hashed / stats.hash_time
+                                      if stats.hash_time else None),
+            'read seconds': stats.read_time,
+            'hash seconds': stats.hash_time,
+            'wait seconds': stats.wait_time,
+            'queued pieces': stats.queued
+        }
+
+    def report(self, final=False):
+        self.reported = time.monotonic()
+        report = self.get()
+        report['done'] = final
+        if self.callback:
+            self.callback(report)
+        with output_lock:
+            if self.json_file:
+                self.json_file.write(json.dumps(report) + '\n')
+                self.json_file.flush()
+            if self.stream:
+                # the line is redrawn in place and cleared to its end
+                self.stream.write('\r' + self.format(report) + '\x1b[K' +
+                                  ('\n' if final else ''))
+                self.stream.flush()
+        return report
+
+    def format(self, report):
+        total = '?'
+        percent = '    ?%'
+        if report['total bytes'] is not None:
+            total = files.file_length_hfmt(report['total bytes'])
+            percent = '{0:5.1f}%'.format(
+                100.0 * report['bytes'] / report['total bytes']
+                if report['total bytes'] else 100.0)
+        line = '{0} {1} of {2}, {3}/s, {4:.0f} pieces/s, ETA {5} \
+(read {6:.1f}s, wait {7:.1f}s, hash {8:.1f}s)'.format(
+            percent,
+            files.file_length_hfmt(report['bytes']),
+            total,
+            files.file_length_hfmt(report['bytes per second']),
+            report['pieces per second'],
+            format_duration(report['eta']),
+            report['read seconds'],
+            report['wait seconds'],
+            report['hash seconds'])
+        if report['queued pieces'] is not None:
+            line = line + ' {0} queued'.format(report['queued pieces'])
+        return line
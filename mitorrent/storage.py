@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from urllib.parse import quote, unquote, urljoin, urlsplit
+import calendar
+import http.client
+import io
+import os
+import stat
+import tarfile
+import threading
+import zipfile
+
+# payload paths that are not on the local file system:
+#   http://host/dir/ or https://host/file, read with range requests
+#   tar:archive.tar!member/path and zip:archive.zip!member/path, the
+#   member part optional for the whole archive
+REMOTE_PREFIXES = ('http://', 'https://', 'tar:', 'zip:')
+# bytes fetched by one range request
+CHUNK_LENGTH = 2 * 1024 * 1024
+# range requests in flight for one file, and connections kept per host
+PARALLEL_REQUESTS = 4
+HTTP_TIMEOUT = 60
+ARCHIVE_EXTENSIONS = ('.tar', '.zip')
+# servers and archives whose backends are kept, the least recently used
+# are dropped first
+STORAGE_CACHE_SIZE = 32
+
+Stat = namedtuple('Stat', 'st_mode st_size st_mtime_ns st_ino')
+
+
+def file_stat(length, mtime_ns=0):
+    return Stat(stat.S_IFREG | 0o444, length, mtime_ns, 0)
+
+
+DIR_STAT = Stat(stat.S_IFDIR | 0o555, 0, 0, 0)
+
+
+def archive_stat(archive):
+    # changes when the archive is rebuilt or replaced, and its listing
+    # with it
+    info = os.stat(archive)
+    return info.st_size, info.st_mtime_ns, info.st_ino
+
+
+def is_remote(path):
+    return path.startswith(REMOTE_PREFIXES)
+
+
+class Entry:
+    # the parts of an os.DirEntry that DirectoryScanner uses; info is the
+    # Stat of the entry or the OSError looking it up failed with
+    def __init__(self, path, name, info):
+        self.path = path
+        self.name = name
+        self.info = info
+
+    def is_dir(self):
+        return (not isinstance(self.info, OSError) and
+                stat.S_ISDIR(self.info.st_mode))
+
+    def is_file(self):
+        return not self.is_dir()
+
+    def stat(self):
+        if isinstance(self.info, OSError):
+            raise self.info
+        return self.info
+
+
+class RangeFile(io.RawIOBase):
+    # [start, stop) of a local file, a member stored in an archive
+    raw = None
+
+    def __init__(self, path, start, stop):
+        self.raw = open(path, 'rb', buffering=0)
+        self.raw.seek(start)
+        self.left = stop - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)[:self.left]
+        count = self.raw.readinto(view)
+        self.left = self.left - count
+        return count
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.close()
+        super().close()
+
+
+class MemberFile(io.RawIOBase):
+    # a compressed zip member, with the archive it was opened from
+    archive = None
+
+    def __init__(self, path, member, start):
+        self.archive = zipfile.ZipFile(path)
+        self.member_file = self.archive.open(member)
+        if start:
+            self.member_file.seek(start)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.member_file.readinto(buffer)
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+        super().close()
+
+
+class LocalStorage:
+
+    def check_path(self, path):
+        # in particular, this expands current dir when given as a dot
+        path = os.path.abspath(path)
+        if os.access(path, os.F_OK | os.R_OK):
+            if os.path.isdir(path) and path.endswith(os.sep):
+                # Strip path separator for folders
+                # Behavior used in os.path.basename() and the output name
+                return path[:-1]
+            return path
+        return False
+
+    def name(self, path):
+        return os.path.basename(path)
+
+    def join(self, base, *components):
+        return os.path.join(base, *components)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def readable(self, path):
+        return os.access(path, os.R_OK)
+
+    def list_dir(self, path):
+        with os.scandir(path) as dir_entries:
+            return list(dir_entries)
+
+    def open(self, path, start=0, stop=None):
+        payload_file = open(path, 'rb')
+        if start:
+            payload_file.seek(start)
+        return payload_file
+
+
+class ArchiveStorage:
+    # members of an archive, listed once; directories are implied by the
+    # member names
+    scheme = None
+
+    def __init__(self, archive):
+        self.archive = archive
+        # taken before listing, a change while listing is seen next time
+        self.archive_stat = archive_stat(archive)
+        self.members = {}
+        self.dirs = {'': {}}
+        for name, info, member in self.load():
+            components = [component for component in name.split('/')
+                          if component not in ('', '.')]
+            if not components or '..' in components:
+                continue
+            parent = ''
+            for component in components[:-1]:
+                child = parent + '/' + component if parent else component
+                if child not in self.dirs:
+                    self.dirs[child] = {}
+                    self.dirs[parent][component] = DIR_STAT
+                parent = child
+            self.dirs[parent][components[-1]] = info
+            self.members['/'.join(components)] = member
+
+    def split(self, path):
+        archive, mark, member = path[len(self.scheme) + 1:].partition('!')
+        return archive, member.strip('/')
+
+    def check_path(self, path):
+        archive, member = self.split(path)
+        if member not in self.dirs and member not in self.members:
+            return False
+        return self.join('{0}:{1}'.format(self.scheme, self.archive), member)
+
+    def name(self, path):
+        archive, member = self.split(path)
+        if member:
+            return member.rpartition('/')[2]
+        name, extension = os.path.splitext(os.path.basename(archive))
+        if extension.lower() not in ARCHIVE_EXTENSIONS:
+            name = name + extension
+        return name
+
+    def join(self, base, *components):
+        archive, member = self.split(base)
+        member = '/'.join(
+            component for component in (member,) + components if component)
+        if not member:
+            return '{0}:{1}'.format(self.scheme, archive)
+        return '{0}:{1}!{2}'.format(self.scheme, archive, member)
+
+    def stat(self, path):
+        archive, member = self.split(path)
+        if member in self.dirs:
+            return DIR_STAT
+        parent, mark, name = member.rpartition('/')
+        info = self.dirs.get(parent, {}).get(name)
+        if info is None:
+            raise FileNotFoundError('No such member: {0}'.format(path))
+        return info
+
+    def readable(self, path):
+        return True
+
+    def list_dir(self, path):
+        archive, member = self.split(path)
+        if member not in self.dirs:
+            raise NotADirectoryError('No such directory: {0}'.format(path))
+        return [Entry(self.join(path, name), name, info)
+                for name, info in self.dirs[member].items()]
+
+
+class TarStorage(ArchiveStorage):
+    # members of an uncompressed tar archive are read where they lie
+    scheme = 'tar'
+
+    def load(self):
+        try:
+            with tarfile.open(self.archive, 'r:') as archive:
+                for member in archive:
+                    if member.isreg() and not member.issparse():
+                        yield (member.name,
+                               file_stat(member.size,
+                                         int(member.mtime) * 10 ** 9),
+                               (member.offset_data, member.size))
+        except tarfile.TarError as error:
+            # compressed archives cannot be read at random
+            raise OSError('Not an uncompressed tar archive: {0} ({1})'.format(
+                self.archive, error))
+
+    def open(self, path, start=0, stop=None):
+        archive, member = self.split(path)
+        offset, length = self.members[member]
+        if stop is None:
+            stop = length
+        return RangeFile(self.archive, offset + start, offset + stop)
+
+
+class ZipStorage(ArchiveStorage):
+    # stored members are read where they lie, compressed ones through
+    # zipfile
+    scheme = 'zip'
+
+    def load(self):
+        try:
+            archive = zipfile.ZipFile(self.archive)
+        except zipfile.BadZipFile as error:
+            raise OSError('Not a zip archive: {0} ({1})'.format(
+                self.archive, error))
+        with archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                # zip times have no time zone, they only need to change
+                mtime = calendar.timegm(member.date_time + (0, 0, 0))
+                yield (member.filename,
+                       file_stat(member.file_size, mtime * 10 ** 9),
+                       member)
+
+    def data_offset(self, member):
+        # where the data of a member starts, after its local header
+        with open(self.archive, 'rb') as archive:
+            archive.seek(member.header_offset)
+            header = archive.read(30)
+        if len(header) < 30 or header[:4] != b'PK\x03\x04':
+            raise OSError('Bad zip member header: {0}'.format(
+                member.filename))
+        return (member.header_offset + 30 +
+                int.from_bytes(header[26:28], 'little') +
+                int.from_bytes(header[28:30], 'little'))
+
+    def open(self, path, start=0, stop=None):
+        archive, name = self.split(path)
+        member = self.members[name]
+        if stop is None:
+            stop = member.file_size
+        if (member.compress_type == zipfile.ZIP_STORED and
+                not member.flag_bits & 1):
+            offset = self.data_offset(member)
+            return RangeFile(self.archive, offset + start, offset + stop)
+        # decompressed from the start, skipping to start
+        return MemberFile(self.archive, member, start)
+
+
+class LinkParser(HTMLParser):
+    # the links of a directory index page
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.links.append(value)
+
+
+class HTTPRangeFile(io.RawIOBase):
+    # [start, stop) of a file on an HTTP server, fetched in chunks by up
+    # to PARALLEL_REQUESTS range requests at a time
+    def __init__(self, storage, url, start, stop):
+        self.storage = storage
+        self.url = url
+        self.next_start = start
+        self.stop = stop
+        self.chunks = deque()
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def fetch_ahead(self):
+        while (len(self.chunks) < PARALLEL_REQUESTS and
+               self.next_start < self.stop):
+            end = min(self.stop, self.next_start + CHUNK_LENGTH)
+            self.chunks.append(self.storage.executor().submit(
+                self.storage.get_range, self.url, self.next_start, end))
+            self.next_start = end
+
+    def readinto(self, buffer):
+        if not self.chunk:
+            self.fetch_ahead()
+            if not self.chunks:
+                return 0
+            self.chunk = memoryview(self.chunks.popleft().result())
+            self.fetch_ahead()
+        count = min(len(buffer), len(self.chunk))
+        memoryview(buffer)[:count] = self.chunk[:count]
+        self.chunk = self.chunk[count:]
+        return count
+
+    def close(self):
+        for chunk in self.chunks:
+            chunk.cancel()
+        self.chunks.clear()
+        super().close()
+
+
+class HTTPStorage:
+    # files of one HTTP server; directories are the pages listing them,
+    # like the autoindex of most servers, with a / at the end
+    def __init__(self, scheme, netloc):
+        if scheme == 'https':
+            self.connection_class = http.client.HTTPSConnection
+        else:
+            self.connection_class = http.client.HTTPConnection
+        self.netloc = netloc
+        self.idle = []
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(PARALLEL_REQUESTS)
+            return self._executor
+
+    def request(self, method, url, headers=None):
+        # (status, headers, body) over a pooled keep-alive connection; a
+        # connection the server closed meanwhile is replaced once
+        parts = urlsplit(url)
+        target = quote(parts.path or '/')
+        if parts.query:
+            target = target + '?' + parts.query
+        for attempt in range(2):
+            with self.lock:
+                connection = self.idle.pop() if self.idle else None
+            if connection is None:
+                # a new connection failing is not retried
+                attempt = 1
+                connection = self.connection_class(self.netloc,
+                                                   timeout=HTTP_TIMEOUT)
+            try:
+                connection.request(method, target, headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as error:
+                connection.close()
+                if attempt:
+                    raise OSError('{0} {1}: {2}'.format(method, url, error))
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                with self.lock:
+                    if len(self.idle) < PARALLEL_REQUESTS:
+                        self.idle.append(connection)
+                        connection = None
+                if connection is not None:
+                    connection.close()
+            return response.status, response.headers, body
+
+    def check_path(self, path):
+        # URLs are given percent-encoded, paths keep the names as they are
+        parts = urlsplit(path)
+        path = parts._replace(path=unquote(parts.path)).geturl()
+        try:
+            info = self.stat(path)
+        except OSError:
+            return False
+        if stat.S_ISDIR(info.st_mode) and not path.endswith('/'):
+            return path + '/'
+        return path
+
+    def name(self, path):
+        parts = urlsplit(path)
+        return (unquote(parts.path.rstrip('/').rpartition('/')[2]) or
+                parts.hostname)
+
+    def join(self, base, *components):
+        return '/'.join((base.rstrip('/'),) + components)
+
+    def stat(self, path):
+        if urlsplit(path).path in ('', '/') or path.endswith('/'):
+            return DIR_STAT
+        status, headers, body = self.request('HEAD', path)
+        location = headers.get('Location')
+        if (status in (301, 302, 303, 307, 308) and location and
+                urljoin(path, location).rstrip('/') == path):
+            return DIR_STAT
+        if status == 404:
+            raise FileNotFoundError('{0}: not found'.format(path))
+        if status != 200 or headers.get('Content-Length') is None:
+            raise OSError('HEAD {0}: {1}'.format(path, status))
+        mtime_ns = 0
+        if headers.get('Last-Modified'):
+            try:
+                mtime_ns = int(parsedate_to_datetime(
+                    headers['Last-Modified']).timestamp()) * 10 ** 9
+            except (TypeError, ValueError):
+                pass
+        return file_stat(int(headers['Content-Length']), mtime_ns)
+
+    def readable(self, path):
+        return True
+
+    def list_dir(self, path):
+        url = path.rstrip('/') + '/'
+        status, headers, body = self.request('GET', url)
+        if status != 200:
+            raise OSError('GET {0}: {1}'.format(url, status))
+        parser = LinkParser()
+        parser.feed(body.decode(headers.get_content_charset() or 'UTF-8',
+                                'replace'))
+        names = {}
+        for link in parser.links:
+            if (link.startswith(('/', '?', '#')) or '://' in link or
+                    '?' in link or '#' in link):
+                continue
+            name = unquote(link.rstrip('/'))
+            if name in ('', '.', '..') or '/' in name:
+                continue
+            names[name] = link.endswith('/')
+        # the files are looked up in parallel, one HEAD request each
+        files = [name for name, is_dir in names.items() if not is_dir]
+        infos = dict(zip(files, self.executor().map(
+            lambda name: self.stat_entry(self.join(url, name)), files)))
+        return [Entry(self.join(url, name), name,
+                      DIR_STAT if is_dir else infos[name])
+                for name, is_dir in names.items()]
+
+    def stat_entry(self, path):
+        try:
+            return self.stat(path)
+        except OSError as error:
+            return error
+
+    def get_range(self, url, start, stop):
+        status, headers, body = self.request(
+            'GET', url, {'Range': 'bytes={0}-{1}'.format(start, stop - 1)})
+        if status == 206 and len(body) == stop - start:
+            return body
+        if status == 200 and start == 0 and len(body) == stop:
+            # the whole file, from a server without range requests
+            return body
+        if status == 200:
+            raise OSError('GET {0}: range requests are not supported'.format(
+                url))
+        raise OSError('GET {0} bytes {1}-{2}: {3}'.format(
+            url, start, stop - 1, status))
+
+    def open(self, path, start=0, stop=None):
+        if stop is None:
+            stop = self.stat(path).st_size
+        return HTTPRangeFile(self, path, start, stop)
+
+
+LOCAL = LocalStorage()
+_storages = OrderedDict()
+_storages_lock = threading.Lock()
+if hasattr(os, 'register_at_fork'):
+    # threads and connections do not survive a fork, every process makes
+    # its own
+    os.register_at_fork(after_in_child=_storages.clear)
+
+
+def get_storage(path):
+    # the backend of a payload path, one per server or archive and process;
+    # an archive changed since it was listed is listed again
+    if not is_remote(path):
+        return LOCAL
+    scheme = path.partition(':')[0]
+    if scheme in ('http', 'https'):
+        key = scheme, urlsplit(path).netloc
+    else:
+        key = scheme, os.path.abspath(path[len(scheme) + 1:].partition(
+            '!')[0])
+    with _storages_lock:
+        storage = _storages.get(key)
+        if (isinstance(storage, ArchiveStorage) and
+                storage.archive_stat != archive_stat(key[1])):
+            # rebuilt since it was listed, the members may have moved
+            storage = None
+        if storage is None:
+            if scheme == 'tar':
+                storage = TarStorage(key[1])
+            elif scheme == 'zip':
+                storage = ZipStorage(key[1])
+            else:
+                storage = HTTPStorage(*key)
+            _storages[key] = storage
+        _storages.move_to_end(key)
+        while len(_storages) > STORAGE_CACHE_SIZE:
+            # still usable by whoever holds it, only no longer shared
+            _storages.popitem(last=False)
+    return storage
+
+
+def absolute(path):
+    # a path that names the same file from any working directory
+    if is_remote(path):
+        return path
+    return os.path.abspath(path)
+
+
+def stat_path(path):
+    return get_storage(path).stat(path)
+
+
+def open_file(path, start=0, stop=None):
+    # binary file reading [start, stop) of path, stop as a hint of where
+    # reading ends; local files can be read past it
+    return get_storage(path).open(path, start, stop)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+from itertools import chain
+import os
+
+from mitorrent import pieces
+from mitorrent import storage
+
+
+class InvalidMetainfo(ValueError):
+    pass
+
+
+def check_component(component):
+    if (component in ('', os.curdir, os.pardir) or
+            os.sep in component or
+            (os.altsep and os.altsep in component)):
+        raise InvalidMetainfo(
+            'Unsafe path component: {0}'.format(component))
+
+
+def payload_files(info, path):
+    # maps the files of an info dictionary onto the payload at path
+    try:
+        if 'files' not in info:
+            return [(path, int(info['length']))]
+        files_list = []
+        join = storage.get_storage(path).join
+        for entry in info['files']:
+            if b'p' in bytes(entry.get('attr', b'')):
+                # BEP-47 padding is zeros, not a file on disk
+                files_list.append((None, int(entry['length'])))
+                continue
+            components = [bytes(component).decode('UTF-8')
+                          for component in entry['path']]
+            for component in components:
+                check_component(component)
+            length = int(entry['length'])
+            if length < 0:
+                raise InvalidMetainfo('Negative file length')
+            files_list.append((join(path, *components), length))
+        return files_list
+    except (KeyError, TypeError, UnicodeDecodeError) as error:
+        raise InvalidMetainfo('Malformed info dictionary: {0!r}'.format(
+            error))
+
+
+def tree_files(tree, components=()):
+    # (path components, length, pieces root) of the files in a v2 file tree
+    for name, node in tree.items():
+        if not isinstance(node, dict):
+            raise TypeError('file tree node')
+        if name == '':
+            yield components, int(node['length']), node.get('pieces root')
+            continue
+        if isinstance(name, bytes):
+            name = name.decode('UTF-8')
+        yield from tree_files(node, components + (name,))
+
+
+def v2_payload(metainfo, info, path, piece_length):
+    # piece-aligned files list and the expected piece roots of a v2-only
+    # torrent, from its file tree and piece layers
+    try:
+        entries = list(tree_files(info['file tree']))
+        layers = {key.encode('UTF-8') if isinstance(key, str) else key:
+                  layer
+                  for key, layer in metainfo.get('piece layers', {}).items()}
+        # a single file is named in the tree like the torrent
+        single = (len(entries) == 1 and list(entries[0][0]) == [
+            bytes(info.get('name', b'')).decode('UTF-8')])
+        files_list = []
+        roots = bytearray()
+        join = storage.get_storage(path).join
+        for components, length, pieces_root in entries:
+            for component in components:
+                check_component(component)
+            if length < 0:
+                raise InvalidMetainfo('Negative file length')
+            files_list.append((path if single else join(path, *components),
+                               length))
+            if length == 0:
+                continue
+            pieces_root = bytes(pieces_root)
+            if length <= piece_length:
+                layer = pieces_root
+            else:
+                layer = bytes(layers[pieces_root])
+            if len(layer) != 32 * pieces.piece_count(length, piece_length):
+                raise InvalidMetainfo(
+                    'Malformed piece layers: {0}'.format('/'.join(components)))
+            roots.extend(layer)
+            # every file starts on a piece boundary
+            if length % piece_length:
+                files_list.append((None, piece_length - length % piece_length))
+        return files_list, bytes(roots)
+    except (AttributeError, KeyError, TypeError, UnicodeDecodeError) as error:
+        raise InvalidMetainfo('Malformed info dictionary: {0!r}'.format(
+            error))
+
+
+def count_pieces(metainfo):
+    # number of pieces of a decoded torrent, v1 or v2
+    info = metainfo['info']
+    if 'pieces' in info:
+        return len(info['pieces']) // 20
+    piece_length = int(info['piece length'])
+    return sum(pieces.piece_count(length, piece_length)
+               for components, length, pieces_root
+               in tree_files(info['file tree']))
+
+
+def check_files(files_list):
+    # yields (path, problem) for files that cannot match their length
+    for path, length in files_list:
+        if path is None:
+            continue
+        try:
+            size = storage.stat_path(path).st_size
+        except OSError:
+            yield path, 'missing'
+            continue
+        if size != length:
+            yield path, 'size mismatch'
+
+
+def piece_files(index, piece_length, piece):
+    return [index.files_list[filenum][0] for filenum, file_offset, length
+            in index.piece_segments(piece, piece_length)
+            if index.files_list[filenum][0] is not None]
+
+
+def piece_ranges(piece_numbers, piece_total):
+    # merges piece numbers into sorted [first, stop) ranges
+    ranges = []
+    for piece in sorted(set(piece_numbers)):
+        if not 0 <= piece < piece_total:
+            raise InvalidMetainfo('No piece {0}'.format(piece))
+        if ranges and ranges[-1][1] == piece:
+            ranges[-1][1] = piece + 1
+        else:
+            ranges.append([piece, piece + 1])
+    return [tuple(piece_range) for piece_range in ranges]
+
+
+def check_payload(metainfo, path, workers=None, pool=None, use_mmap=False,
+                  fail_fast=False, piece_numbers=None):
+    # yields one report dictionary per problem found, in payload order;
+    # piece_numbers limits the piece checks to those pieces
+    info = metainfo.get('info') if isinstance(metainfo, dict) else None
+    if not isinstance(info, dict):
+        raise InvalidMetainfo('No info dictionary')
+    # hybrid torrents are checked through their v1 pieces, v2-only ones
+    # through the piece roots of their files
+    versions = (1,) if 'pieces' in info else (2,)
+    digest_length = 20 if versions == (1,) else 32
+    try:
+        piece_length = int(info['piece length'])
+        if versions == (1,):
+            expected = memoryview(info['pieces']).cast('B')
+        elif info.get('meta version') != 2:
+            raise KeyError('pieces')
+    except (KeyError, TypeError, ValueError) as error:
+        raise InvalidMetainfo('Malformed info dictionary: {0!r}'.format(
+            error))
+    if versions == (2,) and (piece_length < pieces.BLOCK_LENGTH or
+                             piece_length & (piece_length - 1)):
+        raise InvalidMetainfo('Malformed info dictionary: piece length')
+    if versions == (1,):
+        files_list = payload_files(info, path)
+    else:
+        files_list, expected = v2_payload(metainfo, info, path, piece_length)
+    if piece_length < 1 or len(expected) % digest_length:
+        raise InvalidMetainfo('Malformed info dictionary: pieces')
+    # only local files can be mapped
+    use_mmap = use_mmap and not storage.is_remote(path)
+    index = pieces.OffsetIndex(files_list)
+    piece_total = len(expected) // digest_length
+    if pieces.piece_count(index.total_length(), piece_length) != piece_total:
+        raise InvalidMetainfo('Piece count does not match the file lengths')
+    ranges = None
+    if piece_numbers is not None:
+        ranges = piece_ranges(piece_numbers, piece_total)
+
+    bad_files = dict(check_files(files_list))
+    for filepath, problem in bad_files.items():
+        yield {'file': filepath, 'status': problem}
+        if fail_fast:
+            return
+    # unusable files are read as zeros so the other pieces line up
+    readable = [(None if filepath in bad_files else filepath, length)
+                for filepath, length in files_list]
+    pieces_hasher = pieces.PiecesHasher(
+        readable, piece_length, workers=workers, pool=pool,
+        use_mmap=use_mmap, ranges=ranges, versions=versions)
+    if ranges is None:
+        ranges = [(0, piece_total)]
+    checked_pieces = chain.from_iterable(
+        range(first, stop) for first, stop in ranges)
+    for piece, piece_hash in zip(checked_pieces, pieces_hasher):
+        if versions == (2,):
+            piece_hash = piece_hash[1]
+        if piece_hash != expected[piece * digest_length:
+                                  (piece + 1) * digest_length]:
+            yield {'piece': piece,
+                   'status': 'mismatch',
+                   'files': piece_files(index, piece_length, piece)}
+            if fail_fast:
+                return
+
+
+def verify_payload(metainfo, path, workers=None, pool=None, use_mmap=False,
+                   fail_fast=False, piece_numbers=None):
+    bad_pieces = []
+    bad_files = {}
+    for report in check_payload(metainfo, path, workers=workers, pool=pool,
+                                use_mmap=use_mmap, fail_fast=fail_fast,
+                                piece_numbers=piece_numbers):
+        if 'piece' in report:
+            bad_pieces.append(report['piece'])
+            for filepath in report['files']:
+                bad_files.setdefault(filepath, 'corrupt')
+        else:
+            bad_files[report['file']] = report['status']
+    return {'ok': not bad_pieces and not bad_files,
+            'bad_pieces': bad_pieces,
+            'bad_files': bad_files}
@@ -5,8 +5,8 @@ from setuptools import setup
 import sys
 
 
-if sys.version < '3.2':
-    print('Requires Python 3.2 or newer.', file=sys.stderr)
+if sys.version_info < (3, 8):
+    print('Requires Python 3.8 or newer.', file=sys.stderr)
     sys.exit(1)
 
 setup(author='Daniel Aleksandersen',
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+from unittest import mock
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from mitorrent import aio
+from mitorrent import api
+from mitorrent import dedup
+from mitorrent import metainfo
+from mitorrent import pieces
+
+
+def slow_hasher(delay):
+    # a PiecesHasher that takes delay seconds per piece
+    hasher_iter = pieces.PiecesHasher.__iter__
+
+    def __iter__(self):
+        for piece_hash in hasher_iter(self):
+            time.sleep(delay)
+            yield piece_hash
+    return mock.patch.object(pieces.PiecesHasher, '__iter__', __iter__)
+
+
+class TestAsyncCreator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.payload = self.temp_dir + os.sep + 'payload'
+        os.mkdir(self.payload)
+        for name, size in (('a', 100000), ('b', 70000)):
+            with open(self.payload + os.sep + name, 'wb') as test_file:
+                test_file.write(os.urandom(size))
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_create(self):
+        expected = metainfo.InfoDictionary(self.payload, workers=1)
+        reports = []
+
+        async def create():
+            async with aio.AsyncCreator(workers=2, interval=0) as creator:
+                return await creator.create(
+                    self.payload, on_progress=reports.append, comment='test')
+
+        test = asyncio.run(create())
+        self.assertEqual(test.info.pieces, expected.pieces)
+        self.assertEqual(test.comment, 'test')
+        self.assertEqual(reports[-1]['pieces'], len(expected.pieces) // 20)
+        self.assertTrue(reports[-1]['done'])
+
+    def test_events(self):
+        expected = metainfo.InfoDictionary(self.payload, workers=1)
+
+        async def collect():
+            async with aio.AsyncCreator(workers=2, interval=0) as creator:
+                return [event async for event in creator.events(
+                    self.payload)]
+
+        events = asyncio.run(collect())
+        self.assertEqual([kind for kind, value in events],
+                         ['progress'] * (len(expected.pieces) // 20 + 1) +
+                         ['done'])
+        self.assertEqual(events[-1][1].info.name, 'payload')
+
+    def test_jobs_limit(self):
+        running = []
+        most = []
+        lock = threading.Lock()
+        create_torrent = api.create_torrent
+
+        def counting_create_torrent(*args, **kwargs):
+            with lock:
+                running.append(1)
+                most.append(len(running))
+            try:
+                return create_torrent(*args, **kwargs)
+            finally:
+                with lock:
+                    running.pop()
+
+        async def create_all():
+            async with aio.AsyncCreator(jobs=2, workers=2) as creator:
+                return await asyncio.gather(*(
+                    creator.create(self.payload) for num in range(5)))
+
+        with mock.patch.object(api, 'create_torrent',
+                               counting_create_torrent), slow_hasher(0.01):
+            results = asyncio.run(create_all())
+        self.assertEqual(len(results), 5)
+        self.assertEqual(max(most), 2)
+
+    def test_cancel(self):
+        reports = []
+
+        async def cancel():
+            async with aio.AsyncCreator(workers=2, interval=0) as creator:
+                build = asyncio.ensure_future(creator.create(
+                    self.payload, on_progress=reports.append))
+                while not reports:
+                    await asyncio.sleep(0.01)
+                build.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await build
+                # the hashing thread has stopped by now
+                return len(reports)
+
+        with slow_hasher(0.2):
+            self.assertLess(asyncio.run(cancel()), 4)
+
+    def test_cancel_before_hashing(self):
+        cancelled = threading.Event()
+        cancelled.set()
+        cache_dir = self.temp_dir + os.sep + 'cache'
+        dedup_dir = self.temp_dir + os.sep + 'dedup'
+        # large enough to be looked up in the content store
+        big = self.temp_dir + os.sep + 'big'
+        with open(big, 'wb') as test_file:
+            test_file.write(bytes(dedup.MIN_FILE_LENGTH))
+        with mock.patch.object(pieces, 'PiecesHasher') as hasher:
+            # stopped in the scan, then in the cache and store lookups
+            for path, options in (
+                    (self.payload, {}),
+                    (self.payload + os.sep + 'a', {'cache_dir': cache_dir}),
+                    (big, {'dedup_dir': dedup_dir})):
+                with self.assertRaises(aio.Cancelled):
+                    metainfo.InfoDictionary(
+                        path, progress=aio.CancellableProgress(cancelled),
+                        **options)
+        self.assertFalse(hasher.called)
+
+    def test_aclose(self):
+        async def create():
+            creator = aio.AsyncCreator(workers=2)
+            await creator.create(self.payload)
+            with mock.patch.object(creator, 'close',
+                                   wraps=creator.close) as close:
+                await creator.aclose()
+            # joined on another thread
+            self.assertNotEqual(close.call_args, None)
+            return creator
+
+        creator = asyncio.run(create())
+        self.assertIsNone(creator._pool)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
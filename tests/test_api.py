@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import Pool, freeze_support
+from shutil import rmtree
+from unittest import mock
+import io
+import os
+import tempfile
+import unittest
+
+import mitorrent
+from mitorrent import metainfo
+from mitorrent import pieces
+
+
+class TestCreateTorrent(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.payload = self.temp_dir + os.sep + 'payload'
+        os.mkdir(self.payload)
+        for name, size in (('a', 100000), ('b', 70000), ('.hidden', 10)):
+            with open(self.payload + os.sep + name, 'wb') as test_file:
+                test_file.write(os.urandom(size))
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_create_torrent(self):
+        meta_dict = mitorrent.create_torrent(
+            self.payload, announces=['http://example.com/announce'],
+            comment='test', creation_date=1, private=True, workers=1,
+            on_skip=lambda relpath, reason: None)
+        self.assertEqual(meta_dict.info.name, 'payload')
+        self.assertEqual(meta_dict.info.length, 170000)
+        test = meta_dict.get()
+        self.assertEqual(test['announce'], 'http://example.com/announce')
+        self.assertEqual(test['comment'], 'test')
+        self.assertEqual(test['creation date'], 1)
+        self.assertEqual(test['info']['private'], 1)
+
+    def test_create_torrent_name(self):
+        meta_dict = mitorrent.create_torrent(
+            self.payload + os.sep, name='other', workers=1,
+            on_skip=lambda relpath, reason: None)
+        self.assertEqual(meta_dict.info.name, 'other')
+
+    def test_create_torrent_on_skip(self):
+        skipped = []
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            mitorrent.create_torrent(
+                self.payload, workers=1,
+                on_skip=lambda relpath, reason: skipped.append(
+                    (relpath, reason)))
+        self.assertEqual(skipped, [('.hidden', 'hidden/dotfile')])
+        self.assertEqual(stderr.getvalue(), '')
+
+    def test_create_torrent_skips_quietly(self):
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            meta_dict = mitorrent.create_torrent(self.payload, workers=1)
+        self.assertEqual(meta_dict.info.length, 170000)
+        self.assertEqual(stderr.getvalue(), '')
+
+    def test_create_torrent_missing_path(self):
+        with self.assertRaises(mitorrent.PayloadError):
+            mitorrent.create_torrent(self.temp_dir + os.sep + 'missing')
+
+    def test_create_torrent_empty_payload(self):
+        empty = self.temp_dir + os.sep + 'empty'
+        os.mkdir(empty)
+        open(empty + os.sep + 'file', 'w').close()
+        with self.assertRaises(metainfo.EmptyPayload):
+            mitorrent.create_torrent(empty)
+
+    def test_create_torrent_shared_pool(self):
+        expected = mitorrent.create_torrent(
+            self.payload, workers=1, include_dotfiles=True)
+        with Pool(2) as pool, \
+                mock.patch.object(pieces, 'Pieces') as reader_process:
+            for run in range(2):
+                test = mitorrent.create_torrent(
+                    self.payload, pool=pool, include_dotfiles=True)
+                self.assertEqual(test.info.pieces, expected.info.pieces)
+        reader_process.assert_not_called()
+
+
+class TestCreateTorrentFromStream(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = self.temp_dir + os.sep + 'artifact'
+        with open(self.path, 'wb') as test_file:
+            test_file.write(os.urandom(300000))
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_create_torrent_from_stream(self):
+        for versions in ((1,), (2,), (1, 2)):
+            expected = mitorrent.create_torrent(self.path, workers=1,
+                                                versions=versions)
+            with open(self.path, 'rb') as stream:
+                test = mitorrent.create_torrent_from_stream(
+                    stream, 'artifact', size_hint=300000, versions=versions)
+            self.assertEqual(test.info.length, 300000)
+            self.assertEqual(test.info.get_bencoded(),
+                             expected.info.get_bencoded())
+
+    def test_create_torrent_from_stream_tee(self):
+        tee_path = self.temp_dir + os.sep + 'copy'
+        with open(self.path, 'rb') as stream, open(tee_path, 'wb') as tee:
+            test = mitorrent.create_torrent_from_stream(
+                stream, 'artifact', tee=tee)
+        self.assertEqual(test.info.piece_length, pieces.STREAM_PIECE_LENGTH)
+        with open(self.path, 'rb') as expected, open(tee_path, 'rb') as copy:
+            self.assertEqual(copy.read(), expected.read())
+
+    def test_create_torrent_from_empty_stream(self):
+        with self.assertRaises(mitorrent.EmptyPayload):
+            mitorrent.create_torrent_from_stream(io.BytesIO(), 'empty')
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from mitorrent import bencode
+from mitorrent import metainfo
+from mitorrent import mitorrent
+
+
+def parse_arguments(arguments):
+    with mock.patch('sys.argv', ['mitorrent'] + arguments):
+        return mitorrent.parse_user_arguments()
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_read_manifest_skips_blank_lines(self):
+        manifest_path = os.path.join(self.temp_dir, 'manifest')
+        with open(manifest_path, 'w', encoding='utf-8') as manifest:
+            manifest.write('first\n\n  \nsecond dir/with space\n')
+        self.assertEqual(mitorrent.read_manifest(manifest_path),
+                         ['first', 'second dir/with space'])
+
+    def test_manifest_replaces_paths_argument(self):
+        user_arguments = parse_arguments(['--manifest', 'list'])
+        self.assertEqual(user_arguments.paths, [])
+        self.assertEqual(user_arguments.manifest, 'list')
+
+    def test_paths_or_manifest_required(self):
+        with mock.patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                parse_arguments([])
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.temp_dir, 'out')
+        os.mkdir(self.out_dir)
+        self.cwd = os.getcwd()
+        os.chdir(self.out_dir)
+        self.paths = []
+        for num in range(5):
+            payload = os.path.join(self.temp_dir, 'payload{0}'.format(num))
+            os.mkdir(payload)
+            for name in ('a', 'b'):
+                with open(os.path.join(payload, name), 'wb') as fileobj:
+                    fileobj.write(os.urandom(40000 * (num + 1)))
+            self.paths.append(payload)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def test_batch_matches_single_torrents(self):
+        user_arguments = parse_arguments(['-j', '2', '--jobs', '3'] +
+                                         self.paths)
+        with mock.patch('sys.stderr'):
+            self.assertEqual(
+                mitorrent.batch_main(self.paths, user_arguments), 0)
+        for path in self.paths:
+            name = os.path.basename(path)
+            with open(name + '.torrent', 'rb') as torrent_file:
+                torrent = torrent_file.read()
+            info = metainfo.InfoDictionary(path, workers=1)
+            self.assertEqual(bencode.decode(torrent)['info']['pieces'],
+                             bytes(info.pieces))
+
+    def test_batch_reports_missing_paths(self):
+        paths = self.paths[:2] + [os.path.join(self.temp_dir, 'missing')]
+        user_arguments = parse_arguments(paths)
+        with mock.patch('sys.stderr'):
+            self.assertEqual(mitorrent.batch_main(paths, user_arguments), 1)
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ['payload0.torrent', 'payload1.torrent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
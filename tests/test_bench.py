@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+import unittest
+
+from mitorrent import bench
+
+
+class TestPayloadSizes(unittest.TestCase):
+
+    def test_payload_sizes_total(self):
+        for shape in bench.PAYLOAD_SHAPES:
+            sizes = bench.payload_sizes(shape, 1024 * 1024)
+            self.assertEqual(sum(length for components, length in sizes),
+                             1024 * 1024, shape)
+
+    def test_payload_sizes_deep(self):
+        sizes = bench.payload_sizes('deep', 64 * 64 * 1024)
+        self.assertEqual(max(len(components) for components, length
+                             in sizes), 31)
+
+
+class TestRunBenchmarks(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        results = bench.run_benchmarks(shapes=('mixed',),
+                                       total=256 * 1024,
+                                       piece_lengths=(32768, 65536),
+                                       worker_counts=(1, 2))
+        self.assertEqual(
+            [(result['stage'], result.get('piece length'),
+              result.get('workers')) for result in results],
+            [('scan', None, None),
+             ('read', 32768, None),
+             ('hash', 32768, 1),
+             ('hash', 32768, 2),
+             ('read', 65536, None),
+             ('hash', 65536, 1),
+             ('hash', 65536, 2),
+             ('encode', None, None)])
+        for result in results:
+            self.assertEqual(result['bytes'], 256 * 1024)
+            self.assertGreater(result['seconds'], 0)
+            self.assertGreater(result['peak memory'], 0)
+        self.assertEqual(results[2]['pieces'], 8)
+        self.assertGreater(results[-1]['metainfo bytes'], 0)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
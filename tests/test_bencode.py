@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from unittest import TestCase
+import io
+import tempfile
 
 from mitorrent import bencode
 
@@ -61,3 +63,89 @@ class TestBencoder(TestCase):
         self.assertEqual(
             test,
             str('d3:key5:value4:less4:💩4:moredi1eli2ei3eeee').encode('UTF-8'))
+
+
+class TestStreamingBencoder(TestCase):
+
+    def test_iterbencode_tokens(self):
+        test = list(bencode.iterbencode({'key': [1, 'a']}))
+        self.assertEqual(test, [b'd', b'3:key', b'l', b'i1e', b'1:a',
+                                b'e', b'e'])
+
+    def test_iterbencode_skips_none_values(self):
+        test = b''.join(bencode.iterbencode({'a': None, 'b': 1}))
+        self.assertEqual(test, b'd1:bi1ee')
+
+    def test_bencode_deep_nesting(self):
+        item = []
+        for depth in range(5000):
+            item = [item]
+        test = bencode.bencode(item)
+        self.assertEqual(test, b'l' * 5001 + b'e' * 5001)
+
+    def test_bencode_generator(self):
+        test = bencode.bencode({'files': (num for num in range(3))})
+        self.assertEqual(test, b'd5:filesli0ei1ei2eee')
+
+    def test_dump(self):
+        output = io.BytesIO()
+        item = {'key': 'value', 'list': [b'x' * 100000, 2, (3, 4)]}
+        test = bencode.dump(item, output)
+        self.assertEqual(output.getvalue(), bencode.bencode(item))
+        self.assertEqual(test, len(output.getvalue()))
+
+    def test_bencode_bencoded(self):
+        test = bencode.bencode({'a': bencode.Bencoded(b'li1ee'), 'b': 2})
+        self.assertEqual(test, b'd1:ali1ee1:bi2ee')
+
+    def test_dump_none(self):
+        self.assertRaises(KeyError, bencode.dump, [None], io.BytesIO())
+
+
+class TestBdecoder(TestCase):
+
+    def test_decode_dict(self):
+        test = bencode.decode(b'd3:key5:value4:moreli1ei-2eee')
+        self.assertEqual(test, {'key': b'value', 'more': [1, -2]})
+
+    def test_decode_roundtrip(self):
+        item = {'info': {'name': 'Blåbærsyltetøy', 'pieces': b'\0' * 4000,
+                         'files': [{'length': 13, 'path': ['a', 'b']}]}}
+        data = bencode.bencode(item)
+        self.assertEqual(bencode.bencode(bencode.decode(data)), data)
+
+    def test_decode_lazy_bytes(self):
+        data = bytearray(b'l5:small2000:' + b'x' * 2000 + b'e')
+        test = bencode.decode(data)
+        self.assertIsInstance(test[0], bytes)
+        self.assertIsInstance(test[1], memoryview)
+        self.assertEqual(test[1].obj, data)
+
+    def test_decode_memoryview(self):
+        test = bencode.decode(memoryview(b'xxd1:ai0ee')[2:])
+        self.assertEqual(test, {'a': 0})
+
+    def test_decode_deep_nesting(self):
+        test = bencode.decode(b'l' * 5000 + b'e' * 5000)
+        for depth in range(4999):
+            test = test[0]
+        self.assertEqual(test, [])
+
+    def test_decode_invalid(self):
+        for data in (b'i-0e', b'i01e', b'03:abc', b'l', b'4:abc', b'x',
+                     b'di1ei1ee', b'd1:ae', b'i1ei2e', b''):
+            self.assertRaises(bencode.BencodeError, bencode.decode, data)
+
+    def test_load(self):
+        output = io.BytesIO()
+        bencode.dump({'key': [b'value']}, output)
+        output.seek(0)
+        test = bencode.load(output)
+        self.assertEqual(test, {'key': [b'value']})
+
+    def test_load_mapped_file(self):
+        with tempfile.TemporaryFile() as temp_file:
+            temp_file.write(b'd6:pieces2000:' + b'x' * 2000 + b'e')
+            temp_file.seek(0)
+            test = bencode.load(temp_file)
+        self.assertEqual(bytes(test['pieces']), b'x' * 2000)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+from unittest import mock
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from mitorrent import cache
+from mitorrent import metainfo
+from mitorrent import pieces
+
+
+def make_payload(temp_dir):
+    payload = temp_dir + os.sep + 'payload'
+    os.mkdir(payload)
+    for name, size in (('a', 100000), ('b', 70000), ('c', 5)):
+        with open(payload + os.sep + name, 'wb') as test_file:
+            test_file.write(name.encode('UTF-8') * size)
+    return payload
+
+
+class TestFilePieces(unittest.TestCase):
+
+    def test_file_pieces_aligned(self):
+        self.assertEqual(cache.file_pieces(0, 100, 10), (0, 10))
+
+    def test_file_pieces_unaligned(self):
+        self.assertEqual(cache.file_pieces(5, 30, 10), (1, 3))
+
+    def test_file_pieces_none(self):
+        self.assertEqual(cache.file_pieces(5, 8, 10), (1, 1))
+
+    def test_file_pieces_padded(self):
+        self.assertEqual(cache.file_pieces(10, 25, 10, padded=True), (1, 4))
+
+
+class TestPieceCache(unittest.TestCase):
+
+    def test_piece_cache_same_result(self):
+        temp_dir = tempfile.mkdtemp()
+        payload = make_payload(temp_dir)
+        cache_dir = temp_dir + os.sep + 'cache'
+        expected = metainfo.InfoDictionary(payload).get_bencoded()
+        first = metainfo.InfoDictionary(
+            payload, cache_dir=cache_dir).get_bencoded()
+        second = metainfo.InfoDictionary(
+            payload, cache_dir=cache_dir, workers=1).get_bencoded()
+        rmtree(temp_dir)
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+
+    def test_piece_cache_reused_until_changed(self):
+        temp_dir = tempfile.mkdtemp()
+        payload = make_payload(temp_dir)
+        cache_dir = temp_dir + os.sep + 'cache'
+        expected = metainfo.InfoDictionary(
+            payload, cache_dir=cache_dir).pieces
+        # tamper with the cache to see whether it is used
+        db = sqlite3.connect(cache_dir + os.sep + cache.CACHE_NAME)
+        db.execute("UPDATE pieces SET digests = zeroblob(length(digests)) "
+                   "WHERE path LIKE '%a'")
+        db.commit()
+        db.close()
+        cached = metainfo.InfoDictionary(
+            payload, cache_dir=cache_dir).pieces
+        os.utime(payload + os.sep + 'a', ns=(0, 0))
+        rehashed = metainfo.InfoDictionary(
+            payload, cache_dir=cache_dir).pieces
+        rmtree(temp_dir)
+        self.assertEqual(cached[:60], bytes(60))
+        self.assertEqual(cached[60:], expected[60:])
+        self.assertEqual(rehashed, expected)
+
+    def test_piece_cache_padded(self):
+        temp_dir = tempfile.mkdtemp()
+        payload = make_payload(temp_dir)
+        cache_dir = temp_dir + os.sep + 'cache'
+        expected = metainfo.InfoDictionary(
+            payload, cache_dir=cache_dir, pad=True).pieces
+        with mock.patch.object(pieces, 'PiecesHasher',
+                               wraps=pieces.PiecesHasher) as hasher:
+            cached = metainfo.InfoDictionary(
+                payload, cache_dir=cache_dir, pad=True).pieces
+        rmtree(temp_dir)
+        # every piece, tails included, belongs to a single file
+        self.assertEqual(hasher.call_args[1]['ranges'], [])
+        self.assertEqual(cached, expected)
+
+    def test_piece_cache_file_shrunk(self):
+        temp_dir = tempfile.mkdtemp()
+        payload = make_payload(temp_dir)
+        cache_dir = temp_dir + os.sep + 'cache'
+        hasher = pieces.PiecesHasher
+
+        def shrinking_hasher(*args, **kwargs):
+            # after the scan, before the file is read
+            os.truncate(payload + os.sep + 'a', 50000)
+            return hasher(*args, **kwargs)
+        for workers in (1, 2):
+            with open(payload + os.sep + 'a', 'wb') as test_file:
+                test_file.write(b'a' * 100000)
+            with mock.patch.object(pieces, 'PiecesHasher', shrinking_hasher):
+                with self.assertRaises(OSError):
+                    metainfo.InfoDictionary(payload, cache_dir=cache_dir,
+                                            workers=workers)
+        db = sqlite3.connect(cache_dir + os.sep + cache.CACHE_NAME)
+        stored = db.execute('SELECT count(*) FROM pieces').fetchone()[0]
+        db.close()
+        rmtree(temp_dir)
+        self.assertEqual(stored, 0)
+
+    def test_piece_cache_closed_on_error(self):
+        temp_dir = tempfile.mkdtemp()
+        payload = make_payload(temp_dir)
+        cache_dir = temp_dir + os.sep + 'cache'
+        close = cache.PieceCache.close
+        with mock.patch.object(cache.PieceCache, 'close', autospec=True,
+                               side_effect=close) as closed:
+            with mock.patch.object(pieces, 'PiecesHasher',
+                                   side_effect=OSError('unreadable')):
+                with self.assertRaises(OSError):
+                    metainfo.InfoDictionary(payload, cache_dir=cache_dir)
+        rmtree(temp_dir)
+        self.assertEqual(closed.call_count, 1)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
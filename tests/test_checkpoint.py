@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+from unittest import mock
+import os
+import tempfile
+import unittest
+
+from mitorrent import checkpoint
+from mitorrent import metainfo
+from mitorrent import pieces
+
+
+def make_payload(temp_dir):
+    payload = temp_dir + os.sep + 'payload'
+    os.mkdir(payload)
+    for name, size in (('a', 100000), ('b', 70000)):
+        with open(payload + os.sep + name, 'wb') as test_file:
+            test_file.write(os.urandom(size))
+    return payload
+
+
+def interrupted_hasher(after):
+    # a PiecesHasher that is stopped like by Ctrl-C after some pieces
+    hasher_iter = pieces.PiecesHasher.__iter__
+
+    def __iter__(self):
+        for num, piece_hash in enumerate(hasher_iter(self)):
+            if num == after:
+                raise KeyboardInterrupt
+            yield piece_hash
+    return mock.patch.object(pieces.PiecesHasher, '__iter__', __iter__)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = self.temp_dir + os.sep + 'checkpoint'
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_checkpoint_save_load(self):
+        progress = checkpoint.Checkpoint(self.path, b'f' * 32, 16384)
+        progress.save(2, bytearray(b'x' * 60), [b'r' * 32] * 3)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        test = checkpoint.Checkpoint(self.path, b'f' * 32, 16384).load()
+        self.assertEqual(test, (2, b'x' * 40, b'r' * 64))
+
+    def test_checkpoint_other_payload(self):
+        checkpoint.Checkpoint(self.path, b'f' * 32, 16384).save(
+            1, b'x' * 20)
+        self.assertIsNone(
+            checkpoint.Checkpoint(self.path, b'g' * 32, 16384).load())
+        self.assertIsNone(
+            checkpoint.Checkpoint(self.path, b'f' * 32, 32768).load())
+
+    def test_checkpoint_missing_or_garbage(self):
+        progress = checkpoint.Checkpoint(self.path, b'f' * 32, 16384)
+        self.assertIsNone(progress.load())
+        with open(self.path, 'wb') as checkpoint_file:
+            checkpoint_file.write(b'd5:piece')
+        self.assertIsNone(progress.load())
+        progress.remove()
+        progress.remove()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fingerprint(self):
+        stats = [('a', 1, 2, 3)]
+        test = checkpoint.fingerprint(stats, 16384, (1,))
+        self.assertEqual(test, checkpoint.fingerprint(stats, 16384, (1,)))
+        self.assertNotEqual(
+            test, checkpoint.fingerprint([('a', 1, 4, 3)], 16384, (1,)))
+        self.assertNotEqual(test, checkpoint.fingerprint(stats, 16384, (2,)))
+        self.assertNotEqual(
+            test, checkpoint.fingerprint(stats, 16384, (1,), padded=True))
+
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.payload = make_payload(self.temp_dir)
+        self.path = self.temp_dir + os.sep + 'checkpoint'
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def interrupt(self, versions, after=3):
+        with interrupted_hasher(after), \
+                mock.patch.object(checkpoint, 'CHECKPOINT_INTERVAL', 3600):
+            self.assertRaises(KeyboardInterrupt, metainfo.InfoDictionary,
+                              self.payload, workers=1,
+                              checkpoint_path=self.path, versions=versions)
+
+    def test_resume_after_interrupt(self):
+        expected = metainfo.InfoDictionary(self.payload, workers=1)
+        self.interrupt((1,))
+        self.assertTrue(os.path.exists(self.path))
+        test = metainfo.InfoDictionary(self.payload, workers=1,
+                                       checkpoint_path=self.path,
+                                       resume=True)
+        self.assertEqual(test.resumed_pieces, 3)
+        self.assertEqual(test.pieces, expected.pieces)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_resume_hybrid(self):
+        expected = metainfo.InfoDictionary(self.payload, workers=1,
+                                           versions=(1, 2))
+        self.interrupt((1, 2))
+        test = metainfo.InfoDictionary(self.payload, workers=1,
+                                       checkpoint_path=self.path,
+                                       resume=True, versions=(1, 2))
+        self.assertEqual(test.pieces, expected.pieces)
+        self.assertEqual(test.file_roots, expected.file_roots)
+        self.assertEqual(test.piece_layers, expected.piece_layers)
+
+    def test_resume_changed_payload(self):
+        self.interrupt((1,))
+        with open(self.payload + os.sep + 'a', 'r+b') as test_file:
+            test_file.write(b'changed')
+        os.utime(self.payload + os.sep + 'a', ns=(0, 0))
+        expected = metainfo.InfoDictionary(self.payload, workers=1)
+        test = metainfo.InfoDictionary(self.payload, workers=1,
+                                       checkpoint_path=self.path,
+                                       resume=True)
+        self.assertEqual(test.resumed_pieces, 0)
+        self.assertEqual(test.pieces, expected.pieces)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
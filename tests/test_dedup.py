@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+from unittest import mock
+import os
+import tempfile
+import unittest
+
+from mitorrent import dedup
+from mitorrent import metainfo
+from mitorrent import pieces
+
+BIG = 5 * 1024 * 1024
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as test_file:
+        test_file.write(data)
+
+
+class TestRemoveRanges(unittest.TestCase):
+
+    def test_remove_ranges(self):
+        self.assertEqual(dedup.remove_ranges([(0, 10)], []), [(0, 10)])
+        self.assertEqual(dedup.remove_ranges([(0, 10)], [(0, 10)]), [])
+        self.assertEqual(dedup.remove_ranges([(0, 10)], [(2, 4), (6, 8)]),
+                         [(0, 2), (4, 6), (8, 10)])
+        self.assertEqual(
+            dedup.remove_ranges([(0, 3), (5, 10)], [(2, 6), (9, 12)]),
+            [(0, 2), (6, 9)])
+
+
+class TestContentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.temp_dir, 'store')
+        self.content = os.urandom(BIG)
+        write_file(os.path.join(self.temp_dir, 'one', 'sub', 'base.img'),
+                   self.content)
+        write_file(os.path.join(self.temp_dir, 'one', 'x'),
+                   os.urandom(100000))
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def create(self, name, **kwargs):
+        # InfoDictionary made with the store, and the pieces it hashed
+        with mock.patch.object(pieces, 'PiecesHasher',
+                               wraps=pieces.PiecesHasher) as hasher:
+            info = metainfo.InfoDictionary(
+                os.path.join(self.temp_dir, name), workers=1,
+                dedup_dir=self.store_dir, **kwargs)
+        return info, hasher.call_args[1]['ranges']
+
+    def test_reused_in_other_payload(self):
+        for versions in ((1,), (2,), (1, 2)):
+            write_file(os.path.join(self.temp_dir, 'two', 'copy.img'),
+                       self.content)
+            write_file(os.path.join(self.temp_dir, 'two', 'y'), b'y' * 777)
+            self.create('one', versions=versions, pad=True)
+            test, ranges = self.create('two', versions=versions, pad=True)
+            expected = metainfo.InfoDictionary(
+                os.path.join(self.temp_dir, 'two'), workers=1,
+                versions=versions, pad=True)
+            rmtree(os.path.join(self.temp_dir, 'two'))
+            piece_total = BIG // test.piece_length
+            self.assertEqual(test.deduplicated_files, 1)
+            self.assertEqual(ranges, [(piece_total, piece_total + 1)])
+            self.assertEqual(test.get_bencoded(), expected.get_bencoded())
+            self.assertEqual(test.piece_layers, expected.piece_layers)
+
+    def test_sample_match_confirmed(self):
+        # same length and sampled blocks, one byte apart in between
+        changed = bytearray(self.content)
+        changed[100000] = changed[100000] ^ 1
+        write_file(os.path.join(self.temp_dir, 'two', 'base.img'), changed)
+        self.create('one', pad=True)
+        test, ranges = self.create('two', pad=True)
+        expected = metainfo.InfoDictionary(
+            os.path.join(self.temp_dir, 'two'), workers=1)
+        self.assertEqual(test.deduplicated_files, 0)
+        self.assertEqual(ranges, [(0, BIG // test.piece_length)])
+        self.assertEqual(test.pieces, expected.pieces)
+
+    def test_stored_without_reading(self):
+        # the store keys new files by what the hashing pass computed
+        write_file(os.path.join(self.temp_dir, 'two', 'base.img'),
+                   self.content)
+        for workers in (1, 2):
+            rmtree(self.store_dir, ignore_errors=True)
+            with mock.patch.object(dedup, 'content_digest',
+                                   wraps=dedup.content_digest) as digest:
+                metainfo.InfoDictionary(
+                    os.path.join(self.temp_dir, 'one'), workers=workers,
+                    dedup_dir=self.store_dir, pad=True)
+                digest.assert_not_called()
+                test = metainfo.InfoDictionary(
+                    os.path.join(self.temp_dir, 'two'), workers=workers,
+                    dedup_dir=self.store_dir, pad=True)
+            # the copy is read once, to confirm its sample matched
+            self.assertEqual(digest.call_count, 1)
+            self.assertEqual(test.deduplicated_files, 1)
+
+    def test_confirmed_once(self):
+        write_file(os.path.join(self.temp_dir, 'two', 'base.img'),
+                   self.content)
+        self.create('one', pad=True)
+        self.create('two', pad=True)
+        with mock.patch.object(dedup, 'content_digest') as content_digest:
+            test, ranges = self.create('two', pad=True)
+        content_digest.assert_not_called()
+        self.assertEqual(test.deduplicated_files, 1)
+        self.assertEqual(ranges, [])
+
+    def test_changed_file_not_reused(self):
+        self.create('one', pad=True)
+        path = os.path.join(self.temp_dir, 'one', 'sub', 'base.img')
+        with open(path, 'r+b') as test_file:
+            test_file.write(b'changed')
+        test, ranges = self.create('one', pad=True)
+        expected = metainfo.InfoDictionary(
+            os.path.join(self.temp_dir, 'one'), workers=1, pad=True)
+        self.assertEqual(test.deduplicated_files, 0)
+        self.assertEqual(test.pieces, expected.pieces)
+
+    def test_content_only_of_stored_files(self):
+        with mock.patch.object(pieces, 'PiecesHasher',
+                               wraps=pieces.PiecesHasher) as hasher:
+            test = metainfo.InfoDictionary(
+                os.path.join(self.temp_dir, 'one'), workers=1,
+                dedup_dir=self.store_dir, pad=True)
+        # x is too small to be stored, base.img sorts first
+        self.assertEqual(hasher.call_args[1]['content'],
+                         [(0, BIG // test.piece_length)])
+
+    def test_closed_on_error(self):
+        close = dedup.ContentStore.close
+        with mock.patch.object(dedup.ContentStore, 'close', autospec=True,
+                               side_effect=close) as closed:
+            with mock.patch.object(pieces, 'PiecesHasher',
+                                   side_effect=OSError('unreadable')):
+                with self.assertRaises(OSError):
+                    self.create('one', pad=True)
+        self.assertEqual(closed.call_count, 1)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
@@ -2,6 +2,7 @@
 
 from shutil import rmtree
 import os
+import pickle
 import sys
 import tempfile
 import unittest
@@ -119,6 +120,41 @@ class TestFileNameFromPath(unittest.TestCase):
         self.assertFalse(test)
 
 
+class TestFileTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = files.FileTable('/base')
+        sub_dir = self.table.add_dir(0, 'sub')
+        self.table.add_file(sub_dir, 'b', 10, 1, 2)
+        self.table.add_file(0, 'sub', 0)
+        self.table.add_file(sub_dir, 'a', 5)
+
+    def test_file_table_string_pool(self):
+        self.assertEqual(self.table.strings, ['sub', 'b', 'a'])
+        self.assertEqual(self.table.path(0), '/base/sub/b')
+        self.assertEqual(self.table.components(1), ['sub'])
+
+    def test_file_table_sorted(self):
+        test = self.table.sorted()
+        self.assertEqual(list(test),
+                         [('/base/sub', 0), ('/base/sub/a', 5),
+                          ('/base/sub/b', 10)])
+        self.assertEqual(list(test.offsets), [0, 0, 5, 15])
+        self.assertEqual(test.stat(2), (10, 1, 2))
+        self.assertIs(test.strings, self.table.strings)
+
+    def test_file_table_nonempty(self):
+        test = self.table.nonempty()
+        self.assertEqual(list(test), [('/base/sub/b', 10), ('/base/sub/a', 5)])
+        self.assertEqual(test.total_length(), 15)
+
+    def test_file_table_info_files(self):
+        self.assertEqual(list(self.table.info_files()),
+                         [{'length': 10, 'path': ['sub', 'b']},
+                          {'length': 0, 'path': ['sub']},
+                          {'length': 5, 'path': ['sub', 'a']}])
+
+
 class TestDirectoryScanner(unittest.TestCase):
 
     def test_directory_empty_payload(self):
@@ -277,5 +313,60 @@ class TestDirectoryScanner(unittest.TestCase):
              [{'length': 13, 'path': ['file']}],
              13))
 
+    def test_directory_file_table(self):
+        temp_dir = tempfile.mkdtemp()
+        os.mkdir(temp_dir + os.sep + 'Sub')
+        test_file = open(temp_dir + os.sep + 'Sub' + os.sep + 'file', 'w')
+        test_file.write('Hello Testers')
+        test_file.close()
+        test_file2 = open(temp_dir + os.sep + 'a', 'w')
+        test_file2.write('Hidden')
+        test_file2.close()
+        info = os.stat(temp_dir + os.sep + 'a')
+        test = files.DirectoryScanner(temp_dir).scan()
+        rmtree(temp_dir)
+        self.assertEqual(len(test), 2)
+        self.assertEqual(list(test),
+                         [(temp_dir + os.sep + 'a', 6),
+                          (temp_dir + os.sep + 'Sub' + os.sep + 'file', 13)])
+        self.assertEqual(test.components(1), ['Sub', 'file'])
+        self.assertEqual(test.stat(0), (6, info.st_mtime_ns, info.st_ino))
+        self.assertEqual(list(test.offsets), [0, 6, 19])
+        self.assertEqual(list(test[1:]), [(temp_dir + os.sep + 'Sub' +
+                                           os.sep + 'file', 13)])
+
+    def test_file_table_slice_pickled(self):
+        table = files.FileTable('base')
+        for dir_num in range(3):
+            parent = table.add_dir(0, 'd{0}'.format(dir_num))
+            sub_dir = table.add_dir(parent, 'sub')
+            table.add_file(sub_dir, 'f{0}'.format(dir_num), dir_num + 1)
+        test = table[1:]
+        self.assertIs(test.strings, table.strings)
+        self.assertEqual(list(test), list(table)[1:])
+        unpickled = pickle.loads(pickle.dumps(test))
+        # the names of the first file are left out
+        self.assertEqual(unpickled.strings, ['d1', 'sub', 'd2', 'f1', 'f2'])
+        self.assertEqual(list(unpickled), list(test))
+        self.assertEqual(list(unpickled.offsets), [0, 2, 5])
+        self.assertEqual(unpickled.stat(1), test.stat(1))
+
+    def test_directory_threads_same_order(self):
+        temp_dir = tempfile.mkdtemp()
+        for dir_num in range(6):
+            sub_dir = os.sep.join([temp_dir, 'd{0}'.format(dir_num), 'E'])
+            os.makedirs(sub_dir)
+            os.mkdir(temp_dir + os.sep + 'd{0}'.format(dir_num) + os.sep +
+                     '.hide')
+            for name in ('B', 'a', 'b', '.c'):
+                test_file = open(sub_dir + os.sep + name, 'w')
+                test_file.write(name * dir_num)
+                test_file.close()
+        serial = files.DirectoryScanner(temp_dir).get_files()
+        threaded = files.DirectoryScanner(temp_dir, threads=4).get_files()
+        rmtree(temp_dir)
+        self.assertEqual(len(serial[0]), 18)
+        self.assertEqual(serial, threaded)
+
 if __name__ == '__main__':
     unittest.main()
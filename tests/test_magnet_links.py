@@ -25,5 +25,16 @@ class TestMagnetLinks(unittest.TestCase):
             test,
             'magnet:?xt=urn:btih:h1s2&xl=123&dn=My%20Name%20%E2%80%93%20Test')
 
+    def test_magnet_link_v2(self):
+        test = mitorrent.magnet_uri(None, 123, 'name', btmh='ab')
+        self.assertEqual(test, 'magnet:?xt=urn:btmh:1220ab&xl=123&dn=name')
+
+    def test_magnet_link_hybrid(self):
+        test = mitorrent.magnet_uri('cd', 123, 'name', btmh='ab')
+        self.assertEqual(
+            test,
+            'magnet:?xt=urn:btih:cd&xt=urn:btmh:1220ab&xl=123&dn=name')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,11 +2,15 @@
 
 from multiprocessing import freeze_support
 from shutil import rmtree
+from unittest import mock
+import hashlib
+import io
 import os
 import tempfile
 import unittest
 
 from mitorrent import metainfo
+from mitorrent import pieces
 
 
 class TestMetaDictionary(unittest.TestCase):
@@ -15,6 +19,25 @@ class TestMetaDictionary(unittest.TestCase):
         test = metainfo.MetaDictionary().get_bencoded()
         self.assertFalse(test)
 
+    def test_meta_dictionary_empty_dump(self):
+        test = metainfo.MetaDictionary().dump(io.BytesIO())
+        self.assertFalse(test)
+
+    def test_meta_dictionary_dump(self):
+        temp_dir = tempfile.mkdtemp()
+        test_file = open(temp_dir + os.sep + 'file', 'w')
+        test_file.write('Hello Testers')
+        test_file.close()
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = metainfo.InfoDictionary(temp_dir)
+        meta_dict.add_announce('example.com:6881')
+        output = io.BytesIO()
+        test = meta_dict.dump(output)
+        expected = meta_dict.get_bencoded()
+        rmtree(temp_dir)
+        self.assertEqual(output.getvalue(), expected)
+        self.assertEqual(test, len(output.getvalue()))
+
 
 class TestMetaDictionaryAddAnnounces(unittest.TestCase):
 
@@ -147,7 +170,7 @@ class TestInfoDictionaryPayloads(unittest.TestCase):
         empty_test_file = open(temp_dir + os.sep + 'file', 'w')
         empty_test_file.write('')
         empty_test_file.close()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(metainfo.EmptyPayload):
             metainfo.InfoDictionary(temp_dir)
         rmtree(temp_dir)
 
@@ -197,7 +220,7 @@ class TestInfoDictionaryPayloads(unittest.TestCase):
         empty_test_file = open(temp_dir + os.sep + 'file', 'w')
         empty_test_file.write('')
         empty_test_file.close()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(metainfo.EmptyPayload):
             metainfo.InfoDictionary(empty_test_file.name)
         rmtree(temp_dir)
 
@@ -213,6 +236,47 @@ class TestInfoDictionaryPayloads(unittest.TestCase):
             b'd5:filesld6:lengthi13e4:pathl4:fileeee12:piece lengthi16384e6:pieces20:\xc5\x1e-\x8c\xd4\xb3\xabz\xbf\xaaA_\xad=O6\x94}\xdc\x13e')  # noqa
 
 
+class TestInfoDictionaryPieces(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = os.urandom(100000)
+        self.path = os.path.join(self.temp_dir, 'file')
+        with open(self.path, 'wb') as test_file:
+            test_file.write(self.data)
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_info_dictionary_pieces_buffer(self):
+        test = metainfo.InfoDictionary(self.path, workers=1)
+        expected = b''.join(
+            hashlib.sha1(self.data[pos:pos + 32768]).digest()
+            for pos in range(0, len(self.data), 32768))
+        self.assertEqual(len(test.pieces), 20 * 4)
+        self.assertEqual(test.pieces, expected)
+
+    def test_info_dictionary_missing_pieces(self):
+        hasher = pieces.PiecesHasher
+
+        def short_hasher(*args, **kwargs):
+            return list(hasher(*args, **kwargs))[:-1]
+        with mock.patch.object(pieces, 'PiecesHasher', short_hasher):
+            with self.assertRaises(metainfo.PayloadError):
+                metainfo.InfoDictionary(self.path, workers=1)
+
+    def test_info_dictionary_file_deleted(self):
+        # the reader process cannot open the first file it was given
+        hasher = pieces.PiecesHasher
+
+        def deleting_hasher(*args, **kwargs):
+            os.remove(self.path)
+            return hasher(*args, **kwargs)
+        with mock.patch.object(pieces, 'PiecesHasher', deleting_hasher):
+            with self.assertRaises(FileNotFoundError):
+                metainfo.InfoDictionary(self.temp_dir, workers=1)
+
+
 class TestInfoDictionaryPrivate(unittest.TestCase):
 
     def test_info_dictionary_private_false(self):
@@ -241,6 +305,135 @@ class TestInfoDictionaryPrivate(unittest.TestCase):
             test,
             b'd5:filesld6:lengthi13e4:pathl4:fileeee12:piece lengthi16384e6:pieces20:\xc5\x1e-\x8c\xd4\xb3\xabz\xbf\xaaA_\xad=O6\x94}\xdc\x137:privatei1ee')  # noqa
 
+
+class TestInfoDictionaryVersions(unittest.TestCase):
+
+    def test_info_dictionary_v2_single_file(self):
+        temp_dir = tempfile.mkdtemp()
+        test_file = open(temp_dir + os.sep + 'file', 'w')
+        test_file.write('Hello Testers')
+        test_file.close()
+        info_dict = metainfo.InfoDictionary(temp_dir + os.sep + 'file',
+                                            versions=(2,))
+        test = info_dict.get()
+        rmtree(temp_dir)
+        self.assertEqual(
+            test,
+            {'name': None, 'piece length': 16384, 'pieces': None,
+             'private': None, 'meta version': 2,
+             'file tree': {'file': {'': {
+                 'length': 13,
+                 'pieces root': hashlib.sha256(b'Hello Testers').digest()
+             }}}})
+        self.assertEqual(info_dict.piece_layers, {})
+
+    def test_info_dictionary_hybrid_directory(self):
+        temp_dir = tempfile.mkdtemp()
+        os.mkdir(temp_dir + os.sep + 'sub')
+        for name, size in (('a', 100), ('B', 70000), ('sub/c', 0),
+                           ('sub/d', 5)):
+            with open(temp_dir + os.sep + name, 'wb') as test_file:
+                test_file.write(b'x' * size)
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = metainfo.InfoDictionary(temp_dir, versions=(1, 2))
+        test = meta_dict.get()
+        rmtree(temp_dir)
+        info_dict = test['info']
+        self.assertEqual(info_dict['piece length'], 32768)
+        self.assertEqual(
+            info_dict['files'],
+            [{'length': 70000, 'path': ['B']},
+             {'attr': 'p', 'length': 28304, 'path': ['.pad', '28304']},
+             {'length': 100, 'path': ['a']},
+             {'attr': 'p', 'length': 32668, 'path': ['.pad', '32668']},
+             {'length': 0, 'path': ['sub', 'c']},
+             {'length': 5, 'path': ['sub', 'd']},
+             {'attr': 'p', 'length': 32763, 'path': ['.pad', '32763']}])
+        self.assertEqual(len(info_dict['pieces']), 20 * 5)
+        self.assertEqual(
+            info_dict['pieces'][60:80],
+            hashlib.sha1(b'x' * 100 + bytes(32668)).digest())
+        tree = info_dict['file tree']
+        self.assertEqual(tree['sub']['c'], {'': {'length': 0,
+                                                 'pieces root': None}})
+        self.assertEqual(tree['a']['']['pieces root'],
+                         hashlib.sha256(b'x' * 100).digest())
+        big_root = tree['B']['']['pieces root']
+        self.assertEqual(list(test['piece layers']), [big_root])
+        self.assertEqual(len(test['piece layers'][big_root]), 3 * 32)
+
+    def test_info_dictionary_padded_directory(self):
+        temp_dir = tempfile.mkdtemp()
+        for name, size in (('a', 100), ('B', 70000), ('c', 5)):
+            with open(temp_dir + os.sep + name, 'wb') as test_file:
+                test_file.write(name.encode('UTF-8') * size)
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = metainfo.InfoDictionary(temp_dir, pad=True)
+        test = meta_dict.get()
+        with open(temp_dir + os.sep + 'B', 'ab') as test_file:
+            test_file.write(b'B')
+        changed = metainfo.InfoDictionary(temp_dir, pad=True).pieces
+        rmtree(temp_dir)
+        info_dict = test['info']
+        self.assertEqual(info_dict['piece length'], 32768)
+        # v1 keeps the scan order
+        self.assertEqual(
+            info_dict['files'],
+            [{'length': 100, 'path': ['a']},
+             {'attr': 'p', 'length': 32668, 'path': ['.pad', '32668']},
+             {'length': 70000, 'path': ['B']},
+             {'attr': 'p', 'length': 28304, 'path': ['.pad', '28304']},
+             {'length': 5, 'path': ['c']},
+             {'attr': 'p', 'length': 32763, 'path': ['.pad', '32763']}])
+        self.assertNotIn('file tree', info_dict)
+        self.assertEqual(len(info_dict['pieces']), 20 * 5)
+        self.assertEqual(info_dict['pieces'][:20],
+                         hashlib.sha1(b'a' * 100 + bytes(32668)).digest())
+        self.assertEqual(info_dict['pieces'][80:],
+                         hashlib.sha1(b'c' * 5 + bytes(32763)).digest())
+        # growing a file leaves the pieces of the other files alone
+        self.assertEqual(changed[:20], info_dict['pieces'][:20])
+        self.assertEqual(changed[80:], info_dict['pieces'][80:])
+        self.assertNotEqual(changed[60:80], info_dict['pieces'][60:80])
+
+
+class TestInfoDictionaryEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(self.temp_dir + os.sep + 'file', 'wb') as test_file:
+            test_file.write(b'Hello Testers')
+        self.info = metainfo.InfoDictionary(self.temp_dir,
+                                            versions=(1, 2))
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_info_dictionary_encoded_once(self):
+        encoded = self.info.get_bencoded()
+        self.assertIs(self.info.get_bencoded(), encoded)
+        self.assertEqual(self.info.info_hash(),
+                         hashlib.sha1(encoded).digest())
+        self.assertEqual(self.info.info_hash_v2(),
+                         hashlib.sha256(encoded).digest())
+        self.info.private = True
+        self.assertIsNot(self.info.get_bencoded(), encoded)
+        self.assertNotEqual(self.info.info_hash(),
+                            hashlib.sha1(encoded).digest())
+
+    def test_meta_dictionary_splices_info(self):
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = self.info
+        expected = metainfo.bencode(meta_dict.get())
+        self.info.get_bencoded()
+        with mock.patch.object(metainfo.InfoDictionary, 'get') as get:
+            self.assertEqual(meta_dict.get_bencoded(), expected)
+            output = io.BytesIO()
+            meta_dict.dump(output)
+            get.assert_not_called()
+        self.assertEqual(output.getvalue(), expected)
+
+
 if __name__ == '__main__':
     freeze_support()
     unittest.main()
@@ -1,10 +1,34 @@
 # -*- coding: utf-8 -*-
 
+from multiprocessing import Pool
+from shutil import rmtree
+from unittest import mock
+import hashlib
+import io
+import os
+import tempfile
 import unittest
 
 from mitorrent import pieces
 
 
+def make_payload(sizes):
+    temp_dir = tempfile.mkdtemp()
+    files_list = []
+    for num, size in enumerate(sizes):
+        path = temp_dir + os.sep + 'file{0}'.format(num)
+        with open(path, 'wb') as test_file:
+            test_file.write(bytes((num + pos) % 251 for pos in range(size)))
+        files_list.append(path)
+    return temp_dir, files_list
+
+
+def expected_digests(files_list, piece_length):
+    data = b''.join(open(path, 'rb').read() for path in files_list)
+    return [hashlib.sha1(data[pos:pos + piece_length]).digest()
+            for pos in range(0, len(data), piece_length)]
+
+
 class TestPiecesHashing(unittest.TestCase):
 
     def test_hash_binary_piece(self):
@@ -14,6 +38,340 @@ class TestPiecesHashing(unittest.TestCase):
             b'\nMU\xa8\xd7x\xe5\x02/\xabp\x19w\xc5\xd8@\xbb\xc4\x86\xd0')
 
 
+class TestPiecesReader(unittest.TestCase):
+
+    def test_pieces_reader_spans_files(self):
+        temp_dir, files_list = make_payload([5, 0, 7, 3])
+        test = [bytes(piece) for piece in pieces.PiecesReader(files_list, 4)]
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        rmtree(temp_dir)
+        self.assertEqual(test, [data[pos:pos + 4] for pos in range(0, 15, 4)])
+
+    def test_pieces_reader_offset_length(self):
+        temp_dir, files_list = make_payload([5, 7, 3])
+        test = [bytes(piece) for piece in pieces.PiecesReader(
+            files_list, 4, offset=4, length=8)]
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        rmtree(temp_dir)
+        self.assertEqual(test, [data[4:8], data[8:12]])
+
+
+class TestPiecesReaderReadinto(unittest.TestCase):
+
+    def test_pieces_reader_readinto(self):
+        temp_dir, files_list = make_payload([3, 6])
+        reader = pieces.PiecesReader(files_list, 4)
+        buffer = bytearray(4)
+        test = []
+        bytes_read = reader.readinto(buffer)
+        while bytes_read:
+            test.append(bytes(buffer[:bytes_read]))
+            bytes_read = reader.readinto(buffer)
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        rmtree(temp_dir)
+        self.assertEqual(test, [data[0:4], data[4:8], data[8:9]])
+
+    def test_pieces_reader_short_file(self):
+        # a file shorter than scanned must not shift the next file's data
+        temp_dir, files_list = make_payload([3, 6])
+        files_list = [(files_list[0], 5), (files_list[1], 6)]
+        for reader in (pieces.PiecesReader, pieces.MappedPiecesReader):
+            with self.assertRaises(OSError):
+                list(reader(files_list, 4))
+        for workers in (1, 2):
+            with self.assertRaises(OSError):
+                list(pieces.PiecesHasher(files_list, 4, workers=workers))
+        rmtree(temp_dir)
+
+
+class TestPieces(unittest.TestCase):
+
+    def test_pieces_ring_depth(self):
+        temp_dir, files_list = make_payload([5000, 3000, 1])
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        for depth in (1, 2, 8):
+            binary_pieces = pieces.Pieces(files_list, 1024, depth=depth)
+            test = [bytes(piece) for piece in binary_pieces]
+            binary_pieces.close()
+            self.assertEqual(
+                test, [data[pos:pos + 1024] for pos in range(0, 8001, 1024)])
+        rmtree(temp_dir)
+
+    def test_pieces_close_early(self):
+        temp_dir, files_list = make_payload([5000])
+        binary_pieces = pieces.Pieces(files_list, 1024, depth=2)
+        test = bytes(next(binary_pieces))
+        binary_pieces.close()
+        rmtree(temp_dir)
+        self.assertEqual(len(test), 1024)
+        self.assertFalse(binary_pieces.subproc.is_alive())
+
+    def test_pieces_missing_first_file(self):
+        temp_dir = tempfile.mkdtemp()
+        missing = os.path.join(temp_dir, 'missing')
+        hasher = pieces.PiecesHasher([(missing, 100000)], 32768, workers=1)
+        with self.assertRaises(FileNotFoundError):
+            list(hasher)
+        rmtree(temp_dir)
+
+    def test_pieces_reader_killed(self):
+        temp_dir, files_list = make_payload([5000])
+        binary_pieces = pieces.Pieces(files_list, 1024, depth=1)
+        next(binary_pieces)
+        binary_pieces.subproc.kill()
+        binary_pieces.subproc.join()
+        # the only slot was handed out, nothing was read ahead
+        with self.assertRaises(OSError):
+            next(binary_pieces)
+        binary_pieces.close()
+        rmtree(temp_dir)
+
+
+class TestMappedPiecesReader(unittest.TestCase):
+
+    def test_mapped_pieces_reader_spans_files(self):
+        temp_dir, files_list = make_payload([5, 0, 8, 3])
+        test = [bytes(piece) for piece in pieces.MappedPiecesReader(
+            files_list, 4)]
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        rmtree(temp_dir)
+        self.assertEqual(test, [data[pos:pos + 4] for pos in range(0, 16, 4)])
+
+    def test_mapped_pieces_reader_views(self):
+        temp_dir, files_list = make_payload([8])
+        test = list(pieces.MappedPiecesReader(files_list, 4))
+        self.assertTrue(all(isinstance(piece, memoryview) for piece in test))
+        test = None
+        rmtree(temp_dir)
+
+    def test_mapped_pieces_reader_offset_length(self):
+        temp_dir, files_list = make_payload([5, 7, 3])
+        test = [bytes(piece) for piece in pieces.MappedPiecesReader(
+            files_list, 4, offset=4, length=8)]
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        rmtree(temp_dir)
+        self.assertEqual(test, [data[4:8], data[8:12]])
+
+
+class TestPieceRanges(unittest.TestCase):
+
+    def test_piece_ranges(self):
+        files_list = [('a', 5), ('b', 7), ('c', 3)]
+        test = list(pieces.piece_ranges(files_list, 4, 2))
+        self.assertEqual(
+            test,
+            [([('a', 5), ('b', 7)], 4, 0, 8, False, (1,)),
+             ([('b', 7), ('c', 3)], 4, 3, 7, False, (1,))])
+
+
+class TestPiecesHasher(unittest.TestCase):
+
+    def test_pieces_hasher_workers(self):
+        temp_dir, files_list = make_payload([40000, 1, 0, 70000, 16384])
+        expected = expected_digests(files_list, 16384)
+        for workers in (1, 2, 5):
+            for use_mmap in (False, True):
+                test = list(pieces.PiecesHasher(files_list, 16384,
+                                                workers=workers,
+                                                use_mmap=use_mmap))
+                self.assertEqual(test, expected)
+        rmtree(temp_dir)
+
+    def test_pieces_hasher_pool_window(self):
+        # ranges are queued on a shared pool only as results are taken
+        temp_dir, files_list = make_payload([100000])
+        submitted = []
+        with Pool(2) as pool:
+            apply_async = pool.apply_async
+
+            def counting_apply_async(*args):
+                submitted.append(args)
+                return apply_async(*args)
+            with mock.patch.object(pool, 'apply_async', counting_apply_async):
+                hasher = pieces.PiecesHasher(files_list, 1024, workers=2,
+                                             pool=pool)
+                results = hasher.hash_ranges()
+                next(results)
+                results.close()
+        rmtree(temp_dir)
+        self.assertEqual(len(submitted), 2 * pieces.RANGES_PER_WORKER + 1)
+
+    def test_pieces_hasher_content(self):
+        # content digests only of the pieces in the content ranges
+        temp_dir, files_list = make_payload([40000, 70000, 16384])
+        data = b''.join(open(path, 'rb').read() for path in files_list)
+        expected = {piece: pieces.hash_content_piece(
+                        data[piece * 4096:piece * 4096 + 4096])
+                    for piece in (3, 4, 5, 9, 20)}
+        for workers in (1, 2):
+            for use_mmap in (False, True):
+                hasher = pieces.PiecesHasher(
+                    files_list, 4096, workers=workers, use_mmap=use_mmap,
+                    ranges=[(2, 6), (9, 22)],
+                    content=[(3, 6), (9, 10), (20, 21), (25, 30)])
+                list(hasher)
+                self.assertEqual(hasher.contents, expected)
+        rmtree(temp_dir)
+
+
+class TrickleStream:
+    # a pipe-like stream that returns at most 1000 bytes per read
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size):
+        return self.stream.read(min(size, 1000))
+
+
+class TestStreamHasher(unittest.TestCase):
+
+    def test_read_full_short_reads(self):
+        buffer = bytearray(5000)
+        stream = TrickleStream(b'x' * 7000)
+        self.assertEqual(pieces.read_full(stream, memoryview(buffer)), 5000)
+        self.assertEqual(pieces.read_full(stream, memoryview(buffer)), 2000)
+        self.assertEqual(pieces.read_full(stream, memoryview(buffer)), 0)
+
+    def test_stream_hasher(self):
+        temp_dir, files_list = make_payload([110000])
+        data = open(files_list[0], 'rb').read()
+        for stream in (io.BytesIO(data), TrickleStream(data)):
+            tee = io.BytesIO()
+            hasher = pieces.StreamHasher(stream, 16384, tee=tee)
+            self.assertEqual(list(hasher),
+                             expected_digests(files_list, 16384))
+            self.assertEqual(hasher.length, 110000)
+            self.assertEqual(tee.getvalue(), data)
+        rmtree(temp_dir)
+
+    def test_stream_hasher_v2(self):
+        temp_dir, files_list = make_payload([110000, 10000])
+        for path in files_list:
+            with open(path, 'rb') as stream:
+                test = list(pieces.StreamHasher(stream, 32768,
+                                                versions=(1, 2)))
+            expected = list(pieces.PiecesHasher([path], 32768, workers=1,
+                                                versions=(1, 2)))
+            self.assertEqual(test, expected)
+        rmtree(temp_dir)
+
+    def test_stream_hasher_error(self):
+        class BrokenStream:
+            def read(self, size):
+                raise OSError('broken pipe')
+
+        with self.assertRaises(OSError):
+            list(pieces.StreamHasher(BrokenStream(), 16384))
+
+
+class TestMerkleTrees(unittest.TestCase):
+
+    def test_merkle_root_pairs(self):
+        test = pieces.merkle_root([b'a' * 32, b'b' * 32], 2)
+        self.assertEqual(test, hashlib.sha256(b'a' * 32 + b'b' * 32).digest())
+
+    def test_merkle_root_padding(self):
+        left = hashlib.sha256(b'a' * 32 + bytes(32)).digest()
+        right = hashlib.sha256(bytes(64)).digest()
+        test = pieces.merkle_root([b'a' * 32], 4)
+        self.assertEqual(test, hashlib.sha256(left + right).digest())
+
+    def test_hash_v2_piece_single_block(self):
+        test = pieces.hash_v2_piece(b'Hello World', 11, 11, 16384)
+        self.assertEqual(test, hashlib.sha256(b'Hello World').digest())
+
+    def test_hash_v2_piece_ignores_padding(self):
+        data = b'x' * 20000
+        test = pieces.hash_v2_piece(data + bytes(12768), 20000, 20000, 32768)
+        self.assertEqual(test, hashlib.sha256(
+            hashlib.sha256(data[:16384]).digest() +
+            hashlib.sha256(data[16384:]).digest()).digest())
+
+    def test_hash_v2_file_pads_with_zero_subtrees(self):
+        roots = [b'a' * 32, b'b' * 32, b'c' * 32]
+        pad = pieces.merkle_root([], 2)
+        test = pieces.hash_v2_file(roots, 32768)
+        self.assertEqual(test, pieces.merkle_root(roots + [pad], 4))
+
+    def test_pieces_hasher_versions(self):
+        temp_dir, files_list = make_payload([20000, 30000])
+        layout = [(files_list[0], 20000), (None, 12768),
+                  (files_list[1], 30000)]
+        for workers in (1, 2):
+            test = list(pieces.PiecesHasher(layout, 32768, workers=workers,
+                                            versions=(1, 2)))
+            self.assertEqual(len(test), 2)
+            self.assertEqual(test[0][0], hashlib.sha1(
+                open(files_list[0], 'rb').read() + bytes(12768)).digest())
+            self.assertEqual(test[1][1], pieces.hash_v2_piece(
+                open(files_list[1], 'rb').read(), 30000, 30000, 32768))
+            test = list(pieces.PiecesHasher(layout, 32768, workers=workers,
+                                            versions=(2,)))
+            self.assertEqual([digest for digest, root in test], [None, None])
+        rmtree(temp_dir)
+
+
+class TestOffsetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = pieces.OffsetIndex(
+            [('a', 10), ('empty', 0), ('b', 5), (None, 20)])
+
+    def test_offset_index_offsets(self):
+        self.assertEqual(list(self.index.offsets), [0, 10, 15, 35])
+        self.assertEqual(len(self.index), 3)
+
+    def test_offset_index_file_at(self):
+        self.assertEqual(
+            [self.index.file_at(offset) for offset in (0, 9, 10, 14, 15, 35)],
+            [0, 0, 1, 1, 2, 3])
+
+    def test_offset_index_piece_segments(self):
+        self.assertEqual(self.index.piece_segments(0, 8), [(0, 0, 8)])
+        self.assertEqual(self.index.piece_segments(1, 8),
+                         [(0, 8, 2), (1, 0, 5), (2, 0, 1)])
+        self.assertEqual(self.index.piece_segments(4, 8), [(2, 17, 3)])
+        self.assertEqual(self.index.piece_segments(5, 8), [])
+
+    def test_offset_index_files_slice(self):
+        self.assertEqual(self.index.files_slice(12, 10),
+                         ([('b', 5), (None, 20)], 2))
+
+    def test_offset_index_reader(self):
+        temp_dir, files_list = make_payload([70000, 10, 50000])
+        digests = expected_digests(files_list, 16384)
+        index = pieces.OffsetIndex(files_list)
+        for use_mmap in (False, True):
+            reader = index.reader(16384, 5, 7, use_mmap=use_mmap)
+            self.assertEqual(len(reader.files_list), 1)
+            self.assertEqual(
+                [pieces.hash_binary_piece(piece) for piece in reader],
+                digests[5:7])
+            reader = index.reader(16384, 4, 5, use_mmap=use_mmap)
+            self.assertEqual(len(reader.files_list), 3)
+            self.assertEqual(
+                [pieces.hash_binary_piece(piece) for piece in reader],
+                digests[4:5])
+            reader = index.reader(16384, 6, use_mmap=use_mmap)
+            self.assertEqual(
+                [pieces.hash_binary_piece(piece) for piece in reader],
+                digests[6:])
+            reader = None
+        rmtree(temp_dir)
+
+
+class TestPieceCount(unittest.TestCase):
+
+    def test_piece_count_exact(self):
+        self.assertEqual(pieces.piece_count(32768, 16384), 2)
+
+    def test_piece_count_partial(self):
+        self.assertEqual(pieces.piece_count(32769, 16384), 3)
+
+    def test_piece_count_large(self):
+        self.assertEqual(pieces.piece_count(2 ** 70 + 1, 2 ** 24), 2 ** 46 + 1)
+
+
 class TestRoundUpTwo(unittest.TestCase):
 
     def test_round_up_2_neative(self):
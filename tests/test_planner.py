@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+from unittest import mock
+import os
+import tempfile
+import unittest
+
+from mitorrent import metainfo
+from mitorrent import pieces
+from mitorrent import planner
+
+
+def make_tree(temp_dir, count):
+    for num in range(count):
+        directory = os.path.join(temp_dir, 'dir{0}'.format(num % 7), 'sub')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'file{0:05d}'.format(num)),
+                  'wb') as test_file:
+            test_file.write(os.urandom(1000 + num * 997))
+
+
+class TestEstimate(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        make_tree(self.temp_dir, 120)
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_estimate_metainfo_length(self):
+        for versions in ((1,), (2,), (1, 2)):
+            for piece_length in (16384, 262144):
+                meta_dict = metainfo.MetaDictionary()
+                with mock.patch.object(pieces, 'find_piece_size',
+                                       return_value=piece_length):
+                    meta_dict.info = metainfo.InfoDictionary(
+                        self.temp_dir, versions=versions)
+                file_table = meta_dict.info.file_table
+                shape = planner.PayloadShape(
+                    (file_table.components(num), length)
+                    for num, (fname, length) in enumerate(file_table))
+                estimate = planner.estimate_metainfo_length(
+                    shape, piece_length, versions)
+                actual = len(meta_dict.get_bencoded())
+                self.assertGreaterEqual(estimate, actual)
+                self.assertLess(estimate, actual * 1.05)
+
+
+class TestPiecePlan(unittest.TestCase):
+
+    def setUp(self):
+        # 10 files of 100 MiB
+        self.shape = planner.PayloadShape(
+            (['file{0}'.format(num)], 100 * 1024 * 1024)
+            for num in range(10))
+
+    def test_candidate_lengths(self):
+        self.assertEqual(planner.candidate_lengths(100000),
+                         [16384, 32768, 65536, 131072])
+        self.assertEqual(planner.candidate_lengths(10 ** 12, 65536),
+                         [16384, 32768, 65536])
+
+    def test_plan_smallest_fitting(self):
+        plan = planner.PiecePlan(self.shape, 64 * 1024)
+        self.assertTrue(plan.fits)
+        # 1000 MiB hold 2000 pieces of 512 KiB, 39 KiB of piece hashes
+        self.assertEqual(plan.piece_length, 512 * 1024)
+        self.assertIn('  512.00 KiB pieces: about 39.54 KiB, chosen',
+                      plan.explain())
+
+    def test_plan_nothing_fits(self):
+        plan = planner.PiecePlan(self.shape, 100, max_piece_length=65536)
+        self.assertFalse(plan.fits)
+        self.assertEqual(plan.piece_length, 65536)
+
+    def test_plan_throughput_floor(self):
+        throughputs = {piece_length: 100.0 for piece_length
+                       in planner.candidate_lengths(self.shape.total)}
+        throughputs[16384] = 10.0
+        throughputs[32768] = 50.0
+        throughputs[65536] = 95.0
+        plan = planner.PiecePlan(self.shape, 10 ** 9,
+                                 throughputs=throughputs)
+        self.assertEqual(plan.floor, 65536)
+        self.assertEqual(plan.piece_length, 65536)
+        self.assertIn('too small', plan.explain()[2])
+
+
+class TestProbe(unittest.TestCase):
+
+    def test_probe_throughput(self):
+        temp_dir = tempfile.mkdtemp()
+        make_tree(temp_dir, 40)
+        info = metainfo.InfoDictionary(temp_dir, workers=1,
+                                       target_size=10 ** 6, probe=True)
+        plan = info.piece_plan
+        self.assertEqual(sorted(plan.throughputs),
+                         planner.candidate_lengths(info.length))
+        self.assertTrue(all(plan.throughputs.values()))
+        self.assertEqual(info.piece_length, plan.piece_length)
+        rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
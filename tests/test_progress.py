@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from mitorrent import metainfo
+from mitorrent import pieces
+from mitorrent import progress
+
+
+class TestFormatDuration(unittest.TestCase):
+
+    def test_format_duration(self):
+        self.assertEqual(progress.format_duration(3725.5), '1:02:05')
+
+    def test_format_duration_unknown(self):
+        self.assertEqual(progress.format_duration(None), '-:--:--')
+
+
+class TestProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = pieces.HashStats()
+        self.stats.read_time = 2.0
+        self.stats.hash_time = 4.0
+        self.reports = []
+        self.json_file = io.StringIO()
+        self.stream = io.StringIO()
+        self.progress = progress.Progress(name='test',
+                                          stream=self.stream,
+                                          json_file=self.json_file,
+                                          callback=self.reports.append,
+                                          interval=3600)
+        self.progress.start(self.stats, 1024, 10, 10000)
+
+    def test_progress_interval(self):
+        self.progress.update(3)
+        self.assertEqual(self.reports, [])
+        self.progress.interval = 0
+        self.progress.update(4)
+        self.assertEqual(len(self.reports), 1)
+        self.assertEqual(self.reports[0]['pieces'], 4)
+        self.assertEqual(self.reports[0]['bytes'], 4096)
+        self.assertFalse(self.reports[0]['done'])
+
+    def test_progress_finish(self):
+        self.progress.update(10)
+        self.progress.finish()
+        report = self.reports[-1]
+        self.assertTrue(report['done'])
+        self.assertEqual(report['bytes'], 10000)
+        self.assertEqual(report['eta'], 0)
+        self.assertEqual(report['read bytes per second'], 5000)
+        self.assertEqual(report['hash bytes per second'], 2500)
+        self.assertEqual(report['queued pieces'], None)
+        self.assertEqual(json.loads(self.json_file.getvalue()), report)
+        line = self.stream.getvalue()
+        self.assertTrue(line.startswith('\r100.0% 9.77 KiB of 9.77 KiB'))
+        self.assertTrue(line.endswith('hash 4.0s)\x1b[K\n'))
+
+
+class TestHashingProgress(unittest.TestCase):
+
+    def test_info_dictionary_progress(self):
+        temp_dir = tempfile.mkdtemp()
+        with open(temp_dir + os.sep + 'file', 'wb') as test_file:
+            test_file.write(os.urandom(200000))
+        for workers, use_mmap in ((1, False), (1, True), (2, False)):
+            reports = []
+            metainfo.InfoDictionary(
+                temp_dir + os.sep + 'file', workers=workers,
+                use_mmap=use_mmap,
+                progress=progress.Progress(callback=reports.append))
+            report = reports[-1]
+            self.assertTrue(report['done'])
+            self.assertEqual(report['pieces'], 7)
+            self.assertEqual(report['total pieces'], 7)
+            self.assertEqual(report['bytes'], 200000)
+            self.assertGreater(report['hash seconds'], 0)
+            self.assertGreater(report['read seconds'], 0)
+            self.assertEqual(report['queued pieces'] is None,
+                             workers > 1 or use_mmap)
+        rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import freeze_support
+from shutil import rmtree
+from unittest import mock
+import io
+import os
+import re
+import tarfile
+import tempfile
+import threading
+import unittest
+import zipfile
+
+from mitorrent import bencode
+from mitorrent import files
+from mitorrent import metainfo
+from mitorrent import pieces
+from mitorrent import storage
+from mitorrent import verify
+
+
+def make_payload(temp_dir):
+    payload = os.path.join(temp_dir, 'payload')
+    os.makedirs(os.path.join(payload, 'sub'))
+    for name, data in (('big', os.urandom(5 * 1024 * 1024 + 1)),
+                       ('sub/a', os.urandom(70000)),
+                       ('sub/b name', b'hello'),
+                       ('.hidden', b'x')):
+        with open(os.path.join(payload, name), 'wb') as test_file:
+            test_file.write(data)
+    return payload
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    # keep-alive file server answering single range requests
+    protocol_version = 'HTTP/1.1'
+    ranges = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        self.server.requests.append((self.command, self.headers.get('Range'),
+                                     self.client_address[1]))
+        match = re.match(r'bytes=(\d+)-(\d+)$', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if not self.ranges or not match or os.path.isdir(path):
+            return super().send_head()
+        start, end = int(match.group(1)), int(match.group(2))
+        with open(path, 'rb') as payload_file:
+            size = os.fstat(payload_file.fileno()).st_size
+            payload_file.seek(start)
+            data = payload_file.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(
+            start, start + len(data) - 1, size))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+class NoRangeRequestHandler(RangeRequestHandler):
+    ranges = False
+
+
+class TestArchiveStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.payload = make_payload(self.temp_dir)
+        self.zip_path = os.path.join(self.temp_dir, 'payload.zip')
+        self.tar_path = os.path.join(self.temp_dir, 'payload.tar')
+        with zipfile.ZipFile(self.zip_path, 'w') as archive, \
+                tarfile.open(self.tar_path, 'w') as tar_archive:
+            for name in ('big', 'sub/a', 'sub/b name', '.hidden'):
+                path = os.path.join(self.payload, name)
+                # stored and compressed members
+                archive.write(path, 'payload/' + name,
+                              compress_type=zipfile.ZIP_DEFLATED
+                              if name == 'sub/a' else zipfile.ZIP_STORED)
+                tar_archive.add(path, 'payload/' + name)
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_archive_payload(self):
+        for versions in ((1,), (1, 2)):
+            expected = metainfo.InfoDictionary(self.payload, workers=1,
+                                               versions=versions,
+                                               on_skip=lambda *skip: None)
+            for scheme, path in (('zip', self.zip_path),
+                                 ('tar', self.tar_path)):
+                for workers in (1, 2):
+                    test = metainfo.InfoDictionary(
+                        '{0}:{1}!payload/'.format(scheme, path),
+                        workers=workers, versions=versions,
+                        on_skip=lambda *skip: None)
+                    self.assertEqual(test.get_bencoded(),
+                                     expected.get_bencoded())
+
+    def test_archive_paths(self):
+        root = files.check_basename_path('zip:' + self.zip_path)
+        self.assertEqual(root, 'zip:' + self.zip_path)
+        self.assertEqual(files.file_name_from_path(root), 'payload')
+        member = files.check_basename_path(
+            'tar:{0}!payload/sub/b name'.format(self.tar_path))
+        self.assertEqual(files.file_name_from_path(member), 'b name')
+        self.assertEqual(storage.stat_path(member).st_size, 5)
+        with storage.open_file(member, 1, 4) as member_file:
+            self.assertEqual(member_file.read(), b'ell')
+        self.assertFalse(files.check_basename_path(
+            'zip:{0}!payload/missing'.format(self.zip_path)))
+        self.assertFalse(files.check_basename_path(
+            'tar:' + os.path.join(self.temp_dir, 'missing.tar')))
+
+    def test_compressed_tar(self):
+        gz_path = os.path.join(self.temp_dir, 'payload.tar.gz')
+        with tarfile.open(gz_path, 'w:gz') as tar_archive:
+            tar_archive.add(self.payload, 'payload')
+        self.assertFalse(files.check_basename_path('tar:' + gz_path))
+
+    def test_archive_rebuilt(self):
+        member = 'tar:{0}!payload/sub/b name'.format(self.tar_path)
+        self.assertEqual(storage.stat_path(member).st_size, 5)
+        listed = storage.get_storage(member)
+        self.assertIs(storage.get_storage(member), listed)
+        longer = os.path.join(self.temp_dir, 'longer')
+        with open(longer, 'wb') as test_file:
+            test_file.write(b'hello again')
+        # same name, other offsets and length
+        with tarfile.open(self.tar_path, 'w') as tar_archive:
+            tar_archive.add(os.path.join(self.payload, 'sub', 'a'),
+                            'payload/sub/a')
+            tar_archive.add(longer, 'payload/sub/b name')
+        self.assertIsNot(storage.get_storage(member), listed)
+        self.assertEqual(storage.stat_path(member).st_size, 11)
+        with storage.open_file(member) as member_file:
+            self.assertEqual(member_file.read(11), b'hello again')
+
+    def test_storages_bounded(self):
+        paths = []
+        for num in range(storage.STORAGE_CACHE_SIZE + 2):
+            path = os.path.join(self.temp_dir, '{0}.tar'.format(num))
+            with tarfile.open(path, 'w') as tar_archive:
+                tar_archive.add(os.path.join(self.payload, 'sub', 'b name'),
+                                'b')
+            paths.append('tar:' + path)
+        first = storage.get_storage(paths[0])
+        for path in paths[1:]:
+            storage.get_storage(path)
+        self.assertLessEqual(len(storage._storages),
+                             storage.STORAGE_CACHE_SIZE)
+        # the least recently used went first
+        self.assertIsNot(storage.get_storage(paths[0]), first)
+
+
+class TestHTTPStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.payload = make_payload(self.temp_dir)
+        self.server = self.start_server(RangeRequestHandler)
+        self.base = 'http://127.0.0.1:{0}/'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.temp_dir)
+
+    def start_server(self, handler):
+        server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), partial(handler, directory=self.temp_dir))
+        server.daemon_threads = True
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_http_payload(self):
+        for versions in ((1,), (1, 2)):
+            expected = metainfo.InfoDictionary(self.payload, workers=1,
+                                               versions=versions,
+                                               on_skip=lambda *skip: None)
+            for workers in (1, 2):
+                test = metainfo.InfoDictionary(
+                    files.check_basename_path(self.base + 'payload'),
+                    workers=workers, versions=versions,
+                    on_skip=lambda *skip: None)
+                self.assertEqual(test.get_bencoded(),
+                                 expected.get_bencoded())
+
+    def test_http_single_file(self):
+        path = files.check_basename_path(self.base + 'payload/sub/b%20name')
+        self.assertEqual(path, self.base + 'payload/sub/b name')
+        self.assertEqual(files.file_name_from_path(path), 'b name')
+        test = metainfo.InfoDictionary(path, workers=1)
+        expected = metainfo.InfoDictionary(
+            os.path.join(self.payload, 'sub', 'b name'), workers=1)
+        self.assertEqual(test.get_bencoded(), expected.get_bencoded())
+
+    def test_parallel_ranges_pooled(self):
+        http_storage = storage.HTTPStorage('http', self.base[7:-1])
+        url = self.base + 'payload/big'
+        with open(os.path.join(self.payload, 'big'), 'rb') as payload_file:
+            expected = payload_file.read()
+        with http_storage.open(url) as remote_file:
+            test = remote_file.read()
+        self.assertEqual(test, expected)
+        ranges = [byte_range for command, byte_range, port
+                  in self.server.requests if byte_range]
+        # fetched in chunks of at most CHUNK_LENGTH
+        self.assertEqual(
+            sorted(ranges),
+            ['bytes=0-2097151', 'bytes=2097152-4194303',
+             'bytes=4194304-5242880'])
+        self.assertLessEqual(len(http_storage.idle),
+                             storage.PARALLEL_REQUESTS)
+        with http_storage.open(url, 1, 3) as remote_file:
+            self.assertEqual(remote_file.read(), expected[1:3])
+        # the second read reuses a kept connection
+        ports = [port for command, byte_range, port in self.server.requests]
+        self.assertIn(ports[-1], ports[:-1])
+
+    def test_verify_http_payload(self):
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = metainfo.InfoDictionary(self.payload, workers=1,
+                                                 on_skip=lambda *skip: None)
+        meta_dict.info.name = 'payload'
+        test = verify.verify_payload(
+            bencode.decode(meta_dict.get_bencoded()),
+            self.base + 'payload/', workers=2)
+        self.assertEqual(test, {'ok': True, 'bad_pieces': [],
+                                'bad_files': {}})
+
+    def test_http_file_deleted(self):
+        hasher = pieces.PiecesHasher
+
+        def deleting_hasher(*args, **kwargs):
+            os.remove(os.path.join(self.payload, 'big'))
+            return hasher(*args, **kwargs)
+        path = files.check_basename_path(self.base + 'payload')
+        with mock.patch.object(pieces, 'PiecesHasher', deleting_hasher):
+            with self.assertRaises(OSError):
+                metainfo.InfoDictionary(path, workers=1,
+                                        on_skip=lambda *skip: None)
+
+    def test_no_range_requests(self):
+        server = self.start_server(NoRangeRequestHandler)
+        try:
+            base = 'http://127.0.0.1:{0}/'.format(server.server_port)
+            small = metainfo.InfoDictionary(base + 'payload/sub/a',
+                                            workers=1)
+            self.assertEqual(small.length, 70000)
+            # the reader's error ends hashing instead of the pieces
+            with self.assertRaises(OSError):
+                metainfo.InfoDictionary(base + 'payload/big', workers=1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import freeze_support
+from shutil import rmtree
+import os
+import tempfile
+import unittest
+
+from mitorrent import bencode
+from mitorrent import metainfo
+from mitorrent import verify
+
+
+def make_torrent(temp_dir, pad=False, versions=(1,)):
+    os.mkdir(temp_dir + os.sep + 'sub')
+    with open(temp_dir + os.sep + 'file', 'wb') as test_file:
+        test_file.write(b'Hello Testers' * 3000)
+    with open(temp_dir + os.sep + 'sub' + os.sep + 'file2', 'wb') as test_file:
+        test_file.write(b'Goodbye' * 3000)
+    meta_dict = metainfo.MetaDictionary()
+    meta_dict.info = metainfo.InfoDictionary(temp_dir, pad=pad,
+                                             versions=versions)
+    return bencode.decode(meta_dict.get_bencoded())
+
+
+class TestVerifyPayload(unittest.TestCase):
+
+    def test_verify_payload_ok(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir)
+        test = verify.verify_payload(meta_dict, temp_dir, workers=2)
+        rmtree(temp_dir)
+        self.assertEqual(test, {'ok': True, 'bad_pieces': [],
+                                'bad_files': {}})
+
+    def test_verify_payload_padded(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir, pad=True)
+        test = verify.verify_payload(meta_dict, temp_dir, workers=2)
+        rmtree(temp_dir)
+        self.assertEqual(test, {'ok': True, 'bad_pieces': [],
+                                'bad_files': {}})
+
+    def test_verify_payload_single_file(self):
+        temp_dir = tempfile.mkdtemp()
+        with open(temp_dir + os.sep + 'file', 'wb') as test_file:
+            test_file.write(b'Hello Testers' * 3000)
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = metainfo.InfoDictionary(temp_dir + os.sep + 'file')
+        meta_dict = bencode.decode(meta_dict.get_bencoded())
+        test = verify.verify_payload(meta_dict, temp_dir + os.sep + 'file')
+        rmtree(temp_dir)
+        self.assertTrue(test['ok'])
+
+    def test_verify_payload_corrupt(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir)
+        with open(temp_dir + os.sep + 'file', 'r+b') as test_file:
+            test_file.seek(20000)
+            test_file.write(b'X')
+        test = verify.verify_payload(meta_dict, temp_dir, use_mmap=True)
+        rmtree(temp_dir)
+        self.assertEqual(test, {'ok': False, 'bad_pieces': [0],
+                                'bad_files': {
+                                    temp_dir + os.sep + 'file': 'corrupt'}})
+
+    def test_verify_payload_missing_file(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir)
+        missing = temp_dir + os.sep + 'sub' + os.sep + 'file2'
+        os.remove(missing)
+        test = verify.verify_payload(meta_dict, temp_dir)
+        rmtree(temp_dir)
+        self.assertFalse(test['ok'])
+        self.assertEqual(test['bad_files'][missing], 'missing')
+        self.assertEqual(test['bad_pieces'], [1])
+
+    def test_verify_payload_piece_numbers(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir)
+        with open(temp_dir + os.sep + 'file', 'r+b') as test_file:
+            test_file.seek(20000)
+            test_file.write(b'X')
+        test = verify.verify_payload(meta_dict, temp_dir, piece_numbers=[1])
+        self.assertTrue(test['ok'])
+        test = verify.verify_payload(meta_dict, temp_dir,
+                                     piece_numbers=[1, 0, 0])
+        rmtree(temp_dir)
+        self.assertEqual(test['bad_pieces'], [0])
+
+    def test_verify_payload_v2(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir, versions=(2,))
+        test = verify.verify_payload(meta_dict, temp_dir, workers=2)
+        self.assertEqual(test, {'ok': True, 'bad_pieces': [],
+                                'bad_files': {}})
+        self.assertEqual(verify.count_pieces(meta_dict), 3)
+        with open(temp_dir + os.sep + 'file', 'r+b') as test_file:
+            test_file.seek(35000)
+            test_file.write(b'X')
+        test = verify.verify_payload(meta_dict, temp_dir, workers=1)
+        rmtree(temp_dir)
+        self.assertEqual(test, {'ok': False, 'bad_pieces': [1],
+                                'bad_files': {
+                                    temp_dir + os.sep + 'file': 'corrupt'}})
+
+    def test_verify_payload_v2_single_file(self):
+        temp_dir = tempfile.mkdtemp()
+        path = temp_dir + os.sep + 'file'
+        with open(path, 'wb') as test_file:
+            test_file.write(b'Hello Testers' * 3000)
+        meta_dict = metainfo.MetaDictionary()
+        meta_dict.info = metainfo.InfoDictionary(path, versions=(2,))
+        meta_dict.info.name = 'file'
+        meta_dict = bencode.decode(meta_dict.get_bencoded())
+        test = verify.verify_payload(meta_dict, path)
+        rmtree(temp_dir)
+        self.assertTrue(test['ok'])
+
+    def test_piece_ranges(self):
+        self.assertEqual(verify.piece_ranges([5, 1, 2, 2, 7, 6], 8),
+                         [(1, 3), (5, 8)])
+        self.assertRaises(verify.InvalidMetainfo, verify.piece_ranges,
+                          [8], 8)
+
+    def test_check_payload_fail_fast(self):
+        temp_dir = tempfile.mkdtemp()
+        meta_dict = make_torrent(temp_dir)
+        with open(temp_dir + os.sep + 'file', 'wb') as test_file:
+            test_file.write(b'Changed' * 6000)
+        test = list(verify.check_payload(meta_dict, temp_dir,
+                                         fail_fast=True))
+        rmtree(temp_dir)
+        self.assertEqual(test, [{'file': temp_dir + os.sep + 'file',
+                                 'status': 'size mismatch'}])
+
+    def test_check_payload_unsafe_path(self):
+        meta_dict = {'info': {'piece length': 16384, 'pieces': b'',
+                              'files': [{'length': 1,
+                                         'path': [b'..', b'etc']}]}}
+        with self.assertRaises(verify.InvalidMetainfo):
+            list(verify.check_payload(meta_dict, tempfile.gettempdir()))
+
+    def test_check_payload_v2_piece_layers(self):
+        meta_dict = {'info': {'piece length': 16384, 'meta version': 2,
+                              'file tree': {'file': {'': {
+                                  'length': 20000,
+                                  'pieces root': bytes(32)}}}}}
+        with self.assertRaises(verify.InvalidMetainfo):
+            list(verify.check_payload(meta_dict, tempfile.gettempdir()))
+
+    def test_check_payload_piece_count(self):
+        meta_dict = {'info': {'piece length': 16384, 'pieces': b'',
+                              'length': 1}}
+        with self.assertRaises(verify.InvalidMetainfo):
+            list(verify.check_payload(meta_dict, tempfile.gettempdir()))
+
+
+if __name__ == '__main__':
+    freeze_support()
+    unittest.main()